@@ -1,10 +1,21 @@
+import sys
+import asyncio
+from pathlib import Path
 from logging.config import fileConfig
 
-from sqlalchemy import engine_from_config
 from sqlalchemy import pool
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import async_engine_from_config
 
 from alembic import context
 
+# пакет app лежит в src/
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from app.settings import appctx  # noqa: E402
+from app.db.base import BaseDBT  # noqa: E402
+import app.db.models  # noqa: E402,F401  - регистрация таблиц в BaseDBT.metadata
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -14,11 +25,12 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# URL - тот же, что у бота (.env), а не из alembic.ini
+config.set_main_option("sqlalchemy.url", appctx.DB_PREFIX + appctx.DB_CONNECTION_STRING)
+
 # add your model's MetaData object here
 # for 'autogenerate' support
-# from myapp import mymodel
-# target_metadata = mymodel.Base.metadata
-target_metadata = None
+target_metadata = BaseDBT.metadata
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -26,6 +38,17 @@ target_metadata = None
 # ... etc.
 
 
+def _configure(**kwargs) -> None:
+    url = config.get_main_option("sqlalchemy.url")
+    context.configure(
+        target_metadata=target_metadata,
+        # SQLite не умеет ALTER для ограничений - batch-режим пересоздаёт таблицу
+        render_as_batch=url.startswith("sqlite"),
+        compare_type=True,
+        **kwargs,
+    )
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -38,10 +61,8 @@ def run_migrations_offline() -> None:
     script output.
 
     """
-    url = config.get_main_option("sqlalchemy.url")
-    context.configure(
-        url=url,
-        target_metadata=target_metadata,
+    _configure(
+        url=config.get_main_option("sqlalchemy.url"),
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -50,26 +71,35 @@ def run_migrations_offline() -> None:
         context.run_migrations()
 
 
-def run_migrations_online() -> None:
-    """Run migrations in 'online' mode.
+def do_run_migrations(connection: Connection) -> None:
+    _configure(connection=connection)
 
-    In this scenario we need to create an Engine
-    and associate a connection with the context.
+    with context.begin_transaction():
+        context.run_migrations()
 
-    """
-    connectable = engine_from_config(
+
+async def run_async_migrations() -> None:
+    """Движок бота асинхронный (aiosqlite) - миграции через run_sync на async-подключении."""
+    connectable = async_engine_from_config(
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
     )
 
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
-        )
+    async with connectable.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+
+    await connectable.dispose()
+
 
-        with context.begin_transaction():
-            context.run_migrations()
+def run_migrations_online() -> None:
+    """Run migrations in 'online' mode.
+
+    In this scenario we need to create an Engine
+    and associate a connection with the context.
+
+    """
+    asyncio.run(run_async_migrations())
 
 
 if context.is_offline_mode():
@@ -0,0 +1,98 @@
+import time
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+
+from app.db.uow import UoWFactory
+
+
+ADMIN_STATUSES = ("creator", "administrator")
+
+FetchAdmins = Callable[[], Awaitable[Iterable[int]]]
+
+
+class AdminCache:
+    """
+    Администраторы групп по chat_id - вместо get_administrators() на каждое сообщение.
+
+    - в памяти: chat_id -> (время загрузки, id админов), свежие ttl секунд;
+    - промах - сначала Chats.admin_ids (переживает рестарт), и только если там устарело - Telegram;
+      свежий список сохраняется через ChatsRepository.set_admin_ids;
+    - single-flight: пачка сообщений из чата ждёт одну и ту же загрузку;
+    - chat_member апдейты правят список на месте, без запроса к Telegram.
+    """
+
+    def __init__(self, uow: UoWFactory, ttl: float = 600.0):
+        self.uow = uow
+        self.ttl = ttl
+        self._admins: Dict[int, Tuple[float, FrozenSet[int]]] = {}
+        self._inflight: Dict[int, asyncio.Task] = {}
+        self.stats = {"hits": 0, "db": 0, "fetched": 0, "failed": 0, "updates": 0}
+
+    def _fresh(self, chat_id: int) -> Optional[FrozenSet[int]]:
+        item = self._admins.get(chat_id)
+        if item is not None and time.time() - item[0] <= self.ttl:
+            return item[1]
+        return None
+
+    async def get_admins(self, chat_id: int, fetch: FetchAdmins) -> FrozenSet[int]:
+        admins = self._fresh(chat_id)
+        if admins is not None:
+            self.stats["hits"] += 1
+            return admins
+        task = self._inflight.get(chat_id)
+        if task is None:
+            task = asyncio.create_task(self._refresh(chat_id, fetch))
+            self._inflight[chat_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(chat_id, None))
+        # shield: отмена одного ожидающего не отменяет загрузку для остальных
+        return await asyncio.shield(task)
+
+    async def _load(self, chat_id: int) -> Optional[Tuple[float, FrozenSet[int]]]:
+        async with self.uow(read_only=True) as uow:
+            chat = await uow.chats.get_chat_ref(chat_id)
+        stored = chat.admin_ids if chat else None
+        if not stored or not stored.get("updated_at"):
+            return None
+        loaded_at = datetime.fromisoformat(stored["updated_at"]).timestamp()
+        return loaded_at, frozenset(stored.get("admins") or [])
+
+    async def _save(self, chat_id: int, loaded_at: float, admins: FrozenSet[int]) -> None:
+        async with self.uow() as uow:
+            await uow.chats.set_admin_ids(chat_id, sorted(admins), loaded_at=datetime.fromtimestamp(loaded_at))
+
+    async def _refresh(self, chat_id: int, fetch: FetchAdmins) -> FrozenSet[int]:
+        stored = await self._load(chat_id)
+        if stored is not None and time.time() - stored[0] <= self.ttl:
+            self.stats["db"] += 1
+            self._admins[chat_id] = stored
+            return stored[1]
+        try:
+            admins = frozenset(await fetch())
+        except Exception as e:
+            self.stats["failed"] += 1
+            print("get_administrators failed:", repr(e))
+            # Telegram недоступен - лучше устаревший список, чем никакого
+            stale = self._admins.get(chat_id) or stored
+            return stale[1] if stale else frozenset()
+        self.stats["fetched"] += 1
+        loaded_at = time.time()
+        self._admins[chat_id] = (loaded_at, admins)
+        await self._save(chat_id, loaded_at, admins)
+        return admins
+
+    async def update_member(self, chat_id: int, user_id: int, status: str) -> None:
+        """chat_member: пользователя назначили/сняли с админа. Неизвестный чат - ждёт первой загрузки."""
+        item = self._admins.get(chat_id)
+        if item is None:
+            return None
+        loaded_at, admins = item
+        if status in ADMIN_STATUSES:
+            updated = admins | {user_id}
+        else:
+            updated = admins - {user_id}
+        if updated == admins:
+            return None
+        self.stats["updates"] += 1
+        self._admins[chat_id] = (loaded_at, updated)
+        await self._save(chat_id, loaded_at, updated)
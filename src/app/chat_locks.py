@@ -0,0 +1,56 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+
+class ChatLocks:
+    """
+    Последовательное выполнение команд одного чата.
+
+    - lock(chat_id): команды чата (/start, /send_now, /code_completed, закрытие опроса)
+      идут по одной, разные чаты не ждут друг друга;
+    - run(chat_id, key, factory): одинаковая команда, пришедшая пока первая ещё выполняется
+      (два админа нажали /send_now), не запускается второй раз - ждёт тот же результат;
+    - запись о чате живёт, пока есть владелец или ожидающие, простаивающие чаты память не держат.
+    """
+
+    def __init__(self):
+        # chat_id -> (lock, сколько корутин держат или ждут)
+        self._locks: Dict[int, Tuple[asyncio.Lock, int]] = {}
+        self._inflight: Dict[Tuple[int, Hashable], asyncio.Task] = {}
+        self.stats = {"runs": 0, "coalesced": 0}
+
+    @asynccontextmanager
+    async def lock(self, chat_id: int):
+        lock, users = self._locks.get(chat_id, (None, 0))
+        if lock is None:
+            lock = asyncio.Lock()
+        self._locks[chat_id] = (lock, users + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[chat_id]
+            if users <= 1:
+                del self._locks[chat_id]
+            else:
+                self._locks[chat_id] = (lock, users - 1)
+
+    async def _locked(self, chat_id: int, factory: Callable[[], Awaitable[Any]]) -> Any:
+        async with self.lock(chat_id):
+            return await factory()
+
+    async def run(self, chat_id: int, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get((chat_id, key))
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["runs"] += 1
+            task = asyncio.create_task(self._locked(chat_id, factory))
+            self._inflight[(chat_id, key)] = task
+            task.add_done_callback(lambda _: self._inflight.pop((chat_id, key), None))
+        # shield: отмена одного из ожидающих не отменяет команду для остальных
+        return await asyncio.shield(task)
+
+    def __len__(self) -> int:
+        return len(self._locks)
@@ -1,20 +1,44 @@
+from collections import OrderedDict
 from typing import Dict, Any, List, Optional
 from aiogram import Bot, types
 from app.db.uow import UoWFactory
 from app.utils import to_markdown
+from app.vote_queue import VoteQueue
 
 
 class DataManager:
-    def __init__(self, uow: UoWFactory):
+    def __init__(self, uow: UoWFactory, code_cache_size: int = 1024,
+                 vote_flush_interval: float = 0.5, vote_flush_batch: int = 500):
         # Внутреннее хранилище активных опросов:
         # poll_id → metadata
         self._polls: Dict[str, Dict[str, Any]] = {}
         self._chats = {}
         self.uow = uow
-
-    async def clear_chat_history(self, chat_id: int) -> None:
+        # буфер кода в памяти процесса: (chat_id, history_version) -> строки по порядку.
+        # грузится из БД один раз, дальше только дописывается; /start его сбрасывает
+        self._code: OrderedDict[tuple[int, int], List[str]] = OrderedDict()
+        self._history_versions: Dict[int, int] = {}
+        self.code_cache_size = code_cache_size
+        # голоса пишутся в БД пачками в фоне, не по UoW на каждый poll_answer
+        self.votes = VoteQueue(uow, flush_interval=vote_flush_interval, flush_batch=vote_flush_batch)
+
+    def _remember_code(self, chat_id: int, history_version: int, lines: List[str]) -> None:
+        self._history_versions[chat_id] = history_version
+        self._code[(chat_id, history_version)] = lines
+        self._code.move_to_end((chat_id, history_version))
+        while len(self._code) > self.code_cache_size:
+            (old_chat_id, _), _ = self._code.popitem(last=False)
+            self._history_versions.pop(old_chat_id, None)
+
+    def _forget_code(self, chat_id: int) -> None:
+        for key in [k for k in self._code if k[0] == chat_id]:
+            del self._code[key]
+        self._history_versions.pop(chat_id, None)
+
+    async def clear_chat_history(self, chat_id: int) -> int:
         """
         Clear chat Hist
+        Возвращает новую history_version чата.
         """
         assert isinstance(chat_id, int) #TODO rcheck
         async with self.uow() as uow:
@@ -24,10 +48,13 @@ class DataManager:
                 # ставим статус опроса если он активен в rejected чтобы далее с ним не работать
                 await uow.polls.reject_poll_if_active_by_poll_id(chat_dbt.last_poll_id)
             # по чатайди получим чат
-            await uow.chats.reset_history(chat_id)
+            chat_dbt = await uow.chats.reset_history(chat_id)
             # фиксация изменений
             await uow.commit()
-        return None
+        # новая версия истории пуста - буфер сразу валиден, без запроса в БД
+        self._forget_code(chat_id)
+        self._remember_code(chat_id, chat_dbt.history_version, [])
+        return chat_dbt.history_version
 
     async def register_poll(
         self,
@@ -42,17 +69,36 @@ class DataManager:
         """
         async with self.uow() as uow:
             chat_dbt = await uow.chats.get_chat(chat_id=chat_id)
-            await uow.polls.create_poll(chat=chat_dbt, options=options, tg_poll_id=tg_poll_id, tg_message_id=message_id, timeout_at=timeout_at)
+            poll = await uow.polls.create_poll(chat=chat_dbt, options=options, tg_poll_id=tg_poll_id, tg_message_id=message_id, timeout_at=timeout_at)
+        self.votes.track(tg_poll_id, poll.id, chat_id)
         return None
 
-    async def get_current_code(self, chat_id: int, markdown: bool = True):
-        lines = None
-        async with self.uow() as uow:
-            chat = await uow.chats.get_chat(chat_id)
+    async def get_history_version(self, chat_id: int) -> Optional[int]:
+        if chat_id in self._history_versions:
+            return self._history_versions[chat_id]
+        async with self.uow(read_only=True) as uow:
+            chat = await uow.chats.get_chat_ref(chat_id)
+        return chat.history_version if chat else None
+
+    async def get_code_lines(self, chat_id: int) -> Optional[List[str]]:
+        """Текущий код чата списком строк: из буфера, при промахе - один запрос в БД. None - чата нет."""
+        history_version = self._history_versions.get(chat_id)
+        lines = self._code.get((chat_id, history_version))
+        if lines is not None:
+            self._code.move_to_end((chat_id, history_version))
+            return lines
+        async with self.uow(read_only=True) as uow:
+            chat = await uow.chats.get_chat_ref(chat_id)
             if not chat:
-                return False, "В этом чате нет истории кода."
-
+                return None
             lines = await uow.code.get_current_code(chat)
+        self._remember_code(chat_id, chat.history_version, lines)
+        return lines
+
+    async def get_current_code(self, chat_id: int, markdown: bool = True):
+        lines = await self.get_code_lines(chat_id)
+        if lines is None:
+            return False, "В этом чате нет истории кода."
 
         if not lines:
             return False, "Код пока не создан — ещё не завершено ни одного опроса ⏳"
@@ -65,18 +111,20 @@ class DataManager:
     async def close_poll(self, tg_poll_id: str):
         poll = None
         if tg_poll_id:
+            # голоса из очереди - в БД, пока опрос активен: после closed flush их отбросит
+            await self.votes.flush()
             async with self.uow() as uow:
-                poll = await uow.polls.get_poll_by_tg_id(tg_poll_id)
+                poll = await uow.polls.lock_poll_by_tg_id(tg_poll_id)
                 # фиксируем статус закрытия
                 await uow.polls.close_poll(poll)
         return poll
 
     async def get_last_poll_tg_id_by_chat_id(self, chat_id: int):
         res = None
-        async with self.uow() as uow:
-            chat = await uow.chats.get_chat(chat_id)
+        async with self.uow(read_only=True) as uow:
+            chat = await uow.chats.get_chat_ref(chat_id)
             if chat and chat.last_poll_id:
-                poll = await uow.polls.get_poll_by_id(chat.last_poll_id)
+                poll = await uow.polls.get_poll_ref(poll_id=chat.last_poll_id)
                 if poll and poll.tg_poll_id:
                     res = poll.tg_poll_id
         return res
@@ -100,40 +148,41 @@ class DataManager:
         return is_ok, msg
     
     async def get_poll_by_tg_poll_id(self, tg_poll_id: str):
-        async with self.uow() as uow:
-            poll = await uow.polls.get_poll_by_tg_id(tg_poll_id)
+        async with self.uow(read_only=True) as uow:
+            poll = await uow.polls.get_poll_ref(tg_poll_id=tg_poll_id)
 
         return poll
     
     async def finishing_poll_process(self, tg_poll_id: str):
-        winner = None
+        # всё, что накопила очередь голосов, - в БД до подсчёта
+        await self.votes.flush()
         async with self.uow() as uow:
-            poll = await uow.polls.get_poll_by_tg_id(tg_poll_id)
-
-            if not poll:
-                return None
-
-            # фиксируем статус закрытия
-            await uow.polls.close_poll(poll)
-            
-            # считаем голоса
-            await uow.polls.recalc_votes_for_poll(poll.id)
-
-            # выбираем победивший вариант
-            winner = await uow.polls.get_winner(poll.id)
-
-            # добавляем строку в код
-            chat = await uow.chats.get_chat(poll.chat_id)
-            await uow.code.append_code_line_from_poll(
-                chat=chat,
-                poll=poll,
-                winning_option_index=winner.index,
-            )
-            
+            # закрытие, подсчёт по poll_votes, победитель и строка кода - одной серией
+            # UPDATE/INSERT ... RETURNING; None и когда опрос уже подводит другой процесс бота
+            finalized = await uow.polls.finalize_poll(tg_poll_id)
             await uow.commit()
+        self.votes.forget(tg_poll_id)
+        if finalized is None:
+            return None
+        poll, winner, code_line = finalized
+
+        # буфер обновляем только после успешного коммита и только если строка легла ровно в конец
+        key = (poll.chat_id, poll.history_version)
+        lines = self._code.get(key)
+        if code_line is not None and lines is not None:
+            if code_line.line_number == len(lines) + 1:
+                lines.append(code_line.code_line)
+            else:
+                self._code.pop(key, None)
         return winner
     
     async def register_poll_answer(self, tg_poll_id: str, user_id, option_index):
-        async with self.uow() as uow:
-            poll = await uow.polls.get_poll_by_tg_id(tg_poll_id)
-            await uow.polls.add_or_update_vote(poll.id, user_id, option_index)
\ No newline at end of file
+        """
+        Принимаем голос (option_index=None - голос отозван) в очередь, запись в БД - пачкой.
+        Возвращаем chat_id опроса (или None, если опрос не наш).
+        """
+        return await self.votes.submit(tg_poll_id, user_id, option_index)
+
+    async def close(self):
+        """Дописать в БД голоса, оставшиеся в очереди."""
+        await self.votes.close()
@@ -1,10 +1,46 @@
-from sqlalchemy.ext.asyncio import create_async_engine
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase, declared_attr
 
 
-def get_async_engine(url):
-    return create_async_engine(url=url, pool_pre_ping=True, pool_size=10)
+def _set_sqlite_pragmas(engine: AsyncEngine, pragmas: dict, read_only: bool) -> None:
+    """PRAGMA на каждое новое подключение пула (журнал WAL хранится в файле, остальные - per connection)."""
+    @event.listens_for(engine.sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        if read_only:
+            # случайная запись через читающий пул - ошибка, а не борьба за блокировку
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def get_async_engine(url, pool_size: int = 10, max_overflow: int = 10,
+                     sqlite_pragmas: Optional[dict] = None, read_only: bool = False):
+    engine = create_async_engine(url=url, pool_pre_ping=True, pool_size=pool_size, max_overflow=max_overflow)
+    if sqlite_pragmas and url.startswith("sqlite"):
+        _set_sqlite_pragmas(engine, sqlite_pragmas, read_only)
+    return engine
+
+
+def get_async_engines(url, sqlite_pragmas: Optional[dict] = None, read_pool_size: int = 8,
+                      pool_size: int = 10) -> tuple[AsyncEngine, Optional[AsyncEngine]]:
+    """
+    Движки (запись, чтение).
+    SQLite: все записи - через одно подключение писателя (ожидание в очереди пула вместо
+    "database is locked"), чтения - отдельным пулом, в WAL они не ждут писателя.
+    PostgreSQL (asyncpg) и прочие: один общий пул на pool_size, читающего движка нет (None).
+    """
+    if not url.startswith("sqlite"):
+        return get_async_engine(url=url, pool_size=pool_size), None
+    writer = get_async_engine(url=url, pool_size=1, max_overflow=0, sqlite_pragmas=sqlite_pragmas)
+    reader = get_async_engine(url=url, pool_size=read_pool_size, max_overflow=0,
+                              sqlite_pragmas=sqlite_pragmas, read_only=True)
+    return writer, reader
 
 
 class BaseDBT(AsyncAttrs, DeclarativeBase):
@@ -0,0 +1,161 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+
+@dataclass(frozen=True)
+class ChatRef:
+    """Снимок строки chats для чтения вне сессии (ORM-объект между UoW не передаём)."""
+    id: int
+    history_version: int
+    last_poll_id: Optional[int]
+    next_line_number: int
+    admin_ids: Optional[dict]
+
+
+@dataclass(frozen=True)
+class PollRef:
+    """Снимок строки polls: чат, версия истории и статус опроса."""
+    id: int
+    chat_id: int
+    tg_poll_id: str
+    tg_message_id: Optional[int]
+    history_version: int
+    status: str
+
+
+class IdentityCache:
+    """
+    Кэш чатов и опросов уровня процесса, общий для всех UnitOfWork.
+
+    - read-through: репозиторий смотрит в кэш, при промахе читает БД и кладёт снимок;
+    - запись через репозиторий сбрасывает ключ сразу и ещё раз после коммита/отката UoW
+      (см. CacheScope) - чтение, начатое до коммита, не вернёт в кэш старую строку;
+    - ttl - страховка на случай записей другим процессом бота в ту же БД.
+    """
+
+    def __init__(self, max_size: int = 10_000, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._chats: OrderedDict[int, tuple[float, ChatRef]] = OrderedDict()
+        self._polls: OrderedDict[int, tuple[float, PollRef]] = OrderedDict()
+        self._poll_ids: dict[str, int] = {}
+        # растёт на каждом сбросе: снимок, прочитанный до сброса, в кэш не кладём
+        self.generation = 0
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _get(self, store: OrderedDict, key) -> Any:
+        item = store.get(key)
+        if item is None or time.monotonic() - item[0] > self.ttl:
+            self.stats["misses"] += 1
+            return None
+        store.move_to_end(key)
+        self.stats["hits"] += 1
+        return item[1]
+
+    def _put(self, store: OrderedDict, key, value, generation: int) -> bool:
+        if generation != self.generation:
+            return False
+        store[key] = (time.monotonic(), value)
+        store.move_to_end(key)
+        while len(store) > self.max_size:
+            _, (_, old) = store.popitem(last=False)
+            if isinstance(old, PollRef):
+                self._poll_ids.pop(old.tg_poll_id, None)
+        return True
+
+    # ----- чаты -----
+
+    def get_chat(self, chat_id: int) -> Optional[ChatRef]:
+        return self._get(self._chats, chat_id)
+
+    def put_chat(self, chat: ChatRef, generation: int) -> None:
+        self._put(self._chats, chat.id, chat, generation)
+
+    def invalidate_chat(self, chat_id: int) -> None:
+        self.generation += 1
+        self.stats["invalidations"] += 1
+        self._chats.pop(chat_id, None)
+
+    # ----- опросы -----
+
+    def get_poll(self, poll_id: int) -> Optional[PollRef]:
+        return self._get(self._polls, poll_id)
+
+    def get_poll_by_tg_id(self, tg_poll_id: str) -> Optional[PollRef]:
+        poll_id = self._poll_ids.get(tg_poll_id)
+        if poll_id is None:
+            self.stats["misses"] += 1
+            return None
+        return self.get_poll(poll_id)
+
+    def put_poll(self, poll: PollRef, generation: int) -> None:
+        if self._put(self._polls, poll.id, poll, generation):
+            self._poll_ids[poll.tg_poll_id] = poll.id
+
+    def invalidate_poll(self, poll_id: Optional[int] = None, tg_poll_id: Optional[str] = None) -> None:
+        self.generation += 1
+        self.stats["invalidations"] += 1
+        if poll_id is None and tg_poll_id is not None:
+            poll_id = self._poll_ids.get(tg_poll_id)
+        if poll_id is not None:
+            item = self._polls.pop(poll_id, None)
+            if item is not None:
+                self._poll_ids.pop(item[1].tg_poll_id, None)
+
+    def scope(self) -> "CacheScope":
+        return CacheScope(self)
+
+
+class CacheScope:
+    """
+    Кэш глазами одной UnitOfWork: запомненные сбросы повторяются после коммита/отката,
+    снимки ключей, изменённых в этой транзакции, в кэш не попадают до её конца.
+    """
+
+    def __init__(self, cache: IdentityCache):
+        self.cache = cache
+        self._chats: set[int] = set()
+        self._polls: set[tuple[Optional[int], Optional[str]]] = set()
+
+    @property
+    def generation(self) -> int:
+        return self.cache.generation
+
+    def get_chat(self, chat_id: int) -> Optional[ChatRef]:
+        return None if chat_id in self._chats else self.cache.get_chat(chat_id)
+
+    def put_chat(self, chat: ChatRef, generation: int) -> None:
+        if chat.id not in self._chats:
+            self.cache.put_chat(chat, generation)
+
+    def invalidate_chat(self, chat_id: int) -> None:
+        self._chats.add(chat_id)
+        self.cache.invalidate_chat(chat_id)
+
+    def get_poll(self, poll_id: int) -> Optional[PollRef]:
+        if self._polls:
+            return None
+        return self.cache.get_poll(poll_id)
+
+    def get_poll_by_tg_id(self, tg_poll_id: str) -> Optional[PollRef]:
+        if self._polls:
+            return None
+        return self.cache.get_poll_by_tg_id(tg_poll_id)
+
+    def put_poll(self, poll: PollRef, generation: int) -> None:
+        if not self._polls:
+            self.cache.put_poll(poll, generation)
+
+    def invalidate_poll(self, poll_id: Optional[int] = None, tg_poll_id: Optional[str] = None) -> None:
+        self._polls.add((poll_id, tg_poll_id))
+        self.cache.invalidate_poll(poll_id=poll_id, tg_poll_id=tg_poll_id)
+
+    def close(self) -> None:
+        for chat_id in self._chats:
+            self.cache.invalidate_chat(chat_id)
+        for poll_id, tg_poll_id in self._polls:
+            self.cache.invalidate_poll(poll_id=poll_id, tg_poll_id=tg_poll_id)
+        self._chats.clear()
+        self._polls.clear()
@@ -0,0 +1,222 @@
+import zlib
+from collections import defaultdict
+from typing import Any, AsyncIterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+
+from app.db.uow import UoWFactory
+from app.db.models import GraphCheckpoints, GraphBlobs, GraphWrites
+
+
+COMPRESSED_SUFFIX = "+zlib"
+
+
+class SQLAlchemyCheckpointSaver(BaseCheckpointSaver):
+    """
+    Чекпоинтер LangGraph поверх БД бота (тот же async engine, таблицы в BaseDBT.metadata).
+
+    - чекпоинт хранится без значений каналов; значение канала пишется в GraphBlobs
+      только когда его версия изменилась (дельта шага), неизменные каналы не дублируются;
+    - сериализация - msgpack из serde LangGraph, большие значения дополнительно сжимаются zlib;
+    - history_version из configurable запоминается в чекпоинте: после /start чекпоинты
+      старых версий треда удаляются, в текущей хранится не больше keep_last последних.
+
+    Реализованы только async-методы - граф вызывается через ainvoke.
+    """
+
+    def __init__(self, uow: UoWFactory, keep_last: int = 10, compress_min_size: int = 512,
+                 prune_every: int = 20):
+        super().__init__()
+        self.uow = uow
+        self.keep_last = keep_last
+        self.compress_min_size = compress_min_size
+        self.prune_every = prune_every
+        # thread_id -> (history_version, записей с последней чистки)
+        self._prune_state: dict[str, tuple[Optional[int], int]] = {}
+
+    # ----- сериализация -----
+
+    def _dumps(self, value: Any) -> tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(value)
+        if len(data) >= self.compress_min_size:
+            return type_ + COMPRESSED_SUFFIX, zlib.compress(data)
+        return type_, data
+
+    def _loads(self, type_: str, data: Optional[bytes]) -> Any:
+        if type_.endswith(COMPRESSED_SUFFIX):
+            type_, data = type_[:-len(COMPRESSED_SUFFIX)], zlib.decompress(data)
+        return self.serde.loads_typed((type_, data or b""))
+
+    # ----- чтение -----
+
+    @staticmethod
+    def _config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+        return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+    async def _to_tuple(self, uow, row: GraphCheckpoints, metadata: Optional[CheckpointMetadata] = None) -> CheckpointTuple:
+        checkpoint = self._loads(row.type, row.checkpoint)
+        versions = {channel: str(version) for channel, version in checkpoint["channel_versions"].items()}
+        blobs = await uow.checkpoints.get_blobs(row.thread_id, row.checkpoint_ns, versions)
+        channel_values = {b.channel: self._loads(b.type, b.blob) for b in blobs if b.type != "empty"}
+        writes = await uow.checkpoints.get_writes(row.thread_id, row.checkpoint_ns, row.checkpoint_id)
+        return CheckpointTuple(
+            config=self._config(row.thread_id, row.checkpoint_ns, row.checkpoint_id),
+            checkpoint={**checkpoint, "channel_values": channel_values},
+            metadata=metadata if metadata is not None else self._loads(row.meta_type, row.meta),
+            parent_config=(
+                self._config(row.thread_id, row.checkpoint_ns, row.parent_checkpoint_id)
+                if row.parent_checkpoint_id else None
+            ),
+            pending_writes=[(w.task_id, w.channel, self._loads(w.type, w.blob)) for w in writes],
+        )
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        async with self.uow(read_only=True) as uow:
+            row = await uow.checkpoints.get_checkpoint(thread_id, checkpoint_ns, get_checkpoint_id(config))
+            if row is None:
+                return None
+            return await self._to_tuple(uow, row)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        configurable = (config or {}).get("configurable", {})
+        async with self.uow(read_only=True) as uow:
+            rows = await uow.checkpoints.list_checkpoints(
+                thread_id=str(configurable["thread_id"]) if "thread_id" in configurable else None,
+                checkpoint_ns=configurable.get("checkpoint_ns"),
+                checkpoint_id=get_checkpoint_id(config) if config else None,
+                before_id=get_checkpoint_id(before) if before else None,
+                # с фильтром по метаданным лимит применяем после фильтрации
+                limit=None if filter else limit,
+            )
+            found = []
+            for row in rows:
+                metadata = self._loads(row.meta_type, row.meta)
+                if filter and not all(metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                found.append(await self._to_tuple(uow, row, metadata))
+                if limit is not None and len(found) >= limit:
+                    break
+        for item in found:
+            yield item
+
+    # ----- запись -----
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        configurable = config["configurable"]
+        thread_id = str(configurable["thread_id"])
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        history_version = configurable.get("history_version")
+
+        values = checkpoint.get("channel_values", {})
+        stored = {k: v for k, v in checkpoint.items() if k != "channel_values"}
+        blobs = []
+        for channel, version in new_versions.items():
+            type_, data = self._dumps(values[channel]) if channel in values else ("empty", None)
+            blobs.append(GraphBlobs(
+                thread_id=thread_id, checkpoint_ns=checkpoint_ns, channel=channel,
+                version=str(version), type=type_, blob=data))
+
+        type_, data = self._dumps(stored)
+        meta_type, meta = self._dumps(get_checkpoint_metadata(config, metadata))
+        row = GraphCheckpoints(
+            thread_id=thread_id, checkpoint_ns=checkpoint_ns, checkpoint_id=checkpoint["id"],
+            parent_checkpoint_id=configurable.get("checkpoint_id"),
+            history_version=history_version,
+            type=type_, checkpoint=data, meta_type=meta_type, meta=meta)
+
+        async with self.uow() as uow:
+            await uow.checkpoints.save_checkpoint(row, blobs)
+            if self._should_prune(thread_id, history_version):
+                await self._prune(uow, thread_id, history_version)
+            await uow.commit()
+        return self._config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        configurable = config["configurable"]
+        thread_id = str(configurable["thread_id"])
+        checkpoint_ns = configurable.get("checkpoint_ns", "")
+        checkpoint_id = configurable["checkpoint_id"]
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            type_, data = self._dumps(value)
+            rows.append(GraphWrites(
+                thread_id=thread_id, checkpoint_ns=checkpoint_ns, checkpoint_id=checkpoint_id,
+                task_id=task_id, idx=WRITES_IDX_MAP.get(channel, idx),
+                channel=channel, type=type_, blob=data, task_path=task_path))
+        async with self.uow() as uow:
+            await uow.checkpoints.save_writes(rows, replace=all(w[0] in WRITES_IDX_MAP for w in writes))
+            await uow.commit()
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        async with self.uow() as uow:
+            await uow.checkpoints.delete_thread(str(thread_id))
+            await uow.commit()
+        self._prune_state.pop(str(thread_id), None)
+
+    # ----- чистка -----
+
+    def _should_prune(self, thread_id: str, history_version: Optional[int]) -> bool:
+        last_version, puts = self._prune_state.get(thread_id, (None, 0))
+        puts += 1
+        if history_version != last_version or puts >= self.prune_every:
+            self._prune_state[thread_id] = (history_version, 0)
+            return True
+        self._prune_state[thread_id] = (last_version, puts)
+        return False
+
+    async def _prune(self, uow, thread_id: str, history_version: Optional[int]) -> None:
+        """Старые history_version треда - целиком, в текущей - всё кроме keep_last последних."""
+        rows = await uow.checkpoints.list_checkpoints(thread_id=thread_id)
+        kept_per_ns = defaultdict(int)
+        drop, keep = [], []
+        for row in rows:
+            outdated = (
+                history_version is not None and row.history_version is not None
+                and row.history_version < history_version
+            )
+            if outdated or kept_per_ns[row.checkpoint_ns] >= self.keep_last:
+                drop.append(row.checkpoint_id)
+                continue
+            kept_per_ns[row.checkpoint_ns] += 1
+            keep.append(row)
+        if not drop:
+            return None
+        await uow.checkpoints.delete_checkpoints(thread_id, drop)
+        referenced = set()
+        for row in keep:
+            checkpoint = self._loads(row.type, row.checkpoint)
+            referenced.update(
+                (row.checkpoint_ns, channel, str(version))
+                for channel, version in checkpoint["channel_versions"].items())
+        await uow.checkpoints.delete_blobs_except(thread_id, referenced)
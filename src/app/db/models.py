@@ -2,9 +2,9 @@ from datetime import datetime
 from typing import Optional, List
 
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import BigInteger, Integer, Boolean, JSON, DateTime
+from sqlalchemy import BigInteger, Integer, Boolean, JSON, DateTime, LargeBinary
 from sqlalchemy import (
-    Text, JSON, DateTime, ForeignKey, CheckConstraint, String
+    Text, JSON, DateTime, ForeignKey, CheckConstraint, String, Index, UniqueConstraint
 )
 
 from app.db.base import BaseDBT
@@ -24,6 +24,8 @@ class Chats(BaseDBT):
     last_poll_id: Mapped[Optional[int]] = mapped_column(Integer, default=None)
 
     history_version: Mapped[int] = mapped_column(Integer, default=1)
+    # номер следующей строки кода в текущей history_version - без max(line_number) на закрытии опроса
+    next_line_number: Mapped[int] = mapped_column(Integer, default=1)
 
     polls: Mapped[List["Polls"]] = relationship(back_populates="chat")
     code_lines: Mapped[List["CodeLines"]] = relationship(back_populates="chat")
@@ -48,6 +50,10 @@ class Polls(BaseDBT):
             "status in ('active', 'closed', 'failed', 'rejected')",
             name="poll_status_check"
         ),
+        # get_poll_by_tg_id - на каждый голос
+        Index("ix_polls_tg_poll_id", "tg_poll_id"),
+        # get_active_poll_for_chat: chat_id + status, сортировка по created_at
+        Index("ix_polls_chat_status_created", "chat_id", "status", "created_at"),
     )
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
@@ -77,6 +83,10 @@ class PollOptions(BaseDBT):
 
     poll: Mapped["Polls"] = relationship(back_populates="options")
 
+    __table_args__ = (
+        UniqueConstraint("poll_id", "index", name="uq_poll_options_poll_index"),
+    )
+
 
 class PollVotes(BaseDBT):
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -89,6 +99,11 @@ class PollVotes(BaseDBT):
 
     poll: Mapped["Polls"] = relationship(back_populates="votes")
 
+    __table_args__ = (
+        # один голос пользователя на опрос - основа для INSERT ... ON CONFLICT
+        UniqueConstraint("poll_id", "user_id", name="uq_poll_votes_poll_user"),
+    )
+
 
 class CodeLines(BaseDBT):
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -104,6 +119,12 @@ class CodeLines(BaseDBT):
     chat: Mapped["Chats"] = relationship(back_populates="code_lines")
     poll: Mapped["Polls"] = relationship(back_populates="code_line")
 
+    __table_args__ = (
+        # get_current_code / max(line_number): фильтр по чату, join по poll_id
+        Index("ix_code_lines_chat_poll", "chat_id", "poll_id"),
+        Index("ix_code_lines_poll_id", "poll_id"),
+    )
+
 
 class CompletedCode(BaseDBT):
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -118,14 +139,25 @@ class CompletedCode(BaseDBT):
     llm_request: Mapped[Optional[dict]] = mapped_column(JSON)
     llm_response: Mapped[Optional[dict]] = mapped_column(JSON)
 
+    __table_args__ = (
+        Index("ix_completed_code_chat_created", "chat_id", "created_at"),
+    )
+
 
 class SchedulerState(BaseDBT):
-    id: Mapped[int] = mapped_column(primary_key=True)  # всегда 1
+    id: Mapped[int] = mapped_column(primary_key=True)
+    # планировщик процесса: "main" или "worker-N" в многопроцессном режиме - у каждого своя строка
+    name: Mapped[str] = mapped_column(String(64), default="main")
 
     next_run_at: Mapped[datetime] = mapped_column(DateTime)
     uptime_started_at: Mapped[datetime] = mapped_column(DateTime)
     active_jobs: Mapped[dict] = mapped_column(JSON)
 
+    __table_args__ = (
+        # save_state - INSERT ... ON CONFLICT (name)
+        UniqueConstraint("name", name="uq_scheduler_state_name"),
+    )
+
 
 class Logs(BaseDBT):
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -134,3 +166,49 @@ class Logs(BaseDBT):
     level: Mapped[str] = mapped_column(Text)
     message: Mapped[str] = mapped_column(Text)
     context: Mapped[Optional[dict]] = mapped_column(JSON)
+
+
+# =========================
+# Чекпоинты LangGraph
+# =========================
+
+class GraphCheckpoints(BaseDBT):
+    """Чекпоинт без значений каналов: значения лежат в GraphBlobs по (канал, версия)."""
+    thread_id: Mapped[str] = mapped_column(Text, primary_key=True)
+    checkpoint_ns: Mapped[str] = mapped_column(Text, primary_key=True, default="")
+    checkpoint_id: Mapped[str] = mapped_column(Text, primary_key=True)
+
+    parent_checkpoint_id: Mapped[Optional[str]] = mapped_column(Text)
+    history_version: Mapped[Optional[int]] = mapped_column(Integer)
+
+    type: Mapped[str] = mapped_column(String(32))
+    checkpoint: Mapped[bytes] = mapped_column(LargeBinary)
+    meta_type: Mapped[str] = mapped_column(String(32))
+    meta: Mapped[bytes] = mapped_column(LargeBinary)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+class GraphBlobs(BaseDBT):
+    """Значение канала в конкретной версии - пишется только при изменении канала."""
+    thread_id: Mapped[str] = mapped_column(Text, primary_key=True)
+    checkpoint_ns: Mapped[str] = mapped_column(Text, primary_key=True, default="")
+    channel: Mapped[str] = mapped_column(Text, primary_key=True)
+    version: Mapped[str] = mapped_column(Text, primary_key=True)
+
+    type: Mapped[str] = mapped_column(String(32))
+    blob: Mapped[Optional[bytes]] = mapped_column(LargeBinary)
+
+
+class GraphWrites(BaseDBT):
+    """Промежуточные записи узлов (pending writes) для продолжения прерванного шага."""
+    thread_id: Mapped[str] = mapped_column(Text, primary_key=True)
+    checkpoint_ns: Mapped[str] = mapped_column(Text, primary_key=True, default="")
+    checkpoint_id: Mapped[str] = mapped_column(Text, primary_key=True)
+    task_id: Mapped[str] = mapped_column(Text, primary_key=True)
+    idx: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+    channel: Mapped[str] = mapped_column(Text)
+    type: Mapped[str] = mapped_column(String(32))
+    blob: Mapped[Optional[bytes]] = mapped_column(LargeBinary)
+    task_path: Mapped[str] = mapped_column(Text, default="")
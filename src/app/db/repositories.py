@@ -5,12 +5,17 @@ from typing import Sequence, Optional
 
 from sqlalchemy import (
     select,
+    insert,
     update,
     func,
     delete,
+    and_,
+    or_,
 )
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.db.cache import CacheScope, ChatRef, PollRef
 from app.db.models import (
     Chats,
     Polls,
@@ -19,7 +24,17 @@ from app.db.models import (
     CodeLines,
     CompletedCode,
     SchedulerState,
-    Logs)
+    Logs,
+    GraphCheckpoints,
+    GraphBlobs,
+    GraphWrites)
+
+def dialect_insert(session: AsyncSession, model):
+    """INSERT с поддержкой ON CONFLICT под диалект текущего подключения (SQLite / PostgreSQL)."""
+    if session.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
 
 # =========================
 # Chats
@@ -28,18 +43,47 @@ from app.db.models import (
 class ChatsRepository:
     """Работа с чатами и их состоянием (история, активный опрос)."""
 
-    def __init__(self, session: AsyncSession) -> None:
+    def __init__(self, session: AsyncSession, cache: Optional[CacheScope] = None) -> None:
         self.session = session
+        # кэш снимков чатов уровня процесса; изменения чата через репозиторий его сбрасывают
+        self.cache = cache
+
+    def _invalidate(self, chat_id: int) -> None:
+        if self.cache is not None:
+            self.cache.invalidate_chat(chat_id)
+
+    async def get_chat_ref(self, chat_id: int) -> Optional[ChatRef]:
+        """Снимок чата только для чтения: из кэша, при промахе - из БД."""
+        if self.cache is not None:
+            chat_ref = self.cache.get_chat(chat_id)
+            if chat_ref is not None:
+                return chat_ref
+            generation = self.cache.generation
+        chat = await self.get_chat(chat_id)
+        if chat is None:
+            return None
+        chat_ref = ChatRef(
+            id=chat.id,
+            history_version=chat.history_version,
+            last_poll_id=chat.last_poll_id,
+            next_line_number=chat.next_line_number,
+            admin_ids=chat.admin_ids,
+        )
+        if self.cache is not None:
+            self.cache.put_chat(chat_ref, generation)
+        return chat_ref
 
     async def get_or_create_chat(self, chat_id: int) -> Chats:
-        """Получить чат, если нет – создать."""
-        result = await self.session.execute(
-            select(Chats).where(Chats.id == chat_id)
-        )
-        chat = result.scalar_one_or_none()
+        """Получить чат, если нет – создать (ON CONFLICT DO NOTHING: несколько процессов не дерутся за вставку)."""
+        chat = await self.get_chat(chat_id)
         if chat is None:
-            chat = Chats(id=chat_id)
-            self.session.add(chat)
+            self._invalidate(chat_id)
+            await self.session.execute(
+                dialect_insert(self.session, Chats)
+                .values(id=chat_id)
+                .on_conflict_do_nothing(index_elements=[Chats.id])
+            )
+            chat = await self.get_chat(chat_id)
         return chat
 
     async def get_chat(self, chat_id: int) -> Optional[Chats]:
@@ -54,26 +98,36 @@ class ChatsRepository:
         Логика: инкремент history_version, сброс last_poll_id.
         Фактические данные не удаляем – просто работаем с новой версией.
         """
-        chat = await self.get_or_create_chat(chat_id)
-        # print("CHAT OBJ", chat)
-        # # TODO убрать?
-        chat.history_version += 1
-        # print("CHAT OBJ AFTER", chat)
-
-        chat.last_poll_id = None
-        chat.updated_at = datetime.now()
-        return chat
+        await self.get_or_create_chat(chat_id)
+        self._invalidate(chat_id)
+        # инкремент в самом UPDATE (не read-modify-write) - безопасно при нескольких процессах
+        result = await self.session.execute(
+            update(Chats)
+            .where(Chats.id == chat_id)
+            .values(
+                history_version=Chats.history_version + 1,
+                next_line_number=1,
+                last_poll_id=None,
+                updated_at=datetime.now(),
+            )
+            .returning(Chats)
+            .execution_options(populate_existing=True)
+        )
+        return result.scalar_one()
 
     async def set_last_poll(self, chat_id: int, poll_id: Optional[int]) -> None:
+        self._invalidate(chat_id)
         await self.session.execute(
             update(Chats)
             .where(Chats.id == chat_id)
             .values(last_poll_id=poll_id, updated_at=datetime.now())
         )
 
-    async def set_admin_ids(self, chat_id: int, admin_ids: list[int]) -> None:
+    async def set_admin_ids(self, chat_id: int, admin_ids: list[int], loaded_at: Optional[datetime] = None) -> None:
+        """loaded_at - когда список получен от Telegram (по нему считается свежесть кэша админов)."""
         chat = await self.get_or_create_chat(chat_id)
-        chat.admin_ids = {"admins": admin_ids}
+        self._invalidate(chat_id)
+        chat.admin_ids = {"admins": admin_ids, "updated_at": (loaded_at or datetime.now()).isoformat()}
         chat.updated_at = datetime.now()
 
 
@@ -84,8 +138,49 @@ class ChatsRepository:
 class PollsRepository:
     """Создание/закрытие опросов, варианты и голоса."""
 
-    def __init__(self, session: AsyncSession) -> None:
+    def __init__(self, session: AsyncSession, cache: Optional[CacheScope] = None) -> None:
         self.session = session
+        self.cache = cache
+
+    def _invalidate(self, poll_id: Optional[int] = None, tg_poll_id: Optional[str] = None,
+                    chat_id: Optional[int] = None) -> None:
+        if self.cache is None:
+            return None
+        self.cache.invalidate_poll(poll_id=poll_id, tg_poll_id=tg_poll_id)
+        if chat_id is not None:
+            self.cache.invalidate_chat(chat_id)
+
+    @staticmethod
+    def _to_ref(poll: Polls) -> PollRef:
+        return PollRef(
+            id=poll.id,
+            chat_id=poll.chat_id,
+            tg_poll_id=poll.tg_poll_id,
+            tg_message_id=poll.tg_message_id,
+            history_version=poll.history_version,
+            status=poll.status,
+        )
+
+    async def get_poll_ref(self, poll_id: Optional[int] = None, tg_poll_id: Optional[str] = None) -> Optional[PollRef]:
+        """Снимок опроса только для чтения (по id или tg_poll_id): из кэша, при промахе - из БД."""
+        if self.cache is not None:
+            poll_ref = (
+                self.cache.get_poll(poll_id) if poll_id is not None
+                else self.cache.get_poll_by_tg_id(tg_poll_id)
+            )
+            if poll_ref is not None:
+                return poll_ref
+            generation = self.cache.generation
+        if poll_id is not None:
+            poll = await self.get_poll_by_id(poll_id)
+        else:
+            poll = await self.get_poll_by_tg_id(tg_poll_id)
+        if poll is None:
+            return None
+        poll_ref = self._to_ref(poll)
+        if self.cache is not None:
+            self.cache.put_poll(poll_ref, generation)
+        return poll_ref
 
     async def create_poll(
         self,
@@ -115,17 +210,17 @@ class PollsRepository:
         self.session.add(poll)
         await self.session.flush()  # чтобы появился poll.id
 
-        for idx, line in enumerate(options):
-            self.session.add(
-                PollOptions(
-                    poll_id=poll.id,
-                    index=idx,
-                    code_line=line,
-                    votes=0,
-                )
-            )
+        # все варианты одним INSERT ... RETURNING (PostgreSQL и SQLite >= 3.35)
+        await self.session.scalars(
+            insert(PollOptions).returning(PollOptions),
+            [
+                {"poll_id": poll.id, "index": idx, "code_line": line, "votes": 0}
+                for idx, line in enumerate(options)
+            ],
+        )
 
         # заодно обновим last_poll_id
+        self._invalidate(poll_id=poll.id, chat_id=chat.id)
         chat.last_poll_id = poll.id
         chat.updated_at = datetime.now()
 
@@ -137,6 +232,19 @@ class PollsRepository:
         )
         return result.scalar_one_or_none()
 
+    async def lock_poll_by_tg_id(self, tg_poll_id: str) -> Optional[Polls]:
+        """
+        Опрос под блокировку строки до конца транзакции (закрытие, подсчёт победителя).
+        PostgreSQL: FOR UPDATE SKIP LOCKED - если опрос уже закрывает другой процесс, вернётся None.
+        SQLite: без FOR UPDATE, записи и так идут через одного писателя.
+        """
+        result = await self.session.execute(
+            select(Polls)
+            .where(Polls.tg_poll_id == tg_poll_id)
+            .with_for_update(skip_locked=True)
+        )
+        return result.scalar_one_or_none()
+
     async def get_poll_with_options(self, poll_id: int) -> Optional[Polls]:
         """
         Вернуть опрос с подгруженными options (через relationship lazy='selectin' в настройке).
@@ -170,9 +278,19 @@ class PollsRepository:
         )
         return result.scalar_one_or_none()
     
+    async def get_scheduled_polls(self) -> list[tuple[int, str, datetime]]:
+        """Активные опросы со сроком: (chat_id, tg_poll_id, timeout_at) - для загрузки таймеров на старте."""
+        result = await self.session.execute(
+            select(Polls.chat_id, Polls.tg_poll_id, Polls.timeout_at)
+            .where(Polls.status == "active", Polls.timeout_at.is_not(None))
+            .order_by(Polls.timeout_at)
+        )
+        return [tuple(row) for row in result.all()]
+
     async def reject_poll_if_active_by_poll_id(self, poll_id: int) -> None:
         poll = await self.get_poll_by_id(poll_id=poll_id)
         if poll and poll.status == "active":
+            self._invalidate(poll_id=poll.id)
             poll.status = "rejected"
             self.session.add(poll)
             await self.session.commit()
@@ -186,11 +304,49 @@ class PollsRepository:
     ) -> None:
         """Закрываем опрос (по таймеру или команде)."""
         if poll:
+            self._invalidate(poll_id=poll.id)
             poll.status = status
             poll.closed_at = datetime.now()
 
     # ----- Votes -----
 
+    async def upsert_votes(self, rows: Sequence[dict]) -> None:
+        """
+        Пачка голосов одним INSERT ... ON CONFLICT (poll_id, user_id) DO UPDATE.
+        rows - словари poll_id, user_id, option_index, answered_at.
+        """
+        if not rows:
+            return None
+        stmt = dialect_insert(self.session, PollVotes).values(list(rows))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PollVotes.poll_id, PollVotes.user_id],
+            set_={
+                "option_index": stmt.excluded.option_index,
+                "answered_at": stmt.excluded.answered_at,
+            },
+        )
+        await self.session.execute(stmt)
+
+    async def get_active_poll_ids(self, poll_ids: Sequence[int]) -> set[int]:
+        """Какие из опросов ещё открыты - голоса за остальные не пишем."""
+        if not poll_ids:
+            return set()
+        result = await self.session.execute(
+            select(Polls.id).where(Polls.id.in_(list(poll_ids)), Polls.status == "active")
+        )
+        return set(result.scalars().all())
+
+    async def delete_votes(self, poll_id: int, user_ids: Sequence[int]) -> None:
+        """Отозванные голоса (poll_answer с пустым option_ids)."""
+        if not user_ids:
+            return None
+        await self.session.execute(
+            delete(PollVotes).where(
+                PollVotes.poll_id == poll_id,
+                PollVotes.user_id.in_(list(user_ids)),
+            )
+        )
+
     async def add_or_update_vote(
         self,
         poll_id: int,
@@ -199,31 +355,16 @@ class PollsRepository:
     ) -> None:
         """
         Добавить или обновить голос пользователя.
-        Бэкенд-агностично (SQLite + Postgres): сначала ищем, затем обновляем/создаём.
+        Upsert по уникальному (poll_id, user_id); без user_id - просто новая строка.
         """
+        now = datetime.now()
         if user_id:
-            result = await self.session.execute(
-                select(PollVotes)
-                .where(
-                    PollVotes.poll_id == poll_id,
-                    PollVotes.user_id == user_id,
-                )
-            )
-            vote = result.scalar_one_or_none()
-
-            now = datetime.now()
-
-            if vote is None:
-                vote = PollVotes(
-                    poll_id=poll_id,
-                    user_id=user_id,
-                    option_index=option_index,
-                    answered_at=now,
-                )
-                self.session.add(vote)
-            else:
-                vote.option_index = option_index
-                vote.answered_at = now
+            await self.upsert_votes([{
+                "poll_id": poll_id,
+                "user_id": user_id,
+                "option_index": option_index,
+                "answered_at": now,
+            }])
         else:
             vote = PollVotes(
                     poll_id=poll_id,
@@ -233,32 +374,23 @@ class PollsRepository:
                 )
             self.session.add(vote)
 
-
     async def recalc_votes_for_poll(self, poll_id: int) -> None:
         """
-        Пересчёт счётчиков options.votes по poll_votes.
-        Полезно при рестарте: на всякий случай синхронизировать агрегаты.
+        Пересчёт счётчиков options.votes по poll_votes одним UPDATE с коррелированным подсчётом.
+        Счётчики закрытого опроса уже итоговые (finalize_poll) - их не трогаем.
         """
-        # Считаем голоса по вариантам
-        result = await self.session.execute(
-            select(
-                PollVotes.option_index,
-                func.count(PollVotes.id),
-            )
-            .where(PollVotes.poll_id == poll_id)
-            .group_by(PollVotes.option_index)
+        votes = (
+            select(func.count(PollVotes.id))
+            .where(PollVotes.poll_id == poll_id, PollVotes.option_index == PollOptions.index)
+            .scalar_subquery()
         )
-        counts = {row.option_index: row[1] for row in result.all()}
-
-        # Обновляем options
-        opts_result = await self.session.execute(
-            select(PollOptions).where(PollOptions.poll_id == poll_id)
+        active = select(Polls.id).where(Polls.id == poll_id, Polls.status == "active").exists()
+        await self.session.execute(
+            update(PollOptions)
+            .where(PollOptions.poll_id == poll_id, active)
+            .values(votes=votes)
         )
-        options = opts_result.scalars().all()
 
-        for opt in options:
-            opt.votes = counts.get(opt.index, 0)
-    
     async def update_telegram_ids(
         self,
         poll_id: int,
@@ -276,11 +408,87 @@ class PollsRepository:
         if not poll:
             return False
 
+        self._invalidate(poll_id=poll.id, tg_poll_id=poll.tg_poll_id)
         poll.tg_poll_id = tg_poll_id
         poll.tg_message_id = tg_message_id
 
         return True
 
+    async def finalize_poll(
+        self,
+        tg_poll_id: str,
+    ) -> Optional[tuple[Polls, PollOptions, Optional[CodeLines]]]:
+        """
+        Закрытие опроса без промежуточных чтений - только UPDATE/INSERT ... RETURNING:
+        1. статус closed (строка под FOR UPDATE SKIP LOCKED; занята другим процессом или
+           победитель уже в коде - None, повторное закрытие строку не дублирует);
+        2. options.votes коррелированным подсчётом по poll_votes (голоса всех процессов бота),
+           победитель - из вернувшихся строк (больше голосов, при равенстве - меньший index);
+        3. номер строки - инкремент chats.next_line_number, если опрос из текущей history_version;
+        4. победившая строка в code_lines.
+        Возвращает (опрос, победитель, строка кода или None для опроса старой истории).
+        """
+        self._invalidate(tg_poll_id=tg_poll_id)
+        locked = (
+            select(Polls.id)
+            .where(
+                Polls.tg_poll_id == tg_poll_id,
+                ~select(CodeLines.id).where(CodeLines.poll_id == Polls.id).exists(),
+            )
+            .with_for_update(skip_locked=True)
+            .scalar_subquery()
+        )
+        result = await self.session.execute(
+            update(Polls)
+            .where(Polls.id == locked)
+            .values(status="closed", closed_at=datetime.now())
+            .returning(Polls)
+            .execution_options(populate_existing=True, synchronize_session=False)
+        )
+        poll = result.scalar_one_or_none()
+        if poll is None:
+            return None
+        self._invalidate(poll_id=poll.id, chat_id=poll.chat_id)
+
+        votes = (
+            select(func.count(PollVotes.id))
+            .where(PollVotes.poll_id == poll.id, PollVotes.option_index == PollOptions.index)
+            .scalar_subquery()
+        )
+        result = await self.session.execute(
+            update(PollOptions)
+            .where(PollOptions.poll_id == poll.id)
+            .values(votes=votes)
+            .returning(PollOptions)
+            .execution_options(populate_existing=True, synchronize_session=False)
+        )
+        options = result.scalars().all()
+        if not options:
+            return poll, None, None
+        winner = min(options, key=lambda o: (-o.votes, o.index))
+
+        result = await self.session.execute(
+            update(Chats)
+            .where(Chats.id == poll.chat_id, Chats.history_version == poll.history_version)
+            .values(next_line_number=Chats.next_line_number + 1, updated_at=datetime.now())
+            .returning(Chats.next_line_number)
+            .execution_options(synchronize_session=False)
+        )
+        next_line_number = result.scalar_one_or_none()
+        if next_line_number is None:
+            # после /start опрос старой истории в код не попадает
+            return poll, winner, None
+
+        code_line = CodeLines(
+            chat_id=poll.chat_id,
+            poll_id=poll.id,
+            line_number=next_line_number - 1,
+            code_line=winner.code_line,
+            is_final=True,
+        )
+        self.session.add(code_line)
+        return poll, winner, code_line
+
     async def get_winner(self, poll_id: int) -> PollOptions:
         """
         Возвращает победившую опцию.
@@ -312,10 +520,12 @@ class CodeRepository:
         chat: Chats,
         poll: Polls,
         winning_option_index: int,
+        line_number: Optional[int] = None,
     ) -> CodeLines:
         """
         Добавить победившую строку в code_lines.
-        line_number = макс+1 в рамках текущей history_version.
+        line_number = макс+1 в рамках текущей history_version
+        (если вызывающий уже знает номер, например из буфера кода - без запроса).
         """
         # найдём победившую опцию
         result = await self.session.execute(
@@ -330,18 +540,19 @@ class CodeRepository:
         if option is None:
             raise ValueError("Winning PollOption not found")
 
-        # считаем текущий max line_number по актуальной истории
-        # через join с Polls, чтобы учитывать history_version
-        result = await self.session.execute(
-            select(func.max(CodeLines.line_number))
-            .join(Polls, CodeLines.poll_id == Polls.id)
-            .where(
-                CodeLines.chat_id == chat.id,
-                Polls.history_version == chat.history_version,
+        if line_number is None:
+            # считаем текущий max line_number по актуальной истории
+            # через join с Polls, чтобы учитывать history_version
+            result = await self.session.execute(
+                select(func.max(CodeLines.line_number))
+                .join(Polls, CodeLines.poll_id == Polls.id)
+                .where(
+                    CodeLines.chat_id == chat.id,
+                    Polls.history_version == chat.history_version,
+                )
             )
-        )
-        max_line_number = result.scalar_one() or 0
-        line_number = max_line_number + 1
+            max_line_number = result.scalar_one() or 0
+            line_number = max_line_number + 1
 
         code_line = CodeLines(
             chat_id=chat.id,
@@ -373,6 +584,22 @@ class CodeRepository:
         )
         return [row.code_line for row in result.all()]
 
+    async def get_all_histories(self) -> list[list[str]]:
+        """
+        Все истории (чат + history_version) целиком, строки по порядку.
+        Используется офлайн (прогрев кэша), в обработке апдейтов не вызывается.
+        """
+        result = await self.session.execute(
+            select(CodeLines.chat_id, Polls.history_version, CodeLines.code_line)
+            .join(Polls, CodeLines.poll_id == Polls.id)
+            .where(CodeLines.is_final.is_(True))
+            .order_by(CodeLines.chat_id, Polls.history_version, CodeLines.line_number.asc())
+        )
+        histories: dict[tuple[int, int], list[str]] = {}
+        for row in result.all():
+            histories.setdefault((row.chat_id, row.history_version), []).append(row.code_line)
+        return list(histories.values())
+
     async def delete_all_code_for_chat(self, chat: Chats) -> None:
         """
         Полная очистка code_lines по чату (если захочешь делать жёсткий reset).
@@ -433,19 +660,19 @@ class SchedulerRepository:
     def __init__(self, session: AsyncSession) -> None:
         self.session = session
 
-    async def get_state(self) -> SchedulerState:
+    async def get_state(self, name: str = "main") -> SchedulerState:
         """
         Всегда возвращаем объект.
         Если его нет – создаём с дефолтами.
         """
         result = await self.session.execute(
-            select(SchedulerState).where(SchedulerState.id == 1)
+            select(SchedulerState).where(SchedulerState.name == name)
         )
         state = result.scalar_one_or_none()
         if state is None:
             now = datetime.now()
             state = SchedulerState(
-                id=1,
+                name=name,
                 next_run_at=now,
                 uptime_started_at=now,
                 active_jobs={},
@@ -453,6 +680,11 @@ class SchedulerRepository:
             self.session.add(state)
         return state
 
+    async def get_states(self) -> Sequence[SchedulerState]:
+        """Строки всех планировщиков (по одной на процесс) - для /health."""
+        result = await self.session.execute(select(SchedulerState).order_by(SchedulerState.name))
+        return result.scalars().all()
+
     async def update_next_run(self, next_run_at: datetime) -> None:
         state = await self.get_state()
         state.next_run_at = next_run_at
@@ -461,6 +693,29 @@ class SchedulerRepository:
         state = await self.get_state()
         state.active_jobs = jobs
 
+    async def save_state(
+        self,
+        name: str,
+        next_run_at: datetime,
+        jobs: dict,
+        uptime_started_at: Optional[datetime] = None,
+    ) -> None:
+        """
+        Состояние одного планировщика (процесса) в его строке - один INSERT ... ON CONFLICT (name)
+        без предварительного чтения: воркеры не затирают друг друга и не гоняются за вставкой.
+        """
+        now = datetime.now()
+        stmt = dialect_insert(self.session, SchedulerState).values(
+            name=name,
+            next_run_at=next_run_at,
+            uptime_started_at=uptime_started_at or now,
+            active_jobs=jobs,
+        )
+        set_ = {"next_run_at": stmt.excluded.next_run_at, "active_jobs": stmt.excluded.active_jobs}
+        if uptime_started_at is not None:
+            set_["uptime_started_at"] = stmt.excluded.uptime_started_at
+        await self.session.execute(stmt.on_conflict_do_update(index_elements=[SchedulerState.name], set_=set_))
+
 
 # =========================
 # Logs (/logs, /alllogs)
@@ -506,3 +761,143 @@ class LogsRepository:
             stmt = stmt.limit(limit)
         result = await self.session.execute(stmt)
         return result.scalars().all()
+
+
+# =========================
+# Чекпоинты LangGraph
+# =========================
+
+class CheckpointsRepository:
+    """Хранение чекпоинтов графа: сами чекпоинты, значения каналов по версиям, pending writes."""
+
+    def __init__(self, session: AsyncSession) -> None:
+        self.session = session
+
+    async def get_checkpoint(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        checkpoint_id: Optional[str] = None,
+    ) -> Optional[GraphCheckpoints]:
+        """Конкретный чекпоинт или последний по треду (id - uuid6, растут со временем)."""
+        stmt = select(GraphCheckpoints).where(
+            GraphCheckpoints.thread_id == thread_id,
+            GraphCheckpoints.checkpoint_ns == checkpoint_ns,
+        )
+        if checkpoint_id is not None:
+            stmt = stmt.where(GraphCheckpoints.checkpoint_id == checkpoint_id)
+        else:
+            stmt = stmt.order_by(GraphCheckpoints.checkpoint_id.desc()).limit(1)
+        result = await self.session.execute(stmt)
+        return result.scalar_one_or_none()
+
+    async def list_checkpoints(
+        self,
+        thread_id: Optional[str] = None,
+        checkpoint_ns: Optional[str] = None,
+        checkpoint_id: Optional[str] = None,
+        before_id: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> Sequence[GraphCheckpoints]:
+        stmt = select(GraphCheckpoints)
+        if thread_id is not None:
+            stmt = stmt.where(GraphCheckpoints.thread_id == thread_id)
+        if checkpoint_ns is not None:
+            stmt = stmt.where(GraphCheckpoints.checkpoint_ns == checkpoint_ns)
+        if checkpoint_id is not None:
+            stmt = stmt.where(GraphCheckpoints.checkpoint_id == checkpoint_id)
+        if before_id is not None:
+            stmt = stmt.where(GraphCheckpoints.checkpoint_id < before_id)
+        stmt = stmt.order_by(GraphCheckpoints.checkpoint_id.desc())
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        result = await self.session.execute(stmt)
+        return result.scalars().all()
+
+    async def get_blobs(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        versions: dict[str, str],
+    ) -> Sequence[GraphBlobs]:
+        if not versions:
+            return []
+        result = await self.session.execute(
+            select(GraphBlobs).where(
+                GraphBlobs.thread_id == thread_id,
+                GraphBlobs.checkpoint_ns == checkpoint_ns,
+                or_(*(
+                    and_(GraphBlobs.channel == channel, GraphBlobs.version == version)
+                    for channel, version in versions.items()
+                )),
+            )
+        )
+        return result.scalars().all()
+
+    async def get_writes(
+        self,
+        thread_id: str,
+        checkpoint_ns: str,
+        checkpoint_id: str,
+    ) -> Sequence[GraphWrites]:
+        result = await self.session.execute(
+            select(GraphWrites)
+            .where(
+                GraphWrites.thread_id == thread_id,
+                GraphWrites.checkpoint_ns == checkpoint_ns,
+                GraphWrites.checkpoint_id == checkpoint_id,
+            )
+            .order_by(GraphWrites.task_id, GraphWrites.idx)
+        )
+        return result.scalars().all()
+
+    async def save_checkpoint(self, checkpoint: GraphCheckpoints, blobs: list[GraphBlobs]) -> None:
+        """merge - повторная запись того же чекпоинта/версии канала не падает на PK."""
+        for blob in blobs:
+            await self.session.merge(blob)
+        await self.session.merge(checkpoint)
+
+    async def save_writes(self, writes: list[GraphWrites], replace: bool) -> None:
+        """
+        replace=False - уже сохранённые записи задачи не перетираем (обычные каналы),
+        replace=True - перезаписываем (служебные: ошибка, interrupt).
+        """
+        for write in writes:
+            if not replace:
+                existing = await self.session.get(
+                    GraphWrites,
+                    (write.thread_id, write.checkpoint_ns, write.checkpoint_id, write.task_id, write.idx),
+                )
+                if existing is not None:
+                    continue
+            await self.session.merge(write)
+
+    async def delete_thread(self, thread_id: str) -> None:
+        for model in (GraphWrites, GraphBlobs, GraphCheckpoints):
+            await self.session.execute(delete(model).where(model.thread_id == thread_id))
+
+    async def delete_checkpoints(self, thread_id: str, checkpoint_ids: list[str]) -> None:
+        if not checkpoint_ids:
+            return None
+        for model in (GraphWrites, GraphCheckpoints):
+            await self.session.execute(
+                delete(model).where(model.thread_id == thread_id, model.checkpoint_id.in_(checkpoint_ids))
+            )
+
+    async def delete_blobs_except(self, thread_id: str, keep: set[tuple[str, str, str]]) -> int:
+        """Удалить значения каналов треда, на которые не ссылается ни один оставшийся чекпоинт."""
+        result = await self.session.execute(
+            select(GraphBlobs.checkpoint_ns, GraphBlobs.channel, GraphBlobs.version)
+            .where(GraphBlobs.thread_id == thread_id)
+        )
+        stale = [tuple(row) for row in result.all() if tuple(row) not in keep]
+        for ns, channel, version in stale:
+            await self.session.execute(
+                delete(GraphBlobs).where(
+                    GraphBlobs.thread_id == thread_id,
+                    GraphBlobs.checkpoint_ns == ns,
+                    GraphBlobs.channel == channel,
+                    GraphBlobs.version == version,
+                )
+            )
+        return len(stale)
@@ -3,6 +3,7 @@ from __future__ import annotations
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from contextlib import asynccontextmanager
 
+from app.db.cache import IdentityCache
 from app.db.repositories import (
     ChatsRepository,
     PollsRepository,
@@ -10,6 +11,7 @@ from app.db.repositories import (
     CompletedCodeRepository,
     SchedulerRepository,
     LogsRepository,
+    CheckpointsRepository,
 )
 
 
@@ -25,9 +27,11 @@ class UnitOfWork:
             await uow.commit()
     """
 
-    def __init__(self, session_factory: async_sessionmaker[AsyncSession]):
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession], cache: IdentityCache | None = None):
         self._session_factory = session_factory
         self.session: AsyncSession | None = None
+        # снимки чатов/опросов уровня процесса, сбросы этой транзакции - в cache_scope
+        self.cache_scope = cache.scope() if cache is not None else None
 
         # Репозитории
         self.chats: ChatsRepository | None = None
@@ -36,6 +40,7 @@ class UnitOfWork:
         self.completed: CompletedCodeRepository | None = None
         self.scheduler: SchedulerRepository | None = None
         self.logs: LogsRepository | None = None
+        self.checkpoints: CheckpointsRepository | None = None
 
     async def __aenter__(self) -> "UnitOfWork":
         self.session = self._session_factory()
@@ -43,44 +48,65 @@ class UnitOfWork:
         await self.session.begin()
 
         # Инициализируем репозитории
-        self.chats = ChatsRepository(self.session)
-        self.polls = PollsRepository(self.session)
+        self.chats = ChatsRepository(self.session, cache=self.cache_scope)
+        self.polls = PollsRepository(self.session, cache=self.cache_scope)
         self.code = CodeRepository(self.session)
         self.completed = CompletedCodeRepository(self.session)
         self.scheduler = SchedulerRepository(self.session)
         self.logs = LogsRepository(self.session)
+        self.checkpoints = CheckpointsRepository(self.session)
 
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
-        if exc is None:
-            try:
-                await self.session.commit()
-            except Exception:
+        try:
+            if exc is None:
+                try:
+                    await self.session.commit()
+                except Exception:
+                    await self.session.rollback()
+                    raise
+            else:
                 await self.session.rollback()
-                raise
-        else:
-            await self.session.rollback()
-
-        await self.session.close()
+        finally:
+            # сброс кэша по ключам, изменённым в транзакции, - уже после коммита/отката
+            if self.cache_scope is not None:
+                self.cache_scope.close()
+            await self.session.close()
 
     async def commit(self):
         await self.session.commit()
+        if self.cache_scope is not None:
+            self.cache_scope.close()
 
     async def rollback(self):
         await self.session.rollback()
+        if self.cache_scope is not None:
+            self.cache_scope.close()
 
 
 class UoWFactory:
     """
     Создаёт UnitOfWork через sessionmaker.
+    read_only=True - сессия из пула читателей (если он задан), запись - всегда через основной.
+    cache - общий для всех UoW кэш чатов/опросов (IdentityCache), None - без кэша.
     """
 
-    def __init__(self, session_factory: async_sessionmaker[AsyncSession]):
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        read_session_factory: async_sessionmaker[AsyncSession] | None = None,
+        cache: IdentityCache | None = None,
+    ):
         self._session_factory = session_factory
+        self._read_session_factory = read_session_factory
+        self.cache = cache
 
     @asynccontextmanager
-    async def __call__(self):
-        uow = UnitOfWork(self._session_factory)
+    async def __call__(self, read_only: bool = False):
+        session_factory = self._session_factory
+        if read_only and self._read_session_factory is not None:
+            session_factory = self._read_session_factory
+        uow = UnitOfWork(session_factory, cache=self.cache)
         async with uow as uow_instance:
             yield uow_instance
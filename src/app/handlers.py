@@ -5,14 +5,24 @@ from aiogram.fsm.context import FSMContext
 from typing import Callable, Dict, Any
 from app.keyboards import get_keyboard_for_role
 from app.crud import DataManager
-from app.utils import get_user_role, RolesEnum, send_py_from_memory, to_markdown
+from app.admin_cache import AdminCache
+from app.chat_locks import ChatLocks
+from app.poll_scheduler import PollScheduler
+from app.services import cmd_health as health_report
+from app.utils import get_user_role, RolesEnum, send_py_from_memory, to_markdown, stream_to_message
 from app.enums import RolesEnum, CommandsEnum
 from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
 
-from app.db.base import get_async_engine
+from app.db.base import get_async_engines
 from .settings import appctx
 from app.db.uow import UoWFactory
+from app.db.cache import IdentityCache
+from app.db.checkpointer import SQLAlchemyCheckpointSaver
 from app.llm.llm import LLMGenerator
+from app.llm.speculation import SpeculationEngine
+from app.llm.resilience import fallback_candidates, StreamInterrupted
+from app.llm.throttle import set_request_context, lower_priority
+from app.llm.session import pin_session
 from app.pmodels import AgentInputModes, LLMInput
 
 
@@ -21,7 +31,9 @@ class RoleMiddleware(BaseMiddleware):
         user_id = event.from_user.id
         chat_id = event.chat.id
         # ---
-        data["role"] = await get_user_role(user_id, event, admin_ids=appctx.TG_BOT_ADMINS)
+        data["role"] = await get_user_role(user_id, event, admin_ids=appctx.TG_BOT_ADMINS, admin_cache=admin_cache)
+        # контекст для планировщика LLM: чат для честной очереди, команды админов - с приоритетом
+        set_request_context(chat_id, priority=data["role"] in (RolesEnum.ADMIN, RolesEnum.OWNER, RolesEnum.GROUP_ADMIN))
         # print("ADMINS0", appctx.TG_BOT_ADMINS)
         data["llm_configurable"] = {"configurable": {"thread_id": chat_id}}
         return await handler(event, data)
@@ -29,13 +41,71 @@ class RoleMiddleware(BaseMiddleware):
 
 router = Router()
 router.message.middleware(RoleMiddleware())
+# SQLite: одно подключение-писатель + пул читателей, PRAGMA профиля на каждом подключении
+db_engine, db_read_engine = get_async_engines(
+    url=appctx.DB_PREFIX + appctx.DB_CONNECTION_STRING,
+    sqlite_pragmas=appctx.sqlite_pragmas,
+    read_pool_size=appctx.DB_READ_POOL_SIZE,
+    pool_size=appctx.DB_POOL_SIZE)
 async_session = async_sessionmaker(
-    bind=get_async_engine(url=appctx.DB_PREFIX + appctx.DB_CONNECTION_STRING),
+    bind=db_engine,
     expire_on_commit=False,  # обязательно для асинхронки
     class_=AsyncSession,
 )
-data_manager = DataManager(uow=UoWFactory(session_factory=async_session))
-llm_agent = LLMGenerator(app_config=appctx).build_graph()
+read_async_session = async_sessionmaker(
+    bind=db_read_engine,
+    expire_on_commit=False,
+    class_=AsyncSession,
+) if db_read_engine is not None else None
+# чаты и опросы по tg_poll_id - из кэша процесса, запись через репозитории его сбрасывает
+identity_cache = IdentityCache(max_size=appctx.DB_IDENTITY_CACHE_SIZE, ttl=appctx.DB_IDENTITY_CACHE_TTL)
+uow_factory = UoWFactory(session_factory=async_session, read_session_factory=read_async_session, cache=identity_cache)
+admin_cache = AdminCache(uow=uow_factory, ttl=appctx.TG_ADMINS_CACHE_TTL)
+data_manager = DataManager(
+    uow=uow_factory,
+    vote_flush_interval=appctx.VOTE_FLUSH_INTERVAL,
+    vote_flush_batch=appctx.VOTE_FLUSH_BATCH)
+llm_checkpointer = SQLAlchemyCheckpointSaver(
+    uow=uow_factory,
+    keep_last=appctx.LLM_CHECKPOINT_KEEP_LAST) if appctx.LLM_CHECKPOINT_ENABLED else None
+llm_generator = LLMGenerator(app_config=appctx, memory=llm_checkpointer)
+llm_agent = llm_generator.build_graph()
+# спекулятивные прогоны в БД не пишем
+speculation_agent = llm_generator.build_graph(checkpointer=False)
+
+
+async def run_agent(llm_input: LLMInput, llm_configurable: dict, history_version) -> dict:
+    """Граф по треду чата; history_version - для продолжения после рестарта и чистки старых чекпоинтов."""
+    config = {"configurable": {**llm_configurable["configurable"], "history_version": history_version}}
+    return await llm_generator.ainvoke_resumable(llm_agent, llm_input, config)
+
+
+async def speculate_next_options(current_code: str) -> dict:
+    # фоновая работа не должна обгонять живые команды админов
+    lower_priority()
+    # весь результат: по "degraded" speculator.take отбросит варианты из эвристик
+    return await speculation_agent.ainvoke(
+        input=LLMInput(mode=AgentInputModes.NEXT, history=[current_code]),
+        config={"configurable": {"thread_id": f"speculation:{hash(current_code)}"}})
+
+
+# команды одного чата - по очереди, одинаковые одновременные - один прогон на всех
+chat_locks = ChatLocks()
+# закрытие опросов по timeout_at; запускается из main.py (или воркером) после старта бота
+poll_scheduler = PollScheduler(
+    uow=uow_factory,
+    poll_timeout=appctx.POLL_TIMEOUT,
+    max_concurrency=appctx.SCHEDULER_MAX_CONCURRENCY,
+    state_interval=appctx.SCHEDULER_STATE_INTERVAL,
+    retry_delay=appctx.SCHEDULER_RETRY_DELAY)
+
+speculator = SpeculationEngine(
+    generate=speculate_next_options,
+    max_concurrency=appctx.SPECULATION_MAX_CONCURRENCY,
+    token_budget=appctx.SPECULATION_TOKEN_BUDGET,
+    budget_window=appctx.SPECULATION_BUDGET_WINDOW,
+    leader_only=appctx.SPECULATION_LEADER_ONLY,
+) if appctx.SPECULATION_ENABLED else None
 
 
 @router.message(Command("restart"))
@@ -45,6 +115,67 @@ async def restart_handler(message: types.Message, state: FSMContext):
     await message.answer("Привет! Это как новый запуск бота.")
 
 
+async def announce_winner(bot, chat_id: int, winner_poll_option_dbt) -> None:
+    if speculator and winner_poll_option_dbt:
+        speculator.resolve(chat_id, winner_poll_option_dbt.code_line)
+    if winner_poll_option_dbt and winner_poll_option_dbt.code_line:
+        await bot.send_message(
+            chat_id,
+            f"Победившая строка:\n```\n{winner_poll_option_dbt.code_line}\n```",
+            parse_mode="Markdown"
+        )
+
+
+async def finish_last_poll(bot, chat_id: int):
+    """
+    Закрыть текущий опрос чата и сразу дописать победителя в код - до того, как команда
+    прочитает код. Закрытие опроса в Telegram (апдейт poll) потом ничего не повторит.
+    """
+    poll_scheduler.cancel(chat_id)
+    last_poll_id = await data_manager.get_last_poll_tg_id_by_chat_id(chat_id)
+    poll_dbt = await data_manager.close_poll(last_poll_id)
+    if poll_dbt:
+        winner_poll_option_dbt = await data_manager.finishing_poll_process(tg_poll_id=last_poll_id)
+        await announce_winner(bot, poll_dbt.chat_id, winner_poll_option_dbt)
+    return poll_dbt
+
+
+async def post_poll(bot, chat_id: int, question: str, options: list[str]) -> None:
+    """Отправить опрос, сохранить его со сроком и поставить таймер закрытия."""
+    timeout_at = poll_scheduler.deadline()
+    sent_poll = await bot.send_poll(
+        chat_id=chat_id,
+        question=question,
+        options=options,
+        is_anonymous=False,
+        type="regular",
+        allows_multiple_answers=False
+    )
+    tg_poll_id = sent_poll.poll.id
+    await data_manager.register_poll(
+        tg_poll_id=tg_poll_id,
+        chat_id=chat_id,
+        message_id=sent_poll.message_id,
+        options=options,
+        timeout_at=timeout_at)
+    poll_scheduler.schedule(chat_id, tg_poll_id, timeout_at)
+
+
+async def advance_poll(bot, chat_id: int, tg_poll_id: str) -> None:
+    """Срок опроса вышел (PollScheduler): то же, что /send_now, если опрос всё ещё текущий."""
+    set_request_context(chat_id, priority=False)
+
+    async def advance():
+        poll_dbt = await data_manager.get_poll_by_tg_poll_id(tg_poll_id=tg_poll_id)
+        # опрос уже закрыли /send_now или /code_completed, /start его отклонил
+        if poll_dbt is None or poll_dbt.status != "active":
+            return None
+        await send_next_poll(bot, chat_id, {"configurable": {"thread_id": chat_id}})
+
+    # одновременный /send_now того же чата - один прогон на двоих
+    await chat_locks.run(chat_id, "send_now", advance)
+
+
 @router.poll()
 async def on_poll_finished(poll: types.Poll):
     if poll.is_closed:
@@ -53,24 +184,28 @@ async def on_poll_finished(poll: types.Poll):
 
         poll_dbt = await data_manager.get_poll_by_tg_poll_id(tg_poll_id=poll_id)
         if poll_dbt:
-            winner_poll_option_dbt = await data_manager.finishing_poll_process(tg_poll_id=poll_id)
-            if winner_poll_option_dbt and winner_poll_option_dbt.code_line:
-                await bot.send_message(
-                    poll_dbt.chat_id,
-                    f"Победившая строка:\n```\n{winner_poll_option_dbt.code_line}\n```",
-                    parse_mode="Markdown"
-                )
+            async def finish():
+                winner_poll_option_dbt = await data_manager.finishing_poll_process(tg_poll_id=poll_id)
+                await announce_winner(bot, poll_dbt.chat_id, winner_poll_option_dbt)
+
+            await chat_locks.run(poll_dbt.chat_id, ("poll", poll_id), finish)
+
+@router.chat_member()
+async def on_chat_member(update: types.ChatMemberUpdated):
+    # назначение/снятие админа группы - сразу в кэш ролей, без get_administrators
+    await admin_cache.update_member(update.chat.id, update.new_chat_member.user.id, update.new_chat_member.status)
+
 
 @router.poll_answer()
 async def on_poll_answer(update: types.PollAnswer):
     print("received poll anwer", update)
     tg_poll_id = update.poll_id
     user_id: int | None = update.user.id
-    poll_answer_index = None
-    if update.option_ids:
-        poll_answer_index = update.option_ids[0]
-        await data_manager.register_poll_answer(tg_poll_id=tg_poll_id, user_id=user_id, option_index=poll_answer_index)
-        # TODO retract vote []
+    # пустой option_ids - пользователь отозвал голос
+    poll_answer_index = update.option_ids[0] if update.option_ids else None
+    chat_id = await data_manager.register_poll_answer(tg_poll_id=tg_poll_id, user_id=user_id, option_index=poll_answer_index)
+    if speculator and chat_id:
+        speculator.register_vote(chat_id, user_id, poll_answer_index)
     
 
 
@@ -79,32 +214,27 @@ async def cmd_start(message: types.Message, role: RolesEnum, llm_configurable: d
     
     if role in (RolesEnum.ADMIN, RolesEnum.OWNER, RolesEnum.GROUP_ADMIN):
         await message.answer(text="Вот что я имею (взгляни в меню)", reply_markup=get_keyboard_for_role(role))
-        # Очищение истории чата (перевод активного опроса чата в rejected на случай если это повторное использование):
-        await data_manager.clear_chat_history(chat_id=message.chat.id)
-        await state.clear()
-        await message.reply("История очищена, отправляю первый опрос.")
-        
-        # Генерация новой ветки опроса:
-        options = (await llm_agent.ainvoke(input=LLMInput(mode=AgentInputModes.ZERO, history=[]), config=llm_configurable)).get("final") or ("1", "2", "3", "4")
-        question = "Выберите первую строку кода:"
-
-        sent_poll = await message.answer_poll(
-            question=question,
-            options=options,
-            is_anonymous=False,
-            type="regular",
-            allows_multiple_answers=False
-        )
-        tg_poll_id = sent_poll.poll.id
-        await data_manager.register_poll(
-            tg_poll_id=tg_poll_id,
-            chat_id=message.chat.id,
-            message_id=sent_poll.message_id,
-            options=options)
+        await chat_locks.run(message.chat.id, "start", lambda: start_history(message, llm_configurable, state))
     else:
         return await message.reply("Права на команду /start только у админа.")     
 
 
+async def start_history(message: types.Message, llm_configurable: dict, state: FSMContext):
+    # Очищение истории чата (перевод активного опроса чата в rejected на случай если это повторное использование):
+    history_version = await data_manager.clear_chat_history(chat_id=message.chat.id)
+    poll_scheduler.cancel(message.chat.id)
+    pin_session(message.chat.id, history_version)
+    await state.clear()
+    await message.reply("История очищена, отправляю первый опрос.")
+    
+    # Генерация новой ветки опроса:
+    options = (await run_agent(LLMInput(mode=AgentInputModes.ZERO, history=[]), llm_configurable, history_version)).get("final") or fallback_candidates([])
+    question = "Выберите первую строку кода:"
+    await post_poll(message.bot, message.chat.id, question, options)
+    if speculator:
+        speculator.schedule(message.chat.id, "", options)
+
+
 @router.message(Command(CommandsEnum.HELP.value))
 async def cmd_help(message: types.Message):
     await message.answer("Вы нажали кнопку помощи.")
@@ -121,61 +251,83 @@ async def cmd_code(message: types.Message):
 async def cmd_code_completed(message: types.Message, role: RolesEnum, llm_configurable: dict,):
     await message.answer("Вы нажали кнопку CODE_COMPLETED.")
     if role in (RolesEnum.ADMIN, RolesEnum.OWNER, RolesEnum.GROUP_ADMIN):
-        last_poll_id = await data_manager.get_last_poll_tg_id_by_chat_id(message.chat.id)
-        poll_dbt = await data_manager.close_poll(last_poll_id)
-        if poll_dbt:
-            try:
-                await message.bot.stop_poll(chat_id=poll_dbt.chat_id, message_id=poll_dbt.tg_message_id)
-            except Exception as e:
-                print(e)
-        # TODO sync
-        is_ok, current_code = await data_manager.get_current_code(chat_id=message.chat.id, markdown=False)
-        if is_ok:
-            completed_code = (await llm_agent.ainvoke(input=LLMInput(mode=AgentInputModes.COMPLETE, history=[current_code]), config=llm_configurable)).get("completed_code")
+        await chat_locks.run(message.chat.id, "code_completed", lambda: complete_code(message, llm_configurable))
+    else:
+        await message.answer("Выполнение команды ограничено: только для администраторов")
+
+
+async def complete_code(message: types.Message, llm_configurable: dict):
+    poll_dbt = await finish_last_poll(message.bot, message.chat.id)
+    if poll_dbt:
+        try:
+            await message.bot.stop_poll(chat_id=poll_dbt.chat_id, message_id=poll_dbt.tg_message_id)
+        except Exception as e:
+            print(e)
+    is_ok, current_code = await data_manager.get_current_code(chat_id=message.chat.id, markdown=False)
+    history_version = await data_manager.get_history_version(message.chat.id)
+    pin_session(message.chat.id, history_version)
+    if is_ok and appctx.LLM_STREAM_COMPLETE:
+        try:
+            # код появляется в одном сообщении по мере генерации, файл - в конце
+            completed_code = await stream_to_message(
+                message, llm_generator.astream_auto_complete([current_code]),
+                interval=appctx.STREAM_EDIT_INTERVAL)
+        except StreamInterrupted as e:
+            # оборванный стрим не сохраняем - доделываем обычным вызовом ниже
+            print("complete stream fallback:", repr(e))
+            await message.answer("Генерация прервалась, пробую ещё раз.")
+        else:
             is_ok, dm_scc_msg = await data_manager.save_complete_code(chat_id=message.chat.id, base_code_text=current_code, completed_code_text=completed_code)
             await message.answer(dm_scc_msg)
             if is_ok:
-                await message.answer(to_markdown(code_text=completed_code), parse_mode="Markdown")
                 await send_py_from_memory(message=message, code_text=completed_code)
-    else:
-        await message.answer("Выполнение команды ограничено: только для администраторов")
+            return None
+    if is_ok:
+        result = await run_agent(LLMInput(mode=AgentInputModes.COMPLETE, history=[current_code]), llm_configurable, history_version)
+        if result.get("degraded"):
+            # LLM недоступна: код не дополнен - отдаём как есть и ничего не сохраняем
+            await message.answer("Не удалось дополнить код, отправляю текущий.")
+            await send_py_from_memory(message=message, code_text=current_code)
+            return None
+        completed_code = result.get("completed_code")
+        is_ok, dm_scc_msg = await data_manager.save_complete_code(chat_id=message.chat.id, base_code_text=current_code, completed_code_text=completed_code)
+        await message.answer(dm_scc_msg)
+        if is_ok:
+            await message.answer(to_markdown(code_text=completed_code), parse_mode="Markdown")
+            await send_py_from_memory(message=message, code_text=completed_code)
 
 
 @router.message(Command(CommandsEnum.SEND_NOW.value))
 async def cmd_send_now(message: types.Message, role: RolesEnum, llm_configurable):
     if role in (RolesEnum.ADMIN, RolesEnum.OWNER, RolesEnum.GROUP_ADMIN):
-        last_poll_id = await data_manager.get_last_poll_tg_id_by_chat_id(message.chat.id)
-        poll_dbt = await data_manager.close_poll(last_poll_id)
-        if poll_dbt:
-            try:
-                await message.bot.stop_poll(chat_id=poll_dbt.chat_id, message_id=poll_dbt.tg_message_id)
-                await message.reply("Опрос завершен, отправляю новый.")
-            except Exception as e:
-                print(e)
-        # TODO sync
-        is_ok, current_code = await data_manager.get_current_code(chat_id=message.chat.id, markdown=False)
-        if is_ok:
-            options = (await llm_agent.ainvoke(input=LLMInput(mode=AgentInputModes.NEXT, history=[current_code]), config=llm_configurable)).get("final") or ("1", "2", "3", "4")
-            question = "Выберите следующую строку кода:"
-
-            sent_poll = await message.answer_poll(
-                question=question,
-                options=options,
-                is_anonymous=False,
-                type="regular",
-                allows_multiple_answers=False
-            )
-            tg_poll_id = sent_poll.poll.id
-            await data_manager.register_poll(
-                tg_poll_id=tg_poll_id,
-                chat_id=message.chat.id,
-                message_id=sent_poll.message_id,
-                options=options)
+        await chat_locks.run(message.chat.id, "send_now", lambda: send_next_poll(message.bot, message.chat.id, llm_configurable))
+
+
+async def send_next_poll(bot, chat_id: int, llm_configurable: dict):
+    poll_dbt = await finish_last_poll(bot, chat_id)
+    if poll_dbt:
+        try:
+            await bot.stop_poll(chat_id=poll_dbt.chat_id, message_id=poll_dbt.tg_message_id)
+            await bot.send_message(chat_id, "Опрос завершен, отправляю новый.")
+        except Exception as e:
+            print(e)
+    is_ok, current_code = await data_manager.get_current_code(chat_id=chat_id, markdown=False)
+    history_version = await data_manager.get_history_version(chat_id)
+    pin_session(chat_id, history_version)
+    if is_ok:
+        # если вариант для этого кода уже предсчитан пока шёл опрос - берём его
+        options = await speculator.take(chat_id, current_code) if speculator else None
+        if not options:
+            options = (await run_agent(LLMInput(mode=AgentInputModes.NEXT, history=[current_code]), llm_configurable, history_version)).get("final") or fallback_candidates([current_code])
+        question = "Выберите следующую строку кода:"
+        await post_poll(bot, chat_id, question, options)
+        if speculator:
+            speculator.schedule(chat_id, current_code, options)
 
 
 @router.message(Command(CommandsEnum.HEALTH.value))
 async def cmd_health(message: types.Message):
-    await message.answer("Вы нажали кнопку HEALTH.")
+    await message.answer(await health_report(uow_factory, message.chat.id))
 
 
 @router.message(Command(CommandsEnum.LOGS.value))
@@ -0,0 +1,115 @@
+import time
+import json
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Optional
+
+import aiosqlite
+
+
+class LLMResponseCache:
+    """
+    Content-addressed кэш ответов LLM.
+
+    Ключ - хэш (model, temperature, top_p, prompt).
+    Два уровня:
+    - LRU в памяти (всегда);
+    - SQLite на диске (опционально, если передан db_path) - переживает рестарт.
+    TTL задаётся отдельно для каждого режима (zero / next / evaluate / complete),
+    TTL <= 0 означает "не кэшировать".
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1024,
+        ttls: Optional[dict[str, int]] = None,
+        db_path: Optional[str] = None,
+    ):
+        self.max_size = max_size
+        self.ttls = ttls or {}
+        self.db_path = db_path or None
+        self._memory: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._db: Optional[aiosqlite.Connection] = None
+        self._db_lock = asyncio.Lock()
+        self.stats = {"hits": 0, "misses": 0, "memory_hits": 0, "db_hits": 0}
+
+    @staticmethod
+    def make_key(model: str, temperature: Optional[float], top_p: Optional[float], prompt: str) -> str:
+        raw = json.dumps([model, temperature, top_p, prompt], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, mode: str) -> int:
+        return int(self.ttls.get(mode, 0))
+
+    async def _get_db(self) -> Optional[aiosqlite.Connection]:
+        if not self.db_path:
+            return None
+        async with self._db_lock:
+            if self._db is None:
+                self._db = await aiosqlite.connect(self.db_path)
+                await self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS llm_cache ("
+                    "key TEXT PRIMARY KEY, mode TEXT, value TEXT, expires_at REAL)"
+                )
+                await self._db.commit()
+        return self._db
+
+    def _remember(self, key: str, expires_at: float, value: str) -> None:
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[str]:
+        now = time.time()
+
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["memory_hits"] += 1
+                return value
+            del self._memory[key]
+
+        db = await self._get_db()
+        if db is not None:
+            async with db.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is not None:
+                value, expires_at = row
+                if expires_at > now:
+                    # поднимаем в память
+                    self._remember(key, expires_at, value)
+                    self.stats["hits"] += 1
+                    self.stats["db_hits"] += 1
+                    return value
+                await db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                await db.commit()
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: str, mode: str, ttl: Optional[int] = None) -> None:
+        ttl = self.ttl_for(mode) if ttl is None else ttl
+        if ttl <= 0 or not isinstance(value, str):
+            return None
+        expires_at = time.time() + ttl
+        self._remember(key, expires_at, value)
+
+        db = await self._get_db()
+        if db is not None:
+            await db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, mode, value, expires_at) VALUES (?, ?, ?, ?)",
+                (key, mode, value, expires_at),
+            )
+            await db.commit()
+
+    async def close(self) -> None:
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
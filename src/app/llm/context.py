@@ -0,0 +1,187 @@
+import ast
+import re
+from typing import List, Optional, Tuple
+
+from app.llm.throttle import estimate_tokens
+
+
+HEADER_RE = re.compile(r"^\s*(async\s+def|def|class|if|elif|else|for|async\s+for|while|try|except|finally|with|async\s+with|match|case)\b.*:\s*(#.*)?$")
+SIGNATURE_RE = re.compile(r"^\s*(async\s+def|def|class)\s|^\s*@")
+IMPORT_RE = re.compile(r"^(import|from)\s")
+CONSTANT_RE = re.compile(r"^[A-Z_][A-Z0-9_]*\s*(:[^=]*)?=")
+CONSTANT_NAME_RE = re.compile(r"^[A-Z_][A-Z0-9_]*$")
+
+# (объемлющие блоки хвоста, группы строк импортов, группы строк сигнатур/констант) - индексы с 0
+Outline = Tuple[set, List[List[int]], List[List[int]]]
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip(" "))
+
+
+def _render(lines: List[str], keep: set[int]) -> str:
+    """Выбранные строки; каждый непрерывный пропуск - одна строка `...` с отступом первой выкинутой."""
+    out = []
+    i = 0
+    while i < len(lines):
+        if i in keep:
+            out.append(lines[i])
+            i += 1
+            continue
+        start = i
+        while i < len(lines) and i not in keep:
+            i += 1
+        dropped = [l for l in lines[start:i] if l.strip()]
+        if dropped:
+            out.append(" " * _indent(dropped[0]) + "...")
+    return "\n".join(out)
+
+
+def _parse(lines: List[str]) -> Optional[ast.Module]:
+    """Разбор частичной программы; заголовок блока без тела в конце дополняем `pass`."""
+    code = "\n".join(lines)
+    try:
+        return ast.parse(code)
+    except SyntaxError:
+        pass
+    last = next((l for l in reversed(lines) if l.strip()), "")
+    if not last.rstrip().endswith(":"):
+        return None
+    try:
+        return ast.parse(code + "\n" + " " * (_indent(last) + 4) + "pass")
+    except SyntaxError:
+        return None
+
+
+def _span(first: int, last: int) -> List[int]:
+    """Номера строк ast (с 1, включительно) -> индексы строк (с 0)."""
+    return list(range(first - 1, last))
+
+
+def _signature(node: ast.AST) -> List[int]:
+    """Декораторы и заголовок def/class до первой инструкции тела (многострочные сигнатуры целиком)."""
+    start = min([node.lineno] + [d.lineno for d in node.decorator_list])
+    return _span(start, max(node.lineno, node.body[0].lineno - 1))
+
+
+def _block_header(node: ast.AST, lines: List[str], target: int) -> List[int]:
+    """Строки заголовка блока node, внутри которого строка target (+ строка else:/finally:, если target там)."""
+    start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+    header = _span(start, max(node.lineno, node.body[0].lineno - 1))
+    for field in ("orelse", "finalbody"):
+        block = getattr(node, field, None) or []
+        if not block or not block[0].lineno <= target <= block[-1].end_lineno:
+            continue
+        if lines[block[0].lineno - 1].lstrip().startswith("elif"):
+            # elif - отдельный узел If со своим заголовком
+            break
+        # строки else:/finally: в ast нет - ищем ближайшую выше с отступом самого блока
+        for number in range(block[0].lineno - 1, node.lineno, -1):
+            line = lines[number - 1]
+            if line.strip() and not line.lstrip().startswith("#") and _indent(line) == node.col_offset:
+                header.append(number - 1)
+                break
+    return header
+
+
+def _ast_outline(lines: List[str], tail_start: int) -> Optional[Outline]:
+    """Разметка по ast: заголовки объемлющих блоков, импорты, сигнатуры и константы модуля."""
+    tree = _parse(lines)
+    if tree is None:
+        return None
+    target = tail_start + 1
+    enclosing = set()
+    signatures: List[List[int]] = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            group = _signature(node)
+            if group[0] < tail_start:
+                signatures.append(group)
+        if isinstance(node, ast.match_case):
+            # у case нет своих координат - заголовок по шаблону
+            if node.pattern.lineno < target <= node.body[-1].end_lineno:
+                enclosing |= set(_span(node.pattern.lineno, max(node.pattern.lineno, node.body[0].lineno - 1)))
+        elif isinstance(node, (ast.stmt, ast.excepthandler)) and getattr(node, "body", None):
+            if node.lineno < target <= node.end_lineno:
+                enclosing |= set(_block_header(node, lines, target))
+
+    imports: List[List[int]] = []
+    for node in tree.body:
+        if node.lineno > tail_start:
+            break
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.append(_span(node.lineno, node.end_lineno))
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            if all(isinstance(t, ast.Name) and CONSTANT_NAME_RE.match(t.id) for t in targets):
+                signatures.append(_span(node.lineno, node.end_lineno))
+    signatures.sort()
+    return enclosing, imports, signatures
+
+
+def _indent_outline(lines: List[str], tail_start: int) -> Outline:
+    """Та же разметка по отступам и регуляркам - для истории, которую ast не разбирает."""
+    enclosing = set()
+    tail = [l for l in lines[tail_start:] if l.strip()]
+    cur_indent = min((_indent(l) for l in tail), default=0)
+    for i in range(tail_start - 1, -1, -1):
+        line = lines[i]
+        if not line.strip():
+            continue
+        if _indent(line) < cur_indent and HEADER_RE.match(line):
+            enclosing.add(i)
+            cur_indent = _indent(line)
+            if cur_indent == 0:
+                break
+
+    imports, signatures = [], []
+    for i, line in enumerate(lines[:tail_start]):
+        if i in enclosing:
+            continue
+        stripped = line.strip()
+        if _indent(line) == 0 and IMPORT_RE.match(stripped):
+            imports.append([i])
+        elif SIGNATURE_RE.match(line) or (_indent(line) == 0 and CONSTANT_RE.match(stripped)):
+            signatures.append([i])
+    return enclosing, imports, signatures
+
+
+def compact_history(history: List[str], token_budget: int = 1500, keep_last: int = 20) -> str:
+    """
+    Сжатие истории для NEXT_LINE_PROMPT на длинных программах.
+
+    Оставляем:
+    - последние keep_last строк (текущий блок);
+    - заголовки всех объемлющих блоков этих строк (def/class/if/for/...);
+    - импорты, сигнатуры def/class с декораторами и модульные константы;
+    тела завершённых функций и классов сворачиваются в `...`.
+    Разметка - по ast (многострочные сигнатуры и импорты целиком, def/class в строках и
+    докстрингах - не код); если частичная программа не разбирается - по отступам и регуляркам.
+    Если и этого больше token_budget - выкидываем самые старые сигнатуры/константы, затем импорты.
+    Короткая история возвращается как есть.
+    """
+    code = "\n".join(history).replace("\t", "    ")
+    if estimate_tokens(code) <= token_budget:
+        return code
+
+    lines = code.splitlines()
+    tail_start = max(0, len(lines) - keep_last)
+    keep = set(range(tail_start, len(lines)))
+
+    enclosing, imports, signatures = _ast_outline(lines, tail_start) or _indent_outline(lines, tail_start)
+    keep |= enclosing
+    # заголовок объемлющего блока не выкидываем вместе с сигнатурами
+    imports = [[i for i in group if i not in enclosing] for group in imports]
+    signatures = [[i for i in group if i not in enclosing] for group in signatures]
+    for group in imports + signatures:
+        keep |= set(group)
+
+    rendered = _render(lines, keep)
+    # бюджет всё ещё превышен: сначала старые сигнатуры, потом импорты
+    for droppable in (signatures, imports):
+        for group in droppable:
+            if estimate_tokens(rendered) <= token_budget:
+                return rendered
+            keep -= set(group)
+            rendered = _render(lines, keep)
+    return rendered
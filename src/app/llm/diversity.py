@@ -0,0 +1,215 @@
+import io
+import re
+import ast
+import math
+import tokenize
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.llm.scoring import indent_of
+
+
+TOKEN_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+(?:\.\d+)?|\"[^\"]*\"|'[^']*'|\S")
+SKIP_TOKENS = {tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT,
+               tokenize.ENDMARKER}
+
+Embed = Callable[[List[str]], Awaitable[List[List[float]]]]
+
+
+def _normalize_literal(token: str) -> str:
+    """'a' и "a" - одна и та же строка."""
+    try:
+        return repr(ast.literal_eval(token))
+    except Exception:
+        return token
+
+
+def normalize_tokens(line: str) -> Tuple[str, ...]:
+    """
+    Токены строки без комментариев и пробелов, литералы строк в едином виде.
+    `    pass  # TODO` и `    pass` дают одинаковые токены.
+    """
+    text = line.strip()
+    tokens = []
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(text + "\n").readline):
+            if tok.type in SKIP_TOKENS:
+                continue
+            tokens.append(_normalize_literal(tok.string) if tok.type == tokenize.STRING else tok.string)
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        # незакрытые скобки/строки - грубое разбиение регуляркой
+        tokens = [_normalize_literal(t) if t[0] in "\"'" else t for t in TOKEN_RE.findall(text.split("#", 1)[0])]
+    return tuple(tokens)
+
+
+def fingerprint(line: str) -> Tuple[int, Tuple[str, ...]]:
+    """Отпечаток: отступ важен (другой уровень блока - другая строка), пробелы и комментарии - нет."""
+    return indent_of(line), normalize_tokens(line)
+
+
+def shingles(tokens: Sequence[str]) -> set:
+    """Униграммы + биграммы токенов: короткие строки тоже дают осмысленное пересечение."""
+    result = set(tokens)
+    result.update(zip(tokens, tokens[1:]))
+    return result
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class EmbeddingCache:
+    """LRU векторов в памяти процесса: одну и ту же строку в /embeddings повторно не шлём."""
+
+    def __init__(self, embed: Embed, max_size: int = 4096):
+        self.embed = embed
+        self.max_size = max_size
+        self._vectors: OrderedDict[str, List[float]] = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "calls": 0}
+
+    async def get_many(self, texts: List[str]) -> Dict[str, List[float]]:
+        result, missing = {}, []
+        for text in dict.fromkeys(texts):
+            vector = self._vectors.get(text)
+            if vector is None:
+                missing.append(text)
+                continue
+            self._vectors.move_to_end(text)
+            result[text] = vector
+        self.stats["hits"] += len(result)
+        self.stats["misses"] += len(missing)
+
+        if missing:
+            # все недостающие строки - одним батчем
+            self.stats["calls"] += 1
+            vectors = await self.embed(missing)
+            if len(vectors) != len(missing):
+                # без пары текст-вектор не понять, какой вектор чей - в кэш такое не кладём
+                raise ValueError(f"embeddings: {len(vectors)} vectors for {len(missing)} texts")
+            for text, vector in zip(missing, vectors):
+                result[text] = vector
+                self._vectors[text] = vector
+                if len(self._vectors) > self.max_size:
+                    self._vectors.popitem(last=False)
+        return result
+
+
+class DiversitySelector:
+    """
+    Выбор top-k вариантов опроса без почти-дубликатов.
+
+    1. одинаковый отпечаток (отступ + нормализованные токены) - дубликат, остаётся лучший по оценке;
+    2. Jaccard по шинглам токенов: >= dup_threshold - дубликат, < ambiguous_threshold - точно разные;
+    3. спорные пары - косинус эмбеддингов (один батч /embeddings на выборку, векторы кэшируются);
+    4. жадный MMR: на каждом шаге лучший по оценке минус штраф за похожесть на уже выбранные.
+    """
+
+    def __init__(
+        self,
+        embeddings: Optional[EmbeddingCache] = None,
+        dup_threshold: float = 0.8,
+        ambiguous_threshold: float = 0.5,
+        embed_threshold: float = 0.92,
+        diversity_weight: float = 0.3,
+        min_options: int = 2,
+    ):
+        self.embeddings = embeddings
+        self.dup_threshold = dup_threshold
+        self.ambiguous_threshold = ambiguous_threshold
+        self.embed_threshold = embed_threshold
+        self.diversity_weight = diversity_weight
+        # в опросе Telegram должно быть хотя бы 2 варианта - добираем из дубликатов, если иначе не выходит
+        self.min_options = min_options
+
+    async def _similarities(self, candidates: List[str]) -> Tuple[Dict[Tuple[int, int], float], set]:
+        token_sets = [shingles(normalize_tokens(c)) for c in candidates]
+        sims, duplicates, ambiguous = {}, set(), []
+        for i in range(len(candidates)):
+            for j in range(i + 1, len(candidates)):
+                sim = jaccard(token_sets[i], token_sets[j])
+                if indent_of(candidates[i]) != indent_of(candidates[j]):
+                    # разный уровень блока - не дубликаты, но похожесть для MMR учитываем
+                    sims[(i, j)] = sim / 2
+                    continue
+                sims[(i, j)] = sim
+                if sim >= self.dup_threshold:
+                    duplicates.add((i, j))
+                elif sim >= self.ambiguous_threshold:
+                    ambiguous.append((i, j))
+
+        if ambiguous and self.embeddings is not None:
+            texts = [candidates[k].strip() for pair in ambiguous for k in pair]
+            try:
+                vectors = await self.embeddings.get_many(texts)
+            except Exception as e:
+                print("embeddings fallback:", repr(e))
+                vectors = None
+            if vectors:
+                for i, j in ambiguous:
+                    a, b = vectors.get(candidates[i].strip()), vectors.get(candidates[j].strip())
+                    if not a or not b or len(a) != len(b):
+                        # для пары нет векторов - остаётся оценка по Jaccard
+                        continue
+                    sim = cosine(a, b)
+                    sims[(i, j)] = sim
+                    if sim >= self.embed_threshold:
+                        duplicates.add((i, j))
+        return sims, duplicates
+
+    async def select(self, scored: List[Tuple[float, str]], k: int = 4) -> List[str]:
+        """scored - (оценка, строка); на выходе до k строк, лучшие и непохожие друг на друга."""
+        ranked = sorted(scored, key=lambda x: x[0], reverse=True)
+
+        # 1. точные дубликаты по отпечатку
+        seen, candidates, scores, dropped = set(), [], [], []
+        for score, line in ranked:
+            fp = fingerprint(line)
+            if fp in seen:
+                dropped.append(line)
+                continue
+            seen.add(fp)
+            candidates.append(line)
+            scores.append(score)
+        if len(candidates) <= 1:
+            return (candidates + dropped)[:max(len(candidates), min(self.min_options, k))]
+
+        sims, duplicates = await self._similarities(candidates)
+        top, bottom = max(scores), min(scores)
+        spread = (top - bottom) or 1.0
+        norm = [(s - bottom) / spread for s in scores]
+
+        def pair(a, b):
+            return (a, b) if a < b else (b, a)
+
+        # 2. жадный MMR без дубликатов уже выбранных
+        selected = [0]
+        rest = list(range(1, len(candidates)))
+        while rest and len(selected) < k:
+            best, best_value = None, None
+            for i in rest:
+                if any(pair(i, s) in duplicates for s in selected):
+                    continue
+                value = norm[i] - self.diversity_weight * max(sims[pair(i, s)] for s in selected)
+                if best_value is None or value > best_value:
+                    best, best_value = i, value
+            if best is None:
+                break
+            selected.append(best)
+            rest.remove(best)
+
+        # 3. меньше минимума для опроса - добираем лучших из отсеянных
+        for i in rest:
+            if len(selected) >= min(self.min_options, k):
+                break
+            selected.append(i)
+        # в опросе - в порядке оценки
+        result = [candidates[i] for i in sorted(selected)]
+        return result + dropped[:max(0, min(self.min_options, k) - len(result))]
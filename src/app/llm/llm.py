@@ -1,17 +1,32 @@
 import json
 from typing import List
 from app.llm.prompts import (FIRST_LINE_PROMPT, NEXT_LINE_PROMPT,
-                      EVALUATION_PROMPT, COMPLETE_PROMPT)
-from typing import List, TypedDict, Optional
-from langchain_gigachat import GigaChat
+                      EVALUATION_PROMPT, COMPLETE_PROMPT,
+                      FIRST_LINE_SINGLE_PROMPT, NEXT_LINE_SINGLE_PROMPT)
+from typing import List, TypedDict, Optional, AsyncIterator
+from langchain_gigachat import GigaChat, GigaChatEmbeddings
+from langchain_core.messages import AIMessage, HumanMessage
 from langgraph.graph.state import StateGraph, START, END
 # from langgraph.checkpoint.memory import InMemorySaver
 
 from enum import Enum, auto
 import ast
+import random
+import asyncio
+from contextlib import aclosing
 from functools import wraps
 import json
 from app.settings import AppCTXSettings
+from app.enums import AgentInputModes
+from app.llm.cache import LLMResponseCache
+from app.llm.scoring import score_candidates, is_clear_separation
+from app.llm.parsers import parse_llm_json, parse_alternatives
+from app.llm.resilience import CircuitBreaker, StreamInterrupted, call_with_resilience, fallback_candidates
+from app.llm.throttle import LLMScheduler, estimate_tokens
+from app.llm.context import compact_history
+from app.llm.session import PromptCacheStats
+from app.llm.diversity import DiversitySelector, EmbeddingCache
+from app.llm.runtime import GigaChatRuntime
 
 
 class LLMModelEnum(Enum):
@@ -25,6 +40,7 @@ class CodeState(TypedDict):
     drafts: List[str]                # черновые варианты
     final: List[str]                 # финальные 4 варианта
     completed_code: Optional[str]    # финальный код для complete
+    degraded: bool                   # ответ из эвристик без LLM - повторно из чекпоинта не отдаём
 
 
 def is_syntax_ok(line: str) -> bool:
@@ -34,42 +50,111 @@ def is_syntax_ok(line: str) -> bool:
     except Exception:
         return False
 
+def is_json_list(text: str) -> bool:
+    """Ответ генератора разбирается (в т.ч. терпимым парсером) в непустой список."""
+    parsed = parse_llm_json(text)
+    return isinstance(parsed, list) and bool(parsed)
+
+def is_json_dict(text: str) -> bool:
+    """Ответ судьи разбирается в непустой объект {строка: score} - список в кэш не кладём."""
+    parsed = parse_llm_json(text)
+    return isinstance(parsed, dict) and bool(parsed)
+
 def string_converter(func):
     @wraps(func)
     async def wrapper(*args, **kwargs):
         func_res = await func(*args, **kwargs)
-        return json.loads(func_res)
-        # return ast.literal_eval(func_res)
+        # терпимый разбор вместо json.loads: не падаем на чуть битом JSON
+        return parse_llm_json(func_res)
     return wrapper
 
 
 class LLMGenerator:
-    def __init__(self, app_config: AppCTXSettings, memory = None):
+    def __init__(self, app_config: AppCTXSettings, memory = None, cache: Optional[LLMResponseCache] = None,
+                 scheduler: Optional[LLMScheduler] = None):
         self.model = app_config.LLM_MODEL or "GigaChat-Max"
         self.llm = {
             LLMModelEnum.generator: GigaChat(
                 model=self.model, credentials=app_config.LLM_AUTHORIZATION_KEY, verify_ssl_certs=False,
-                temperature=0.6, top_p=0.9),
+                base_url=app_config.LLM_API_BASE_URL or None, temperature=0.6, top_p=0.9),
             LLMModelEnum.judge: GigaChat(
                 model=self.model, credentials=app_config.LLM_AUTHORIZATION_KEY, verify_ssl_certs=False,
-                temperature=0.1),
+                base_url=app_config.LLM_API_BASE_URL or None, temperature=0.1),
         }
+        # один клиент (пул соединений + токен) на обе модели
+        self.runtime = GigaChatRuntime(
+            credentials=app_config.LLM_AUTHORIZATION_KEY,
+            base_url=app_config.LLM_API_BASE_URL or None,
+            max_connections=app_config.LLM_MAX_CONNECTIONS,
+            refresh_margin=app_config.LLM_TOKEN_REFRESH_MARGIN)
+        self.runtime.attach(*self.llm.values())
+        self.graph_debug = app_config.LLM_GRAPH_DEBUG
         self.memory_saver = memory
+        if cache is None and app_config.LLM_CACHE_ENABLED:
+            cache = LLMResponseCache(
+                max_size=app_config.LLM_CACHE_MAX_SIZE,
+                ttls=app_config.LLM_CACHE_TTL,
+                db_path=app_config.LLM_CACHE_DB_PATH)
+        self.cache = cache
+        # температуры для параллельного режима генерации (пусто - обычный последовательный граф)
+        self.parallel_temperatures = list(app_config.LLM_PARALLEL_TEMPERATURES)
+        # multi-alternative: сколько вариантов просить у API в одном запросе (0 - JSON-список в ответе)
+        self.alternatives = app_config.LLM_ALTERNATIVES
+        # устойчивость: дедлайны по режимам, повторы с джиттером, circuit breaker на каждую модель
+        self.deadlines = dict(app_config.LLM_DEADLINES)
+        self.retries = app_config.LLM_RETRIES
+        self.breakers = {
+            llm_type: CircuitBreaker(
+                failure_threshold=app_config.LLM_BREAKER_THRESHOLD,
+                reset_timeout=app_config.LLM_BREAKER_RESET_TIMEOUT)
+            for llm_type in LLMModelEnum
+        }
+        # общий на процесс планировщик: лимит запросов в полёте, токены в минуту, честность по чатам
+        self.scheduler = scheduler or LLMScheduler(
+            max_in_flight=app_config.LLM_MAX_IN_FLIGHT,
+            tokens_per_minute=app_config.LLM_TOKENS_PER_MINUTE)
+        self.count_tokens_via_api = app_config.LLM_TOKEN_COUNT_VIA_API
+        # статистика кэширования префикса промпта на стороне провайдера
+        self.prompt_cache_stats = PromptCacheStats()
+        # сжатие истории в промптах генерации/оценки на длинных программах
+        self.history_token_budget = app_config.LLM_HISTORY_TOKEN_BUDGET
+        self.history_keep_last = app_config.LLM_HISTORY_KEEP_LAST
+        # локальный пре-скоринг: если он однозначно выделяет top-4, судью не зовём
+        self.local_scoring = app_config.LLM_LOCAL_SCORING
+        self.local_score_margin = app_config.LLM_LOCAL_SCORE_MARGIN
+        # отсев почти-дубликатов в итоговой четвёрке; эмбеддинги - только для спорных пар
+        self.diversity = None
+        if app_config.LLM_DIVERSITY_ENABLED:
+            embeddings = None
+            if app_config.LLM_EMBEDDINGS_ENABLED:
+                self.embedder = GigaChatEmbeddings(
+                    model=app_config.LLM_EMBEDDINGS_MODEL, credentials=app_config.LLM_AUTHORIZATION_KEY,
+                    verify_ssl_certs=False, base_url=app_config.LLM_API_BASE_URL or None)
+                self.embeddings_breaker = CircuitBreaker(
+                    failure_threshold=app_config.LLM_BREAKER_THRESHOLD,
+                    reset_timeout=app_config.LLM_BREAKER_RESET_TIMEOUT)
+                self.runtime.attach(self.embedder)
+                embeddings = EmbeddingCache(self.embed_texts, max_size=app_config.LLM_EMBEDDINGS_CACHE_SIZE)
+            self.diversity = DiversitySelector(
+                embeddings=embeddings,
+                dup_threshold=app_config.LLM_DIVERSITY_DUP_THRESHOLD,
+                ambiguous_threshold=app_config.LLM_DIVERSITY_AMBIGUOUS_THRESHOLD,
+                embed_threshold=app_config.LLM_EMBEDDINGS_DUP_THRESHOLD)
     
-    def pick_best_4(self, drafts, llm_scores):
+    async def start(self) -> None:
+        """Старт процесса: токен заранее и фоновое обновление."""
+        await self.runtime.start()
+
+    async def close(self) -> None:
+        await self.runtime.close()
+        if self.cache is not None:
+            await self.cache.close()
+
+    async def pick_best_4(self, drafts, llm_scores):
         # 1. длина
         drafts = [d for d in drafts if len(d) <= 95]
 
-        # 2. remove duplicates
-        seen = set()
-        uniq = []
-        for d in drafts:
-            if d not in seen:
-                uniq.append(d)
-                seen.add(d)
-        drafts = uniq
-
-        # 3. syntax boost
+        # 2. syntax boost
         scored = []
         for d in drafts:
             score = llm_scores.get(d, 0)
@@ -77,77 +162,360 @@ class LLMGenerator:
                 score += 20
             scored.append((score, d))
 
-        # 4. sort desc
-        scored.sort(reverse=True, key=lambda x: x[0])
+        # 3. top4 без почти-дубликатов (`pass` / `pass  # TODO` / другие пробелы)
+        if self.diversity is not None:
+            return await self.diversity.select(scored, k=4)
 
-        # 5. top4
-        return [d for (_, d) in scored[:4]]
+        # без стадии разнообразия - только точные дубликаты
+        seen = set()
+        uniq = []
+        for score, d in scored:
+            if d not in seen:
+                uniq.append((score, d))
+                seen.add(d)
+        uniq.sort(reverse=True, key=lambda x: x[0])
+        return [d for (_, d) in uniq[:4]]
+
+    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """Один батч-запрос /embeddings через общий планировщик, с дедлайном и своим breaker."""
+        deadline = self.deadlines.get("embeddings", self.deadlines.get("default", 30))
+        return await self.scheduler.run(
+            lambda: call_with_resilience(lambda: self.embedder.aembed_documents(texts),
+                                         breaker=self.embeddings_breaker, deadline=deadline, retries=0),
+            sum(estimate_tokens(t) for t in texts))
     
-    async def call_llm(self, prompt: str, type: LLMModelEnum = LLMModelEnum.generator) -> str:
-        return await self.llm[type].ainvoke(prompt)
+    def history_for_prompt(self, history: List[str]) -> str:
+        """История для промпта: целиком, либо AST/отступ-ориентированная выжимка в пределах бюджета."""
+        return compact_history(history, token_budget=self.history_token_budget, keep_last=self.history_keep_last)
+
+    def cache_key(self, prompt: str, type: LLMModelEnum = LLMModelEnum.generator,
+                  temperature: Optional[float] = None) -> str:
+        llm = self.llm[type]
+        if temperature is None:
+            temperature = llm.temperature
+        return LLMResponseCache.make_key(llm.model, temperature, llm.top_p, prompt)
+
+    def alternatives_cache_key(self, prompt: str, n: int, temperature: Optional[float] = None) -> str:
+        """Ключ кэша multi-alternative запроса: n входит в ключ, значение - JSON-список текстов."""
+        return self.cache_key(f"n={n}\n{prompt}", LLMModelEnum.generator, temperature=temperature)
+
+    def draft_prompt(self, history: List[str], mode: str, single: bool = False) -> str:
+        """
+        Промпт генерации черновиков.
+        single=True - одна строка на альтернативу (multi-alternative), иначе JSON-список в одном ответе.
+        """
+        if mode == AgentInputModes.ZERO.value:
+            return FIRST_LINE_SINGLE_PROMPT if single else FIRST_LINE_PROMPT
+        template = NEXT_LINE_SINGLE_PROMPT if single else NEXT_LINE_PROMPT
+        return template.format(history=self.history_for_prompt(history))
+
+    async def estimate_prompt_tokens(self, prompt: str, type: LLMModelEnum = LLMModelEnum.generator) -> int:
+        """
+        Оценка токенов запроса для лимита токенов в минуту: локально или через /tokens/count.
+        К промпту добавляем запас на ответ.
+        """
+        reply_reserve = 300
+        if self.count_tokens_via_api:
+            try:
+                counted = await self.llm[type].atokens_count([prompt])
+                return counted[0].tokens + reply_reserve
+            except Exception as e:
+                print("tokens/count failed:", repr(e))
+        return estimate_tokens(prompt) + reply_reserve
+
+    async def _invoke_llm(self, type: LLMModelEnum, mode: Optional[str], factory, prompt: str = ""):
+        """
+        Любой сетевой вызов модели - через планировщик (слот + токены),
+        дедлайн режима, повторы и breaker этой модели.
+        Слот берётся снаружи: ожидание в локальной очереди не съедает дедлайн и не считается
+        отказом провайдера в breaker, повторы не встают в конец очереди.
+        """
+        deadline = self.deadlines.get(mode or "default", self.deadlines.get("default", 30))
+        tokens = await self.estimate_prompt_tokens(prompt, type)
+        result = await self.scheduler.run(
+            lambda: call_with_resilience(factory, breaker=self.breakers[type], deadline=deadline,
+                                         retries=self.retries),
+            tokens)
+        # доля промпта из кэша провайдера (precached_prompt_tokens)
+        generations = getattr(result, "generations", None)
+        message = generations[0][0].message if generations and generations[0] else result
+        self.prompt_cache_stats.record(message, mode)
+        return result
+
+    async def call_llm(self, prompt: str, type: LLMModelEnum = LLMModelEnum.generator,
+                       mode: Optional[str] = None, validate=None,
+                       temperature: Optional[float] = None) -> AIMessage:
+        """
+        Вызов модели через кэш.
+        mode - режим для TTL кэша (zero / next / evaluate / complete), без mode не кэшируем.
+        validate - проверка ответа перед записью в кэш (например, что это валидный JSON).
+        temperature - переопределение температуры модели на один вызов.
+        """
+        kwargs = {} if temperature is None else {"temperature": temperature}
+        if self.cache is None or mode is None:
+            return await self._invoke_llm(type, mode, lambda: self.llm[type].ainvoke(prompt, **kwargs), prompt)
+
+        key = self.cache_key(prompt, type, temperature=temperature)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            return AIMessage(content=cached)
+
+        raw = await self._invoke_llm(type, mode, lambda: self.llm[type].ainvoke(prompt, **kwargs), prompt)
+        if validate is None or validate(raw.content):
+            await self.cache.set(key, raw.content, mode=mode)
+        return raw
+
+    async def call_llm_alternatives(self, prompt: str, n: int, mode: Optional[str] = None,
+                                    temperature: Optional[float] = None) -> List[str]:
+        """
+        Один запрос - n альтернатив (поле n / max_alternatives в API).
+        В кэш кладём JSON-список текстов альтернатив.
+        """
+        llm = self.llm[LLMModelEnum.generator]
+        kwargs = {"n": n}
+        if temperature is not None:
+            kwargs["temperature"] = temperature
+
+        key = None
+        if self.cache is not None and mode is not None:
+            key = self.alternatives_cache_key(prompt, n, temperature=temperature)
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return json.loads(cached)
+
+        result = await self._invoke_llm(
+            LLMModelEnum.generator, mode, lambda: llm.agenerate([[HumanMessage(content=prompt)]], **kwargs),
+            prompt)
+        texts = [g.text for g in result.generations[0]]
+        if key is not None and texts:
+            await self.cache.set(key, json.dumps(texts, ensure_ascii=False), mode=mode)
+        return texts
+
+    async def llm_generate_alternatives(self, history: List[str], mode: str,
+                                        temperature: Optional[float] = None) -> List[str]:
+        prompt = self.draft_prompt(history, mode, single=True)
+        texts = await self.call_llm_alternatives(prompt, n=self.alternatives, mode=mode, temperature=temperature)
+        drafts = parse_alternatives(texts)
+        if len(drafts) < 2:
+            # модель/эндпоинт не отдал альтернативы - откатываемся на JSON-список в одном ответе
+            return await self._llm_generate_json_batch(history, mode, temperature)
+        return drafts
 
     @string_converter
     async def llm_generate_first_line(self) -> List[str]:
-        raw = await self.call_llm(FIRST_LINE_PROMPT)
+        raw = await self.call_llm(FIRST_LINE_PROMPT, mode=AgentInputModes.ZERO.value, validate=is_json_list)
         return raw.content
 
     @string_converter
     async def llm_generate_next(self, history: List[str]) -> List[str]:
-        prompt = NEXT_LINE_PROMPT.format(history="\n".join(history))
-        raw = await self.call_llm(prompt)
+        prompt = NEXT_LINE_PROMPT.format(history=self.history_for_prompt(history))
+        raw = await self.call_llm(prompt, mode=AgentInputModes.NEXT.value, validate=is_json_list)
         # print("----")
         # print("llm_generate_next", raw.content)
         # print("----")
         return raw.content
 
+    async def llm_generate_batch(self, history: List[str], mode: str, temperature: float) -> List[str]:
+        """Один батч черновиков (zero или next) с заданной температурой."""
+        if self.alternatives:
+            return await self.llm_generate_alternatives(history, mode, temperature=temperature)
+        return await self._llm_generate_json_batch(history, mode, temperature)
+
     @string_converter
+    async def _llm_generate_json_batch(self, history: List[str], mode: str, temperature: Optional[float] = None) -> List[str]:
+        prompt = self.draft_prompt(history, mode)
+        raw = await self.call_llm(prompt, mode=mode, validate=is_json_list, temperature=temperature)
+        return raw.content
+
     async def llm_evaluate(self, history: List[str], drafts: List[str]) -> dict:
         prompt = EVALUATION_PROMPT.format(
-            history="\n".join(history),
+            history=self.history_for_prompt(history),
             candidates=drafts
         )
-        raw = await self.call_llm(prompt,LLMModelEnum.judge)
-        return raw.content
+        raw = await self.call_llm(prompt, LLMModelEnum.judge, mode="evaluate", validate=is_json_dict)
+        scores = parse_llm_json(raw.content)
+        if not isinstance(scores, dict) or not scores:
+            # пустой ответ или список вместо оценок - вызывающий ранжирует локально
+            raise ValueError(f"judge reply is not a score object: {raw.content[:100]!r}")
+        return scores
 
     async def llm_auto_complete(self, history: List[str]) -> str:
         prompt = COMPLETE_PROMPT.format(code="\n".join(history))
-        raw = await self.call_llm(prompt, LLMModelEnum.judge)
+        raw = await self.call_llm(prompt, LLMModelEnum.judge, mode=AgentInputModes.COMPLETE.value)
         return raw.content
 
+    async def astream_auto_complete(self, history: List[str]) -> AsyncIterator[str]:
+        """
+        Потоковый вариант llm_auto_complete (SSE, stream=true): отдаёт куски текста по мере генерации.
+        Дедлайн режима complete - на весь стрим, повторы и breaker - как в _invoke_llm, но повтор
+        возможен только пока не отдан ни один кусок. Любой обрыв - StreamInterrupted.
+        Из кэша отдаём ответ одним куском, полный ответ по окончании стрима кладём в кэш.
+        """
+        prompt = COMPLETE_PROMPT.format(code="\n".join(history))
+        mode = AgentInputModes.COMPLETE.value
+        key = None
+        if self.cache is not None:
+            key = self.cache_key(prompt, LLMModelEnum.judge)
+            cached = await self.cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+
+        llm = self.llm[LLMModelEnum.judge]
+        breaker = self.breakers[LLMModelEnum.judge]
+        loop = asyncio.get_running_loop()
+        tokens = await self.estimate_prompt_tokens(prompt, LLMModelEnum.judge)
+        # слот - один на все попытки, как в _invoke_llm: очередь не съедает дедлайн
+        async with self.scheduler.slot(tokens):
+            # дедлайн не через asyncio.timeout: между yield работает вызывающий код (правки сообщения),
+            # отмена по таймеру прилетела бы в него - ждём каждый кусок с остатком общего срока
+            deadline_at = loop.time() + self.deadlines.get(mode, self.deadlines.get("default", 30))
+            parts = []
+            attempt = 0
+            while True:
+                probe = breaker.state == "half_open"
+                if not breaker.allow():
+                    raise StreamInterrupted("LLM circuit is open")
+                # отмена или закрытие генератора (GeneratorExit) посреди стрима - не ошибка провайдера,
+                # но и не успех: пробу half_open отпускаем, иначе цепь больше не пропустит ни одного вызова
+                settled = False
+                try:
+                    async with aclosing(llm.astream(prompt)) as stream:
+                        while True:
+                            remaining = deadline_at - loop.time()
+                            if remaining <= 0:
+                                raise asyncio.TimeoutError("LLM deadline exceeded")
+                            try:
+                                chunk = await asyncio.wait_for(anext(stream), timeout=remaining)
+                            except StopAsyncIteration:
+                                break
+                            if chunk.content:
+                                parts.append(chunk.content)
+                                yield chunk.content
+                except Exception as e:
+                    breaker.record_failure()
+                    settled = True
+                    attempt += 1
+                    remaining = deadline_at - loop.time()
+                    if parts or attempt > self.retries or remaining <= 0:
+                        raise StreamInterrupted(f"completion stream failed: {e!r}") from e
+                    delay = random.uniform(0, min(4.0, 0.5 * 2 ** (attempt - 1)))
+                    print(f"LLM stream failed ({e!r}), retry {attempt}/{self.retries} in {delay:.2f}s")
+                    await asyncio.sleep(min(delay, remaining))
+                    continue
+                finally:
+                    if probe and not settled:
+                        breaker.release()
+                breaker.record_success()
+                break
+
+        if key is not None:
+            await self.cache.set(key, "".join(parts), mode=mode)
+
     
     async def generate_first(self, state: CodeState):
-        drafts = await self.llm_generate_first_line()
-        state["drafts"] = drafts
-        return state
+        try:
+            if self.alternatives:
+                drafts = await self.llm_generate_alternatives([], AgentInputModes.ZERO.value)
+            else:
+                drafts = await self.llm_generate_first_line()
+        except Exception as e:
+            print("generate_first fallback:", repr(e))
+            drafts = []
+        # узлы возвращают только изменённые каналы - чекпоинтер пишет лишь дельту шага
+        return {"drafts": drafts or fallback_candidates([]), "degraded": not drafts}
 
 
     async def generate_next(self, state: CodeState):
-        drafts = await self.llm_generate_next(state["history"])
-        state["drafts"] = drafts
-        return state
+        try:
+            if self.alternatives:
+                drafts = await self.llm_generate_alternatives(state["history"], AgentInputModes.NEXT.value)
+            else:
+                drafts = await self.llm_generate_next(state["history"])
+        except Exception as e:
+            print("generate_next fallback:", repr(e))
+            drafts = []
+        return {"drafts": drafts or fallback_candidates(state["history"]), "degraded": not drafts}
 
 
     async def evaluate(self, state: CodeState):
         drafts = state["drafts"]
         history = state["history"]
 
-        llm_scores = await self.llm_evaluate(history, drafts)
-        final = self.pick_best_4(drafts, llm_scores)
-
-        state["final"] = final
-        return state
+        llm_scores = None
+        if self.local_scoring:
+            local_scores = score_candidates(history, [d for d in drafts if len(d) <= 95])
+            if is_clear_separation(local_scores, top=4, margin=self.local_score_margin):
+                llm_scores = local_scores
+        if llm_scores is None:
+            try:
+                llm_scores = await self.llm_evaluate(history, drafts)
+            except Exception as e:
+                # судья недоступен - ранжируем локально
+                print("evaluate fallback:", repr(e))
+                llm_scores = score_candidates(history, drafts)
+        final = await self.pick_best_4(drafts, llm_scores)
+        return {"final": final}
+
+
+    async def generate_parallel(self, state: CodeState):
+        """
+        Параллельный режим: N генераций с разными температурами,
+        судья запускается на каждый батч сразу по готовности, не дожидаясь остальных.
+        Итог - одна выборка pick_best_4 по объединённым черновикам и оценкам.
+        """
+        history = state["history"]
+        mode = state["mode"]
+
+        gen_tasks = [
+            asyncio.create_task(self.llm_generate_batch(history, mode, t))
+            for t in self.parallel_temperatures
+        ]
+        judge_tasks = []
+        drafts: List[str] = []
+        for fut in asyncio.as_completed(gen_tasks):
+            try:
+                batch = await fut
+            except Exception as e:
+                print(e)
+                continue
+            batch = [d for d in batch if isinstance(d, str) and d not in drafts]
+            if not batch:
+                continue
+            drafts.extend(batch)
+            judge_tasks.append(asyncio.create_task(self.llm_evaluate(history, batch)))
+
+        llm_scores = {}
+        for scores in await asyncio.gather(*judge_tasks, return_exceptions=True):
+            if isinstance(scores, dict):
+                llm_scores.update(scores)
+        degraded = not drafts
+        if degraded:
+            drafts = fallback_candidates(history)
+        if not llm_scores:
+            llm_scores = score_candidates(history, drafts)
+
+        return {"drafts": drafts, "final": await self.pick_best_4(drafts, llm_scores), "degraded": degraded}
 
 
     async def auto_complete(self, state: CodeState):
-        completed = await self.llm_auto_complete(state["history"])
-        state["completed_code"] = completed
-        return state
+        try:
+            completed = await self.llm_auto_complete(state["history"])
+            degraded = False
+        except Exception as e:
+            # без LLM не "доделываем" - возвращаем код как есть
+            print("auto_complete fallback:", repr(e))
+            completed = "\n".join(state["history"])
+            degraded = True
+        return {"completed_code": completed, "degraded": degraded}
 
 
     def return_4(self, state: CodeState):
-        return state
+        return {}
     
     def route_by_mode(self, state: CodeState):
+        if state["mode"] in ("zero", "next") and self.parallel_temperatures:
+            return "parallel_drafts"
         if state["mode"] == "zero":
             return "zero_history"
         if state["mode"] == "next":
@@ -156,7 +524,28 @@ class LLMGenerator:
             return "auto_complete"
     
     
-    def build_graph(self):
+    async def ainvoke_resumable(self, graph, llm_input, config: dict) -> dict:
+        """
+        Вызов графа с продолжением по чекпоинту того же запроса (та же история, режим и history_version):
+        - прогон прервался (рестарт посреди графа) - досчитываем только оставшиеся узлы;
+        - прогон завершён, но ответ не дошёл до чата - отдаём сохранённый результат без вызовов LLM.
+        """
+        if self.memory_saver is not None:
+            snapshot = await graph.aget_state(config)
+            values = snapshot.values or {}
+            same_request = (
+                values.get("mode") == llm_input.mode
+                and values.get("history") == llm_input.history
+                and (snapshot.metadata or {}).get("history_version") == config["configurable"].get("history_version")
+            )
+            if same_request and snapshot.next:
+                return await graph.ainvoke(None, config)
+            if same_request and not values.get("degraded") and (values.get("final") or values.get("completed_code")):
+                return values
+        return await graph.ainvoke(llm_input, config)
+
+    def build_graph(self, checkpointer=None):
+        """checkpointer=False - граф без сохранения состояния (спекулятивные прогоны)."""
         graph = StateGraph(CodeState)
 
         graph.add_node("zero_history", self.generate_first)
@@ -164,19 +553,23 @@ class LLMGenerator:
         graph.add_node("evaluate", self.evaluate)
         graph.add_node("return4", self.return_4)
         graph.add_node("auto_complete", self.auto_complete)
+        graph.add_node("parallel_drafts", self.generate_parallel)
         
         graph.add_conditional_edges(START, self.route_by_mode, {
         "zero_history": "zero_history",
         "next_line": "next_line",
-        "auto_complete": "auto_complete"
+        "auto_complete": "auto_complete",
+        "parallel_drafts": "parallel_drafts",
     })
 
         graph.add_edge("zero_history", "evaluate")
         graph.add_edge("next_line", "evaluate")
         graph.add_edge("evaluate", "return4")
+        graph.add_edge("parallel_drafts", "return4")
         graph.add_edge("auto_complete", END)
 
-        return graph.compile(debug=True, checkpointer=self.memory_saver)
+        return graph.compile(debug=self.graph_debug,
+                             checkpointer=self.memory_saver if checkpointer is None else checkpointer)
     
 
 # import asyncio
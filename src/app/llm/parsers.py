@@ -0,0 +1,111 @@
+import re
+import ast
+import json
+from typing import Any, List
+
+
+QUOTES_MAP = str.maketrans({
+    "\u201c": '"', "\u201d": '"', "\u201e": '"', "\u00ab": '"', "\u00bb": '"',
+    "\u2018": "'", "\u2019": "'",
+    "\u00a0": " ", "\ufeff": "", "\u200b": "", "\u00ad": "",
+})
+FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*$")
+SCORE_RE = re.compile(r'"((?:[^"\\]|\\.)*)"\s*:\s*(-?\d+(?:\.\d+)?)')
+LIST_ITEM_RE = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Типографские кавычки -> ASCII, невидимые символы и markdown-ограды убираем."""
+    text = (text or "").translate(QUOTES_MAP)
+    lines = [l for l in text.splitlines() if not FENCE_RE.match(l.strip())]
+    # ведущие пробелы первой строки - это отступ кода, их не трогаем
+    return "\n".join(lines).strip("\r\n").rstrip()
+
+
+def _bracket_segment(text: str, opening: str, closing: str) -> str | None:
+    start = text.find(opening)
+    end = text.rfind(closing)
+    if start == -1 or end <= start:
+        return None
+    return text[start:end + 1]
+
+
+def _try_load(segment: str) -> Any:
+    for loader in (json.loads, ast.literal_eval):
+        try:
+            return loader(segment)
+        except Exception:
+            continue
+    # частая поломка: висячая запятая перед закрывающей скобкой
+    fixed = re.sub(r",\s*([\]}])", r"\1", segment)
+    if fixed != segment:
+        return _try_load(fixed)
+    return None
+
+
+def _strip_item(line: str) -> str:
+    line = LIST_ITEM_RE.sub("", line, count=1) if not line.startswith(" ") else line
+    line = line.rstrip().rstrip(",")
+    if len(line) >= 2 and line[0] == line[-1] and line[0] in "\"'":
+        line = line[1:-1]
+    return line
+
+
+def parse_llm_json(text: str) -> Any:
+    """
+    Терпимый разбор ответа модели вместо голого json.loads:
+    - ожидаем JSON-список строк (генерация) или JSON-объект {строка: score} (судья);
+    - чиним типографские кавычки, ```json-ограды, висячие запятые, одинарные кавычки;
+    - в крайнем случае список берём построчно, а оценки - регуляркой.
+    Никогда не бросает исключение: в худшем случае [] / {}.
+    """
+    text = normalize_text(text)
+    if not text.strip():
+        return []
+
+    list_pos, dict_pos = text.find("["), text.find("{")
+    expect_dict = dict_pos != -1 and (list_pos == -1 or dict_pos < list_pos)
+
+    if expect_dict:
+        segment = _bracket_segment(text, "{", "}")
+        loaded = _try_load(segment) if segment else None
+        if isinstance(loaded, dict):
+            return loaded
+        return {k: float(v) for k, v in SCORE_RE.findall(text)}
+
+    segment = _bracket_segment(text, "[", "]")
+    loaded = _try_load(segment) if segment else None
+    if isinstance(loaded, list):
+        return [str(item) for item in loaded if isinstance(item, (str, int, float))]
+    if isinstance(loaded, str):
+        return [loaded]
+
+    body = segment[1:-1] if segment else text
+    return [item for item in (_strip_item(l) for l in body.splitlines()) if item.strip()]
+
+
+def clean_single_line(text: str) -> str:
+    """Один вариант из alternatives: первая непустая строка кода, отступ сохраняем."""
+    text = normalize_text(text)
+    for line in text.splitlines():
+        if line.strip():
+            return _strip_item(line.replace("\t", "    ").rstrip())
+    return ""
+
+
+def parse_alternatives(texts: List[str]) -> List[str]:
+    """
+    Нормализация ответов multi-alternative запроса.
+    Если модель всё же вернула JSON-список в одной альтернативе - разворачиваем его.
+    """
+    result: List[str] = []
+    for text in texts:
+        stripped = normalize_text(text)
+        if stripped.lstrip().startswith("["):
+            candidates = parse_llm_json(stripped)
+        else:
+            candidates = [clean_single_line(stripped)]
+        for c in candidates:
+            if isinstance(c, str) and c.strip() and c not in result:
+                result.append(c)
+    return result
@@ -16,7 +16,7 @@ FIRST_LINE_PROMPT = """
 НИКАКОЙ разметки (например, ```json или других).
 """
 
-NEXT_LINE_PROMPT = """
+NEXT_LINE_STATIC = """
 Ты - профессиональный senior-разработчик на Python3.
 Ты генерируешь СЛЕДУЮЩУЮ строку Python-кода на основе истории.
 
@@ -33,6 +33,7 @@ NEXT_LINE_PROMPT = """
    - Приведи все tab → 4 spaces.
 2. ВОССТАНОВИ корректную структуру и отступы блока.
 3. НЕ копируй нечитаемые или невалидные символы в ответ.
+4. Строка `...` в истории - это свёрнутое тело уже завершённого блока, его не продолжай.
 
 Твоя задача:
 - Сгенерировать ровно ОДНУ строку кода, которая логически продолжает последнюю строку истории либо согласуется с ней / не противоречит.
@@ -57,8 +58,6 @@ NEXT_LINE_PROMPT = """
 (import, объявление функции/класса и т.п.). Пустой список возвращать НЕЛЬЗЯ.
 
 Выводи СТРОГО JSON и НИЧЕГО БОЛЬШЕ.
-Input Code:
-{history}
 
 Пример:
 ## 1-пример:
@@ -75,12 +74,56 @@ import random
 
 Ваши варианты:
 ["numbers = [1, 2, 3]", "def main()", ...]
+"""
+
+
+# Переменная часть всегда в конце промпта: статический префикс одинаков для всех чатов
+# и между опросами, поэтому провайдер может брать его из кэша (precached_prompt_tokens).
+HISTORY_TAIL = """
+# Текущая история кода
+Input Code:
+{history}
+"""
+
+NEXT_LINE_PROMPT = NEXT_LINE_STATIC + HISTORY_TAIL
+
+# Промпты для режима multi-alternative (n вариантов в одном запросе):
+# модель возвращает ОДНУ строку, разнообразие даёт сам API, JSON-обёртка не нужна.
+
+FIRST_LINE_SINGLE_PROMPT = """
+Ты - профессиональный senior-разработчик на Python3.
+Сгенерируй ПЕРВУЮ строку Python-кода для игры по коллективному написанию программы.
+
+Правила:
+- Никакой логики.
+- Строка должна быть безопасным стартовым элементом: import, объявление функции,
+  объявление класса и т.п.
+- Максимум 95 символов.
+- Не писать тела функций или классов.
+
+Верни РОВНО ОДНУ строку кода.
+НИКАКИХ пояснений, кавычек вокруг строки, JSON или разметки (```).
+"""
+
+NEXT_LINE_SINGLE_STATIC = """
+Ты - профессиональный senior-разработчик на Python3.
+Ты генерируешь СЛЕДУЮЩУЮ строку Python-кода на основе истории.
 
+Твоя задача:
+- Сгенерировать ровно ОДНУ строку кода, которая логически продолжает последнюю строку истории либо согласуется с ней / не противоречит.
+- Если нет очевидного логического продолжения, сгенерируй безопасную нейтральную строку, например: "import sys", "pass", "class Example:", "def main():", "if __name__ == '__main__':"
+- ТОЛЬКО продолжить текущий блок (учти отступы: 4 пробела на уровень, сохрани ведущие пробелы).
+- Строка `...` в истории - это свёрнутое тело уже завершённого блока, его не продолжай.
+- Максимум 95 символов.
+
+Верни РОВНО ОДНУ строку кода.
+НИКАКИХ пояснений, кавычек вокруг строки, JSON или разметки (```).
 """
 
+NEXT_LINE_SINGLE_PROMPT = NEXT_LINE_SINGLE_STATIC + HISTORY_TAIL
 
 
-EVALUATION_PROMPT = """
+EVALUATION_STATIC = """
 Ты - профессиональный senior-разработчик на Python3.
 Оцени каждую предложенную строку Python-кода по шкале от 0 до 100.
 
@@ -92,12 +135,6 @@ EVALUATION_PROMPT = """
 
 короткая (менее 95 символов).
 
-История:
-{history}
-
-Кандидаты:
-{candidates}
-
 Верните СТРОГО ТОЛЬКО JSON вида: {{ "<строка>": score }}
 БЕЗ каких-либо пояснений, комментариев или разметки (например, ```json)
 - Без дополнительных комментариев.
@@ -116,7 +153,16 @@ Return:
 {{ "    return None": some int score, "    pass": some int score, ... }}
 """
 
-COMPLETE_PROMPT = """
+EVALUATION_PROMPT = EVALUATION_STATIC + """
+# Оцени
+История:
+{history}
+
+Кандидаты:
+{candidates}
+"""
+
+COMPLETE_STATIC = """
 Ты - профессиональный senior-разработчик на Python3.
 Дополни следующий фрагмент Python-кода до полностью корректного и запускаемого кода.
 
@@ -129,9 +175,6 @@ COMPLETE_PROMPT = """
 - Максимальная длина каждой дополненной строки не должна превышать 95 символов c учетом отступов и пробелов
 - Если добавление нового кода излишне (он и так корректен и запускаем и соблюдены все правила), то ничего не добавляй
 
-# Код:
-{code}
-
 # Формат ответа:
 Верните ТОЛЬКО итоговый рабочий python-код,
 БЕЗ каких-либо комментариев, объяснений, форматирования или разметки (например, ```python).
@@ -163,3 +206,8 @@ async def generate_next(self, state: CodeState):
     state["drafts"] = drafts
     return state
 """
+
+COMPLETE_PROMPT = COMPLETE_STATIC + """
+# Код:
+{code}
+"""
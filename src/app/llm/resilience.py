@@ -0,0 +1,147 @@
+import time
+import random
+import asyncio
+from typing import Awaitable, Callable, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Цепь разомкнута: провайдер недавно падал, запрос не отправляем."""
+
+
+class StreamInterrupted(Exception):
+    """Стрим оборвался (ошибка, дедлайн, разомкнутая цепь): отданный текст неполный, сохранять его нельзя."""
+
+
+class CircuitBreaker:
+    """
+    Простой circuit breaker на одну модель.
+
+    closed    - запросы идут, ошибки подряд считаются;
+    open      - после failure_threshold ошибок подряд запросы не идут reset_timeout сек.;
+    half_open - после паузы пропускаем один пробный запрос: успех закрывает цепь, ошибка - снова open.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Пробный запрос отменён, не дав результата: цепь остаётся half_open, следующий вызов - новая проба."""
+        self._probe_in_flight = False
+
+
+async def call_with_resilience(
+    factory: Callable[[], Awaitable[T]],
+    breaker: Optional[CircuitBreaker] = None,
+    deadline: float = 30.0,
+    retries: int = 2,
+    base_delay: float = 0.5,
+    max_delay: float = 4.0,
+) -> T:
+    """
+    Вызов с общим дедлайном, повторами с full-jitter backoff и учётом в circuit breaker.
+    Дедлайн общий на все попытки - хвост латентности ограничен сверху.
+    """
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        probe = breaker is not None and breaker.state == "half_open"
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenError("LLM circuit is open")
+
+        remaining = deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            raise asyncio.TimeoutError("LLM deadline exceeded")
+        try:
+            result = await asyncio.wait_for(factory(), timeout=remaining)
+        except asyncio.CancelledError:
+            # отменённая проба (проигравшая спекуляция, остановка) не должна держать цепь закрытой навсегда
+            if probe:
+                breaker.release()
+            raise
+        except Exception as e:
+            if breaker is not None:
+                breaker.record_failure()
+            attempt += 1
+            remaining = deadline - (time.monotonic() - started)
+            if attempt > retries or remaining <= 0:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            print(f"LLM call failed ({e!r}), retry {attempt}/{retries} in {delay:.2f}s")
+            await asyncio.sleep(min(delay, remaining))
+            continue
+
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+# =========================
+# Локальные кандидаты (без LLM)
+# =========================
+
+FIRST_LINES = ["import sys", "import os", "def main():", "class Example:", "import random"]
+BLOCK_LINES = ["pass", "return None", "print('TODO')", "raise NotImplementedError"]
+FLAT_LINES = ["pass", "print('done')", "return None", "result = None"]
+
+
+def fallback_candidates(history: List[str], n: int = 4) -> List[str]:
+    """
+    Кандидаты из эвристик по истории, когда LLM недоступна:
+    после заголовка блока - тело с отступом, иначе - строки на текущем уровне + выход из блока.
+    """
+    lines = [l.replace("\t", "    ") for l in "\n".join(history).splitlines() if l.strip()]
+    if not lines:
+        return FIRST_LINES[:n]
+
+    last = lines[-1]
+    indent = len(last) - len(last.lstrip(" "))
+    if last.rstrip().endswith(":"):
+        pad = " " * (indent + 4)
+        return [pad + line for line in BLOCK_LINES][:n]
+
+    pad = " " * indent
+    candidates = [pad + line for line in FLAT_LINES if indent or line not in ("return None", "pass")]
+    if indent == 0:
+        candidates = ["def main():", "if __name__ == '__main__':"] + candidates
+    else:
+        # выход на уровень выше
+        candidates.append(" " * max(indent - 4, 0) + "return None")
+    uniq = []
+    for c in candidates:
+        if c not in uniq:
+            uniq.append(c)
+    return uniq[:n]
@@ -0,0 +1,147 @@
+import time
+import asyncio
+from typing import Optional
+
+import httpx
+import gigachat
+from gigachat.api import post_auth
+
+
+# настройки клиента gigachat, которые модели langchain передают в свой `_client`
+CLIENT_SETTINGS = (
+    "base_url", "auth_url", "credentials", "scope", "access_token", "model", "profanity_check",
+    "user", "password", "timeout", "ssl_context", "verify_ssl_certs", "ca_bundle_file",
+    "cert_file", "key_file", "key_file_password", "verbose", "flags",
+)
+
+
+# приватные поля gigachat.GigaChat (проверено на gigachat 0.1.x), которые берём у общего клиента
+SHARED_FIELDS = (
+    "_aclient", "_auth_aclient", "_async_token_lock",
+    "_client", "_auth_client", "_sync_token_lock",
+)
+
+
+class SharedGigaChat(gigachat.GigaChat):
+    """
+    Клиент одной модели: свои настройки (model, profanity_check, flags...) - как у `_client`
+    langchain, но пулы соединений, токен и его блокировки - общие из GigaChatRuntime.
+    """
+
+    def __init__(self, runtime: "GigaChatRuntime", **settings):
+        self._runtime = runtime
+        super().__init__(**settings)
+        # свои httpx-клиенты конструктор уже создал: без соединений, но закрыть их надо -
+        # это сделает GigaChatRuntime.close()
+        for name in SHARED_FIELDS:
+            runtime.discard(getattr(self, name))
+            setattr(self, name, getattr(runtime.client, name))
+
+    @property
+    def _access_token(self):
+        return self._runtime.client._access_token
+
+    @_access_token.setter
+    def _access_token(self, token) -> None:
+        self._runtime.client._access_token = token
+
+
+class GigaChatRuntime:
+    """
+    Один пул соединений и один токен на процесс для всех моделей (генератор, судья, эмбеддинги):
+    - общий keep-alive пул соединений (max_connections) - без TLS-рукопожатий на каждый опрос;
+    - у каждой модели свой лёгкий клиент (SharedGigaChat) с её model/base_url/scope -
+      запросы уходят в настроенную модель, а не в модель клиента по умолчанию;
+    - OAuth-токен берётся один раз при старте и обновляется в фоне заранее,
+      до истечения, а не лениво на запросе после 401.
+    """
+
+    def __init__(self, credentials: str, base_url: Optional[str] = None, scope: Optional[str] = None,
+                 max_connections: Optional[int] = None, refresh_margin: float = 300.0, timeout: float = 30.0):
+        self.client = gigachat.GigaChat(
+            credentials=credentials, base_url=base_url, scope=scope, verify_ssl_certs=False,
+            max_connections=max_connections, timeout=timeout)
+        self.refresh_margin = refresh_margin
+        self._task: Optional[asyncio.Task] = None
+        # httpx-клиенты, которые SharedGigaChat заменил общими
+        self._discarded: list = []
+        self.stats = {"refreshed": 0, "failed": 0}
+
+    def discard(self, client) -> None:
+        if isinstance(client, (httpx.Client, httpx.AsyncClient)):
+            self._discarded.append(client)
+
+    def client_for(self, llm) -> SharedGigaChat:
+        settings = {name: getattr(llm, name, None) for name in CLIENT_SETTINGS}
+        # у httpx-пула base_url один - модели ходят по адресу общего пула
+        settings["base_url"] = self.client._settings.base_url
+        settings["timeout"] = settings["timeout"] or self.client._settings.timeout
+        return SharedGigaChat(self, **settings)
+
+    def attach(self, *llms) -> None:
+        """Подменить ленивый `_client` (cached_property) моделей langchain на клиент с общим пулом."""
+        for llm in llms:
+            client = self.client_for(llm)
+            # модель в запросе берётся из настроек клиента: без неё gigachat молча подставит свою
+            if getattr(llm, "model", None) and client._settings.model != llm.model:
+                raise ValueError(f"{llm.__class__.__name__}: client model {client._settings.model} != {llm.model}")
+            llm.__dict__["_client"] = client
+
+    async def refresh_token(self) -> None:
+        client = self.client
+        if not client._settings.credentials:
+            # user/password или готовый access_token - обновляет сам клиент
+            await client.aget_token()
+            return None
+        token = await post_auth.asyncio(
+            client._auth_aclient,
+            url=client._settings.auth_url,
+            credentials=client._settings.credentials,
+            scope=client._settings.scope,
+        )
+        # подмена одним присваиванием: запросы в полёте дорабатывают со старым токеном
+        client._access_token = token
+        self.stats["refreshed"] += 1
+
+    def _seconds_left(self) -> float:
+        token = self.client._access_token
+        if token is None or not token.expires_at:
+            return 0.0
+        # expires_at - unix-время в миллисекундах
+        return token.expires_at / 1000 - time.time()
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(max(self._seconds_left() - self.refresh_margin, 1.0))
+            try:
+                await self.refresh_token()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                print("GigaChat token refresh failed:", repr(e))
+                await asyncio.sleep(10)
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return None
+        try:
+            await self.refresh_token()
+        except Exception as e:
+            # не блокируем старт бота: клиент получит токен сам на первом запросе
+            self.stats["failed"] += 1
+            print("GigaChat token prefetch failed:", repr(e))
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.client.aclose()
+        self.client.close()
+        for client in self._discarded:
+            if isinstance(client, httpx.AsyncClient):
+                await client.aclose()
+            else:
+                client.close()
+        self._discarded.clear()
@@ -0,0 +1,133 @@
+import re
+import codeop
+import keyword
+import warnings
+from typing import List, Optional
+
+
+MAX_LINE_LEN = 95
+IDENT_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def indent_of(line: str) -> int:
+    line = line.replace("\t", "    ")
+    return len(line) - len(line.lstrip(" "))
+
+
+def _compiles_as_prefix(code: str) -> Optional[bool]:
+    """
+    True - код корректен (возможно незавершён, например после "def f():"),
+    False - синтаксическая ошибка,
+    None - проверить не удалось.
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            codeop.compile_command(code, symbol="exec")
+        return True
+    except (SyntaxError, OverflowError, ValueError):
+        return False
+    except Exception:
+        return None
+
+
+def incremental_parse_ok(history: List[str], line: str) -> bool:
+    """
+    Проверка строки в контексте всей накопленной истории, а не отдельно.
+    Если сама история уже невалидна - проверяем строку как отдельный фрагмент.
+    """
+    lines = "\n".join(history).splitlines()
+    if lines and _compiles_as_prefix("\n".join(lines) + "\n") is True:
+        return _compiles_as_prefix("\n".join(lines + [line]) + "\n") is True
+    return _compiles_as_prefix(line.strip() + "\n") is True
+
+
+def brackets_balanced(line: str) -> bool:
+    """Строка сама закрывает свои скобки (без учёта строковых литералов)."""
+    pairs = {")": "(", "]": "[", "}": "{"}
+    stack = []
+    text = re.sub(r"(\"[^\"]*\"|'[^']*')", "", line.split("#", 1)[0])
+    for ch in text:
+        if ch in "([{":
+            stack.append(ch)
+        elif ch in pairs:
+            if not stack or stack.pop() != pairs[ch]:
+                return False
+    return not stack
+
+
+def indentation_score(history: List[str], line: str) -> float:
+    """Согласованность отступа с последней непустой строкой истории (0..1)."""
+    lines = [l for l in "\n".join(history).splitlines() if l.strip()]
+    cur = indent_of(line)
+    if cur % 4:
+        return 0.0
+    if not lines:
+        return 1.0 if cur == 0 else 0.0
+
+    last = lines[-1]
+    prev = indent_of(last)
+    if last.rstrip().endswith(":"):
+        # после заголовка блока ждём ровно +1 уровень
+        return 1.0 if cur == prev + 4 else 0.0
+    if cur == prev:
+        return 1.0
+    if cur < prev:
+        # выход из блока допустим, но чуть менее вероятен
+        return 0.7
+    return 0.0
+
+
+def length_score(line: str) -> float:
+    """Короткие содержательные строки лучше; длиннее лимита - ноль."""
+    size = len(line.strip())
+    if size == 0 or len(line) > MAX_LINE_LEN:
+        return 0.0
+    if size <= 60:
+        return 1.0
+    return 1.0 - (size - 60) / (MAX_LINE_LEN - 60)
+
+
+def identifiers(text: str) -> set[str]:
+    return {t for t in IDENT_RE.findall(text) if not keyword.iskeyword(t)}
+
+
+def overlap_score(history: List[str], line: str) -> float:
+    """Доля идентификаторов строки, уже объявленных/использованных в истории."""
+    own = identifiers(line)
+    if not own:
+        return 0.5
+    scope = identifiers("\n".join(history))
+    if not scope:
+        return 0.5
+    return len(own & scope) / len(own)
+
+
+def score_candidates(history: List[str], drafts: List[str]) -> dict[str, float]:
+    """
+    Детерминированная локальная оценка кандидатов по шкале 0..100 (как у судьи):
+    парсинг в контексте истории, отступы, длина, пересечение идентификаторов.
+    """
+    scores = {}
+    for d in drafts:
+        if not isinstance(d, str) or not d.strip():
+            continue
+        score = 0.0
+        if incremental_parse_ok(history, d) and brackets_balanced(d):
+            score += 45
+        score += 25 * indentation_score(history, d)
+        score += 10 * length_score(d)
+        score += 20 * overlap_score(history, d)
+        scores[d] = round(score, 2)
+    return scores
+
+
+def is_clear_separation(scores: dict[str, float], top: int = 4, margin: float = 15.0) -> bool:
+    """
+    Локальный рейтинг уже однозначно отделяет top-N:
+    кандидатов не больше N, либо N-й опережает (N+1)-й минимум на margin.
+    """
+    ranked = sorted(scores.values(), reverse=True)
+    if len(ranked) <= top:
+        return True
+    return ranked[top - 1] - ranked[top] >= margin
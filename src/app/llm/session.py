@@ -0,0 +1,54 @@
+from collections import deque
+from typing import Optional
+
+from gigachat.context import session_id_cvar
+
+
+def session_id_for(chat_id: int, history_version: int) -> str:
+    """Стабильный X-Session-ID: один на чат и версию истории (после /start - новая сессия)."""
+    return f"tg-{chat_id}-v{history_version}"
+
+
+def pin_session(chat_id: int, history_version: Optional[int]) -> Optional[str]:
+    """
+    Закрепить X-Session-ID за текущим контекстом (хэндлер -> граф -> вызовы GigaChat).
+    Запросы одной сессии провайдер может обслуживать из кэша общего префикса промпта.
+    """
+    if history_version is None:
+        return None
+    session_id = session_id_for(chat_id, history_version)
+    session_id_cvar.set(session_id)
+    return session_id
+
+
+class PromptCacheStats:
+    """Учёт precached_prompt_tokens: доля промпта, взятая провайдером из кэша, по каждому вызову."""
+
+    def __init__(self, keep_last: int = 200):
+        self.calls = deque(maxlen=keep_last)
+        self.prompt_tokens = 0
+        self.precached_tokens = 0
+
+    def record(self, message, mode: Optional[str] = None) -> Optional[float]:
+        usage = getattr(message, "usage_metadata", None)
+        if not usage or not usage.get("input_tokens"):
+            return None
+        input_tokens = usage["input_tokens"]
+        cached = (usage.get("input_token_details") or {}).get("cache_read", 0) or 0
+        ratio = cached / input_tokens
+        self.prompt_tokens += input_tokens
+        self.precached_tokens += cached
+        self.calls.append({
+            "session_id": session_id_cvar.get(),
+            "mode": mode,
+            "prompt_tokens": input_tokens,
+            "precached_prompt_tokens": cached,
+            "ratio": round(ratio, 3),
+        })
+        return ratio
+
+    @property
+    def ratio(self) -> float:
+        if not self.prompt_tokens:
+            return 0.0
+        return self.precached_tokens / self.prompt_tokens
@@ -0,0 +1,169 @@
+import time
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from app.llm.throttle import estimate_tokens
+
+
+def branch_key(history: str, line: str) -> str:
+    """Код, который получится, если победит строка line (как в DataManager.get_current_code)."""
+    return "\n".join(part for part in (history, line) if part)
+
+
+class SpeculationEngine:
+    """
+    Спекулятивная предгенерация вариантов следующего опроса.
+
+    Пока опрос открыт, для каждого варианта (или только для лидера по голосам)
+    в фоне считаются кандидаты следующей строки. Когда опрос закрывается,
+    ветка победителя сохраняется, остальные отменяются; /send_now забирает готовый результат.
+
+    generate(код) возвращает результат графа: варианты берутся из "final",
+    результат с "degraded" (эвристики без LLM) не отдаётся - /send_now генерирует заново.
+
+    Ограничения:
+    - max_concurrency - одновременных фоновых генераций на процесс;
+    - token_budget - оценка токенов на спекуляцию за скользящее окно budget_window сек.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[str], Awaitable[Dict[str, Any]]],
+        max_concurrency: int = 2,
+        token_budget: int = 50_000,
+        budget_window: float = 3600.0,
+        leader_only: bool = False,
+        tokens_per_call: int = 1500,
+    ):
+        self._generate = generate
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.token_budget = token_budget
+        self.budget_window = budget_window
+        self.leader_only = leader_only
+        # фиксированная добавка на промпт/ответ/судью поверх истории
+        self.tokens_per_call = tokens_per_call
+        self._spent: deque[tuple[float, int]] = deque()
+        # chat_id -> {branch_key: task}
+        self._branches: Dict[int, Dict[str, asyncio.Task]] = {}
+        # chat_id -> (history, options, {user_id: option_index})
+        self._polls: Dict[int, tuple[str, List[str], Dict[int, int]]] = {}
+        self.stats = {"scheduled": 0, "served": 0, "discarded": 0, "skipped_budget": 0, "degraded": 0}
+
+    # ----- бюджет -----
+
+    def _budget_left(self) -> int:
+        border = time.monotonic() - self.budget_window
+        while self._spent and self._spent[0][0] < border:
+            self._spent.popleft()
+        return self.token_budget - sum(tokens for _, tokens in self._spent)
+
+    def _reserve(self, tokens: int) -> bool:
+        if tokens > self._budget_left():
+            self.stats["skipped_budget"] += 1
+            return False
+        self._spent.append((time.monotonic(), tokens))
+        return True
+
+    # ----- ветки -----
+
+    async def _run(self, key: str) -> Dict[str, Any]:
+        async with self._semaphore:
+            return await self._generate(key)
+
+    def _spawn(self, chat_id: int, history: str, line: str) -> None:
+        key = branch_key(history, line)
+        branches = self._branches.setdefault(chat_id, {})
+        if key in branches:
+            return None
+        if not self._reserve(estimate_tokens(key) + self.tokens_per_call):
+            return None
+        task = asyncio.create_task(self._run(key))
+        # исключение заберёт take(); для отменённых/ненужных веток - просто гасим
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        branches[key] = task
+        self.stats["scheduled"] += 1
+
+    def _leader(self, chat_id: int) -> Optional[int]:
+        _, options, votes = self._polls.get(chat_id, ("", [], {}))
+        if not votes:
+            return None
+        counts: Dict[int, int] = {}
+        for idx in votes.values():
+            counts[idx] = counts.get(idx, 0) + 1
+        return max(counts, key=counts.get)
+
+    def schedule(self, chat_id: int, history: str, options: List[str]) -> None:
+        """Новый опрос отправлен: запускаем предгенерацию для его вариантов."""
+        self.discard(chat_id)
+        self._polls[chat_id] = (history, list(options), {})
+        if self.leader_only:
+            # лидера ещё нет - начинаем с первого варианта, дальше следуем за голосами
+            if options:
+                self._spawn(chat_id, history, options[0])
+            return None
+        for line in options:
+            self._spawn(chat_id, history, line)
+
+    def register_vote(self, chat_id: int, user_id: Optional[int], option_index: Optional[int]) -> None:
+        """Живые голоса: лидер получает свою ветку в первую очередь."""
+        poll = self._polls.get(chat_id)
+        if poll is None:
+            return None
+        history, options, votes = poll
+        if option_index is None:
+            votes.pop(user_id, None)
+        else:
+            votes[user_id] = option_index
+        leader = self._leader(chat_id)
+        if leader is not None and leader < len(options):
+            self._spawn(chat_id, history, options[leader])
+
+    def resolve(self, chat_id: int, winning_line: str) -> None:
+        """Опрос закрыт: оставляем ветку победителя, остальные отменяем."""
+        poll = self._polls.pop(chat_id, None)
+        if poll is None:
+            return None
+        history = poll[0]
+        self.discard(chat_id, keep=branch_key(history, winning_line))
+
+    async def take(self, chat_id: int, history: str) -> Optional[List[str]]:
+        """
+        Забрать готовые варианты для текущего кода чата.
+        Если ветка ещё считается - дожидаемся её (это всё равно быстрее, чем начинать заново).
+        """
+        task = self._branches.get(chat_id, {}).pop(history, None)
+        self.discard(chat_id)
+        self._polls.pop(chat_id, None)
+        if task is None:
+            return None
+        try:
+            result = await task
+        except asyncio.CancelledError:
+            current = asyncio.current_task()
+            if current is not None and current.cancelling():
+                # отменяют саму команду, а не ветку - отмену не глотаем
+                raise
+            print("speculation cancelled")
+            return None
+        except Exception as e:
+            print("speculation failed:", e)
+            return None
+        if result and result.get("degraded"):
+            # варианты из эвристик не выдаём за готовую генерацию
+            self.stats["degraded"] += 1
+            return None
+        options = result.get("final") if result else None
+        if options:
+            self.stats["served"] += 1
+        return options or None
+
+    def discard(self, chat_id: int, keep: Optional[str] = None) -> None:
+        branches = self._branches.pop(chat_id, {})
+        for key, task in branches.items():
+            if key == keep:
+                self._branches[chat_id] = {key: task}
+                continue
+            if not task.done():
+                task.cancel()
+            self.stats["discarded"] += 1
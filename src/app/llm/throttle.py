@@ -0,0 +1,170 @@
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# (chat_id, priority) текущего запроса; ставится в хэндлере перед вызовом графа
+llm_request_ctx: ContextVar[Tuple[Optional[int], bool]] = ContextVar("llm_request_ctx", default=(None, False))
+
+
+def set_request_context(chat_id: Optional[int], priority: bool = False) -> None:
+    llm_request_ctx.set((chat_id, priority))
+
+
+def lower_priority() -> None:
+    """Фоновая работа (спекуляция и т.п.) от имени того же чата, но без приоритета админа."""
+    chat_id, _ = llm_request_ctx.get()
+    llm_request_ctx.set((chat_id, False))
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка токенов без похода в /tokens/count (~3 символа на токен для кода/кириллицы)."""
+    return len(text) // 3 + 1
+
+
+def usage_tokens(result) -> Optional[int]:
+    """Фактический расход токенов из ответа langchain (AIMessage или LLMResult), если есть."""
+    usage = getattr(result, "usage_metadata", None)
+    if usage:
+        return usage.get("total_tokens")
+    llm_output = getattr(result, "llm_output", None) or {}
+    token_usage = llm_output.get("token_usage") or {}
+    if isinstance(token_usage, dict):
+        return token_usage.get("total_tokens")
+    return getattr(token_usage, "total_tokens", None)
+
+
+class LLMScheduler:
+    """
+    Глобальный планировщик вызовов LLM на процесс.
+
+    - не больше max_in_flight одновременных запросов к провайдеру;
+    - token bucket на tokens_per_minute (0 - без лимита), списываем оценку до вызова,
+      после вызова корректируем на фактический usage;
+    - очереди по чатам, слоты раздаются по кругу (round-robin), чтобы один шумный чат
+      не вытеснял остальные;
+    - запросы с priority=True (команды админов) обслуживаются раньше фоновых.
+    """
+
+    def __init__(self, max_in_flight: int = 8, tokens_per_minute: int = 0):
+        self.max_in_flight = max_in_flight
+        self.tokens_per_minute = tokens_per_minute
+        self._tokens = float(tokens_per_minute)
+        self._refilled_at = time.monotonic()
+        self._in_flight = 0
+        self._queues: Dict[Tuple[Optional[int], bool], Deque[Tuple[asyncio.Future, int]]] = {}
+        self._rr: Dict[bool, Deque[Optional[int]]] = {True: deque(), False: deque()}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.stats = {"granted": 0, "waited": 0, "throttled": 0}
+
+    # ----- token bucket -----
+
+    def _refill(self) -> None:
+        if not self.tokens_per_minute:
+            return None
+        now = time.monotonic()
+        rate = self.tokens_per_minute / 60.0
+        self._tokens = min(float(self.tokens_per_minute), self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    def _wait_for_tokens(self, tokens: int) -> float:
+        if not self.tokens_per_minute:
+            return 0.0
+        # запрос больше всего ведра всё равно пропускаем, когда ведро полное
+        need = min(tokens, self.tokens_per_minute) - self._tokens
+        if need <= 0:
+            return 0.0
+        return need / (self.tokens_per_minute / 60.0)
+
+    # ----- очередь -----
+
+    def _dispatch(self) -> None:
+        self._timer = None
+        self._refill()
+        while self._in_flight < self.max_in_flight:
+            picked = self._peek()
+            if picked is None:
+                return None
+            priority, chat_id = picked
+            fut, tokens = self._queues[(chat_id, priority)][0]
+            if not fut.done():
+                wait = self._wait_for_tokens(tokens)
+                if wait > 0:
+                    self.stats["throttled"] += 1
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                    return None
+
+            self._queues[(chat_id, priority)].popleft()
+            self._rr[priority].popleft()
+            if self._queues[(chat_id, priority)]:
+                # у чата есть ещё запросы - в конец круга
+                self._rr[priority].append(chat_id)
+            else:
+                del self._queues[(chat_id, priority)]
+
+            if fut.done():
+                # ожидающий отменён
+                continue
+            if self.tokens_per_minute:
+                self._tokens -= tokens
+            self._in_flight += 1
+            self.stats["granted"] += 1
+            fut.set_result(None)
+
+    def _peek(self) -> Optional[Tuple[bool, Optional[int]]]:
+        for priority in (True, False):
+            if self._rr[priority]:
+                return priority, self._rr[priority][0]
+        return None
+
+    async def acquire(self, tokens: int, chat_id: Optional[int] = None, priority: bool = False) -> None:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        key = (chat_id, priority)
+        if key not in self._queues:
+            self._queues[key] = deque()
+            self._rr[priority].append(chat_id)
+        self._queues[key].append((fut, tokens))
+        if self._timer is None:
+            self._dispatch()
+        if not fut.done():
+            self.stats["waited"] += 1
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # слот уже выдан, но ждущий ушёл - возвращаем
+                self.release()
+            raise
+
+    def release(self, estimated: int = 0, actual: Optional[int] = None) -> None:
+        self._in_flight -= 1
+        if self.tokens_per_minute and actual is not None:
+            self._refill()
+            self._tokens -= actual - estimated
+        if self._timer is None:
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, tokens: int):
+        chat_id, priority = llm_request_ctx.get()
+        await self.acquire(tokens, chat_id=chat_id, priority=priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run(self, factory: Callable[[], Awaitable[T]], tokens: int) -> T:
+        chat_id, priority = llm_request_ctx.get()
+        await self.acquire(tokens, chat_id=chat_id, priority=priority)
+        actual = None
+        try:
+            result = await factory()
+            actual = usage_tokens(result)
+            return result
+        finally:
+            self.release(estimated=tokens, actual=actual)
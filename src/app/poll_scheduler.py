@@ -0,0 +1,153 @@
+import heapq
+import asyncio
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.db.uow import UoWFactory
+
+
+OnDue = Callable[[int, str], Awaitable[None]]
+
+
+class PollScheduler:
+    """
+    Автоматическое закрытие опросов по Polls.timeout_at.
+
+    - у чата не больше одного таймера (chat_id -> срок, tg_poll_id), все сроки - в одной куче,
+      одна задача спит до ближайшего; старые записи кучи (опрос перепланирован или отменён)
+      отбрасываются при извлечении;
+    - наступившие сроки разбирают max_concurrency воркеров - тысячи чатов не дают тысяч задач;
+    - на старте таймеры загружаются из активных опросов в БД (рестарт их не теряет),
+      просроченные за время простоя срабатывают сразу;
+    - состояние (ближайший запуск, число таймеров, счётчики) периодически пишется в
+      SchedulerState - его показывает /health.
+    """
+
+    def __init__(self, uow: UoWFactory, poll_timeout: float = 0.0, max_concurrency: int = 4,
+                 state_interval: float = 30.0, retry_delay: float = 60.0, name: str = "main"):
+        self.uow = uow
+        self.poll_timeout = poll_timeout
+        self.max_concurrency = max_concurrency
+        self.state_interval = state_interval
+        self.retry_delay = retry_delay
+        self.name = name
+        self._heap: List[Tuple[float, int, str]] = []
+        self._timers: Dict[int, Tuple[float, str]] = {}
+        self._due: asyncio.Queue = asyncio.Queue()
+        self._wake = asyncio.Event()
+        self._on_due: Optional[OnDue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running = 0
+        self._started_at: Optional[datetime] = None
+        self.stats = {"fired": 0, "failed": 0}
+
+    def deadline(self) -> Optional[datetime]:
+        """timeout_at для нового опроса; None - опросы без срока (poll_timeout = 0)."""
+        if self.poll_timeout <= 0:
+            return None
+        return datetime.now() + timedelta(seconds=self.poll_timeout)
+
+    def schedule(self, chat_id: int, tg_poll_id: str, timeout_at: Optional[datetime]) -> None:
+        if timeout_at is None:
+            return None
+        due_at = timeout_at.timestamp()
+        self._timers[chat_id] = (due_at, tg_poll_id)
+        heapq.heappush(self._heap, (due_at, chat_id, tg_poll_id))
+        if self._heap[0][0] == due_at:
+            # новый срок раньше того, до которого спит цикл
+            self._wake.set()
+
+    def cancel(self, chat_id: int) -> None:
+        self._timers.pop(chat_id, None)
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    async def start(self, on_due: OnDue, owns: Optional[Callable[[int], bool]] = None) -> None:
+        """
+        on_due(chat_id, tg_poll_id) - срок опроса вышел; owns(chat_id) - таймеры каких чатов
+        грузить из БД (воркер в многопроцессном режиме берёт только свои).
+        """
+        self._on_due = on_due
+        self._started_at = datetime.now()
+        async with self.uow(read_only=True) as uow:
+            polls = await uow.polls.get_scheduled_polls()
+        for chat_id, tg_poll_id, timeout_at in polls:
+            if owns is None or owns(chat_id):
+                # по возрастанию срока: у чата остаётся последний опрос
+                self.schedule(chat_id, tg_poll_id, timeout_at)
+        await self._save_state()
+        self._tasks.append(asyncio.create_task(self._run()))
+        self._tasks.extend(asyncio.create_task(self._worker()) for _ in range(self.max_concurrency))
+
+    def _pop_due(self, now: float) -> None:
+        while self._heap and self._heap[0][0] <= now:
+            due_at, chat_id, tg_poll_id = heapq.heappop(self._heap)
+            if self._timers.get(chat_id) != (due_at, tg_poll_id):
+                continue
+            del self._timers[chat_id]
+            self._due.put_nowait((chat_id, tg_poll_id))
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        save_at = loop.time() + self.state_interval
+        while True:
+            # отменённые таймеры на вершине кучи не должны будить цикл
+            while self._heap and self._timers.get(self._heap[0][1]) != (self._heap[0][0], self._heap[0][2]):
+                heapq.heappop(self._heap)
+            timeout = save_at - loop.time()
+            if self._heap:
+                timeout = min(timeout, self._heap[0][0] - datetime.now().timestamp())
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+            self._pop_due(datetime.now().timestamp())
+            if loop.time() >= save_at:
+                save_at = loop.time() + self.state_interval
+                await self._save_state()
+
+    async def _worker(self) -> None:
+        while True:
+            chat_id, tg_poll_id = await self._due.get()
+            self._running += 1
+            try:
+                await self._on_due(chat_id, tg_poll_id)
+                self.stats["fired"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"poll scheduler: chat {chat_id} failed:", repr(e))
+                # опрос остался открытым - повторим позже, если его не перепланировали
+                if chat_id not in self._timers:
+                    self.schedule(chat_id, tg_poll_id, datetime.now() + timedelta(seconds=self.retry_delay))
+            finally:
+                self._running -= 1
+
+    def _next_run_at(self) -> datetime:
+        due_at = min((due_at for due_at, _ in self._timers.values()), default=None)
+        if due_at is None:
+            return datetime.now() + timedelta(seconds=self.state_interval)
+        return datetime.fromtimestamp(due_at)
+
+    async def _save_state(self) -> None:
+        jobs = {
+            "timers": len(self._timers),
+            "due": self._due.qsize(),
+            "running": self._running,
+            **self.stats,
+        }
+        try:
+            async with self.uow() as uow:
+                await uow.scheduler.save_state(
+                    self.name, self._next_run_at(), jobs, uptime_started_at=self._started_at)
+        except Exception as e:
+            print("poll scheduler: state not saved:", repr(e))
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        if self._on_due is not None:
+            await self._save_state()
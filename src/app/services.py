@@ -13,19 +13,23 @@ async def cmd_health(uow_factory: UoWFactory, chat_id: int) -> str:
     - наличие активного опроса в этом чате
     """
     async with uow_factory() as uow:
-        scheduler = await uow.scheduler.get_state()
+        # по строке на планировщик процесса (main или worker-N)
+        states = await uow.scheduler.get_states()
 
         chat = await uow.chats.get_or_create_chat(chat_id)
         active_poll = await uow.polls.get_active_poll_for_chat(chat_id)
 
-    uptime_sec = int((datetime.now() - scheduler.uptime_started_at).total_seconds())
-    next_run = scheduler.next_run_at.strftime("%H:%M:%S")
-
-    msg = [
-        f"🟢 Бот работает {uptime_sec} сек.",
-        f"Следующий запуск планировщика в {next_run}.",
-        f"Активные задания: {scheduler.active_jobs}",
-    ]
+    if states:
+        uptime_sec = int((datetime.now() - min(s.uptime_started_at for s in states)).total_seconds())
+        next_run = min(s.next_run_at for s in states).strftime("%H:%M:%S")
+        active_jobs = {s.name: s.active_jobs for s in states}
+        msg = [
+            f"🟢 Бот работает {uptime_sec} сек.",
+            f"Следующий запуск планировщика в {next_run}.",
+            f"Активные задания: {active_jobs}",
+        ]
+    else:
+        msg = ["🟢 Бот работает, планировщик ещё не сохранял состояние."]
 
     if active_poll:
         msg.append("⚠ В этом чате есть активный опрос.")
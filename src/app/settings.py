@@ -11,6 +11,7 @@ from pydantic_settings import (
 
 dot_env_path = Path(Path(__file__).parents[2], ".env").resolve()
 db_path = str(Path(Path(__file__).parents[2], "sqlite.db").resolve())
+llm_cache_db_path = str(Path(Path(__file__).parents[2], "llm_cache.db").resolve())
 
 
 class AppCTXSettings(BaseSettings):
@@ -21,11 +22,100 @@ class AppCTXSettings(BaseSettings):
     # fields:
     TG_BOT_TOKEN: str = ""
     TG_BOT_ADMINS: int | str | list[int] = Field(default_factory=list, description="Comma-separated list of admin user IDs or list of ints.")
+    TG_ADMINS_CACHE_TTL: float = Field(default=600.0, description="Seconds a group's admin list is trusted before get_administrators() is called again.")
+    # типы апдейтов, которые бот получает (и в polling, и в webhook); chat_member - для кэша админов
+    TG_ALLOWED_UPDATES: list[str] = Field(default_factory=lambda: ["message", "poll", "poll_answer", "my_chat_member", "chat_member"])
+    # webhook вместо long polling: aiohttp-сервер, Telegram шлёт апдейты на TG_WEBHOOK_URL + TG_WEBHOOK_PATH
+    TG_WEBHOOK_ENABLED: bool = False
+    TG_WEBHOOK_URL: str = Field(default="", description="Public base URL Telegram can reach, e.g. https://bot.example.com:8443")
+    TG_WEBHOOK_PATH: str = "/webhook"
+    TG_WEBHOOK_SECRET: str = Field(default="", description="Checked against the X-Telegram-Bot-Api-Secret-Token header.")
+    TG_WEBHOOK_HOST: str = "0.0.0.0"
+    TG_WEBHOOK_PORT: int = Field(default=8443, description="Telegram accepts ports 443, 80, 88 and 8443.")
+    TG_WEBHOOK_CERT: str = Field(default="", description="PEM certificate; uploaded to Telegram (self-signed is fine) and used for TLS with TG_WEBHOOK_KEY.")
+    TG_WEBHOOK_KEY: str = Field(default="", description="PEM private key for TLS. Empty - TLS is terminated by a reverse proxy.")
+    TG_WEBHOOK_MAX_CONNECTIONS: int = 40
+    # несколько процессов-воркеров: фронт раздаёт апдейты по chat_id, 1 - всё в одном процессе
+    BOT_WORKERS: int = Field(default=1, description="Worker processes; with SQLite every worker is a separate writer, prefer PostgreSQL.")
     DB_CONNECTION_STRING: str = db_path
-    DB_PREFIX: str = "sqlite+aiosqlite:///"
+    DB_PREFIX: str = Field(default="sqlite+aiosqlite:///", description='"postgresql+asyncpg://" with DB_CONNECTION_STRING = "user:password@host:5432/dbname".')
+    DB_POOL_SIZE: int = Field(default=10, description="Connection pool size for PostgreSQL.")
+    # профиль SQLite: PRAGMA на каждое подключение, один писатель + пул читателей
+    DB_READ_POOL_SIZE: int = Field(default=8, description="Read-only connections for SQLite (writes use a single connection).")
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = Field(default="NORMAL", description="NORMAL is durable enough with WAL and much faster than FULL.")
+    SQLITE_MMAP_SIZE: int = Field(default=256 * 1024 * 1024, description="Bytes of the DB file mapped into memory.")
+    SQLITE_CACHE_SIZE: int = Field(default=-64000, description="Page cache; negative value is in KiB.")
+    SQLITE_BUSY_TIMEOUT: int = Field(default=5000, description="Milliseconds to wait for a lock before 'database is locked'.")
+    # кэш чатов и опросов в памяти процесса (снимки строк, сброс при записи через репозитории)
+    DB_IDENTITY_CACHE_SIZE: int = 10_000
+    DB_IDENTITY_CACHE_TTL: float = Field(default=300.0, description="Seconds; bounds staleness when several bot processes share the DB.")
     LLM_MODEL: str
     LLM_AUTHORIZATION_KEY: str
     LLM_API_BASE_URL: str
+    # рантайм: граф без debug-трассировки, общий пул соединений GigaChat, токен обновляется заранее
+    LLM_GRAPH_DEBUG: bool = False
+    LLM_MAX_CONNECTIONS: int = Field(default=16, description="Keep-alive connection pool size shared by all GigaChat models.")
+    LLM_TOKEN_REFRESH_MARGIN: float = Field(default=300.0, description="Refresh the OAuth token this many seconds before it expires.")
+    # чекпоинты графа в БД бота: переживают рестарт, чистятся по history_version;
+    # по умолчанию выключены: каждый шаг графа пишет строки в GraphCheckpoints/GraphBlobs/GraphWrites
+    LLM_CHECKPOINT_ENABLED: bool = False
+    LLM_CHECKPOINT_KEEP_LAST: int = Field(default=10, description="Checkpoints kept per chat thread within the current history_version.")
+    # кэш ответов LLM
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_SIZE: int = 1024
+    LLM_CACHE_DB_PATH: str = Field(default=llm_cache_db_path, description="Path to SQLite file for persistent LLM cache tier. Empty string - memory only.")
+    LLM_CACHE_TTL: dict[str, int] = Field(
+        default_factory=lambda: {"zero": 24 * 3600, "next": 3600, "evaluate": 3600, "complete": 600},
+        description="TTL in seconds per mode (zero / next / evaluate / complete). 0 - do not cache.")
+    # сколько альтернатив просить в одном запросе генерации (n); 0 (по умолчанию) - старый режим с JSON-списком,
+    # n > 0 (например, 6) - платных completion-токенов больше в n раз на вызов
+    LLM_ALTERNATIVES: int = 0
+    # устойчивость вызовов GigaChat
+    LLM_DEADLINES: dict[str, float] = Field(
+        default_factory=lambda: {"default": 30, "zero": 20, "next": 20, "evaluate": 15, "complete": 60, "embeddings": 5},
+        description="Total deadline in seconds per mode, including retries.")
+    LLM_RETRIES: int = 2
+    LLM_BREAKER_THRESHOLD: int = 5
+    LLM_BREAKER_RESET_TIMEOUT: float = 30.0
+    # планировщик вызовов LLM
+    LLM_MAX_IN_FLIGHT: int = 8
+    LLM_TOKENS_PER_MINUTE: int = Field(default=0, description="Token bucket size/rate. 0 - no limit.")
+    LLM_TOKEN_COUNT_VIA_API: bool = Field(default=False, description="Use /tokens/count instead of local estimation.")
+    # сжатие истории в NEXT/EVALUATION промптах
+    LLM_HISTORY_TOKEN_BUDGET: int = 1500
+    LLM_HISTORY_KEEP_LAST: int = 20
+    # локальный пре-скоринг кандидатов перед вызовом судьи
+    LLM_LOCAL_SCORING: bool = True
+    LLM_LOCAL_SCORE_MARGIN: float = 15.0
+    # параллельная генерация: по одному вызову генератора на каждую температуру
+    LLM_PARALLEL_TEMPERATURES: list[float] = Field(default_factory=list, description="e.g. [0.4, 0.7, 1.0]. Empty - serial generate -> evaluate.")
+    # разнообразие вариантов опроса: отсев почти-дубликатов (токены, затем эмбеддинги для спорных пар)
+    LLM_DIVERSITY_ENABLED: bool = True
+    LLM_DIVERSITY_DUP_THRESHOLD: float = Field(default=0.8, description="Token-shingle Jaccard at/above which candidates are duplicates.")
+    LLM_DIVERSITY_AMBIGUOUS_THRESHOLD: float = Field(default=0.5, description="Jaccard from this value up to the dup threshold is checked with embeddings.")
+    LLM_EMBEDDINGS_ENABLED: bool = Field(default=False, description="Check ambiguous pairs with the Embeddings API (extra paid calls). Off - token Jaccard only.")
+    LLM_EMBEDDINGS_MODEL: str = "Embeddings"
+    LLM_EMBEDDINGS_DUP_THRESHOLD: float = Field(default=0.92, description="Cosine similarity at/above which ambiguous candidates are duplicates.")
+    LLM_EMBEDDINGS_CACHE_SIZE: int = 4096
+    # потоковый /code_completed: правим одно сообщение не чаще раза в STREAM_EDIT_INTERVAL сек.
+    LLM_STREAM_COMPLETE: bool = True
+    STREAM_EDIT_INTERVAL: float = 1.0
+    # спекулятивная предгенерация следующего опроса, пока текущий открыт; по умолчанию выключена:
+    # каждый опрос запускает до 4 фоновых прогонов генерация+судья (LEADER_ONLY - один, за лидером)
+    SPECULATION_ENABLED: bool = False
+    SPECULATION_MAX_CONCURRENCY: int = 2
+    SPECULATION_TOKEN_BUDGET: int = Field(default=50_000, description="Estimated tokens per SPECULATION_BUDGET_WINDOW seconds.")
+    SPECULATION_BUDGET_WINDOW: float = 3600.0
+    SPECULATION_LEADER_ONLY: bool = Field(default=False, description="Pre-generate only for the current leader by live votes.")
+    # очередь голосов: poll_answer копятся в памяти и пишутся пачкой upsert'ом
+    VOTE_FLUSH_INTERVAL: float = Field(default=0.5, description="Seconds between batched vote writes.")
+    VOTE_FLUSH_BATCH: int = Field(default=500, description="Pending votes that trigger an immediate write.")
+    # планировщик опросов: по Polls.timeout_at опрос закрывается и уходит следующий, как по /send_now
+    POLL_TIMEOUT: float = Field(default=0.0, description="Seconds a poll stays open; 0 (default) - polls advance only by /send_now.")
+    SCHEDULER_MAX_CONCURRENCY: int = Field(default=4, description="Expired polls advanced at once (each runs the LLM for the next poll).")
+    SCHEDULER_STATE_INTERVAL: float = Field(default=30.0, description="Seconds between SchedulerState writes shown by /health.")
+    SCHEDULER_RETRY_DELAY: float = Field(default=60.0, description="Seconds before retrying a poll whose advance failed.")
 
 
     @field_validator('TG_BOT_ADMINS', mode='after')
@@ -45,4 +135,15 @@ class AppCTXSettings(BaseSettings):
         
         return result
 
+    @property
+    def sqlite_pragmas(self) -> dict:
+        return {
+            "journal_mode": self.SQLITE_JOURNAL_MODE,
+            "synchronous": self.SQLITE_SYNCHRONOUS,
+            "mmap_size": self.SQLITE_MMAP_SIZE,
+            "cache_size": self.SQLITE_CACHE_SIZE,
+            "busy_timeout": self.SQLITE_BUSY_TIMEOUT,
+        }
+
+
 appctx = AppCTXSettings()
\ No newline at end of file
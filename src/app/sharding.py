@@ -0,0 +1,225 @@
+"""
+Многопроцессный режим: фронт принимает апдейты (polling или webhook) и раздаёт их
+N воркерам по chat_id. У каждого воркера свой Dispatcher, свои кэши (DataManager,
+IdentityCache, AdminCache, очередь голосов) и свой бюджет LLM - чат всегда
+обрабатывается одним и тем же процессом.
+
+poll / poll_answer не содержат чата - фронт находит его по tg_poll_id (кэш + БД).
+"""
+import json
+import asyncio
+import multiprocessing
+from functools import partial
+from typing import Awaitable, Callable, List, Optional
+
+from aiohttp import web
+from aiogram import Bot
+
+
+CHAT_UPDATE_KEYS = ("message", "edited_message", "my_chat_member", "chat_member", "callback_query")
+
+LookupPollChat = Callable[[str], Awaitable[Optional[int]]]
+
+
+def shard_of(chat_id: int, workers: int) -> int:
+    # % в Python неотрицателен и для отрицательных id групп
+    return chat_id % workers
+
+
+def chat_id_of(update: dict) -> Optional[int]:
+    for key in CHAT_UPDATE_KEYS:
+        event = update.get(key)
+        if not event:
+            continue
+        chat = event.get("chat") or (event.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return None
+
+
+def poll_id_of(update: dict) -> Optional[str]:
+    if update.get("poll"):
+        return update["poll"]["id"]
+    if update.get("poll_answer"):
+        return update["poll_answer"]["poll_id"]
+    return None
+
+
+class ShardRouter:
+    """
+    Фронт: процессы-воркеры и их очереди (multiprocessing, spawn).
+    Апдейт уходит в очередь воркера сырой JSON-строкой - разбор в модели aiogram
+    выполняет уже воркер, на своём ядре.
+    """
+
+    def __init__(self, workers: int, lookup_poll_chat: LookupPollChat,
+                 poll_lookup_retries: int = 5, poll_lookup_delay: float = 0.2, watch_interval: float = 5.0):
+        self.workers = workers
+        self.lookup_poll_chat = lookup_poll_chat
+        self.poll_lookup_retries = poll_lookup_retries
+        self.poll_lookup_delay = poll_lookup_delay
+        self.watch_interval = watch_interval
+        self._ctx = multiprocessing.get_context("spawn")
+        self._queues: List[multiprocessing.Queue] = []
+        self._processes: List[multiprocessing.Process] = []
+        self._tasks: set[asyncio.Task] = set()
+        self._watcher: Optional[asyncio.Task] = None
+        self.stats = {"routed": 0, "polls_unresolved": 0, "failed": 0, "restarts": 0}
+
+    def _spawn(self, index: int) -> multiprocessing.Process:
+        process = self._ctx.Process(target=worker_main, args=(index, self._queues[index]),
+                                    name=f"bot-worker-{index}", daemon=True)
+        process.start()
+        return process
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            self._queues.append(self._ctx.Queue())
+            self._processes.append(self._spawn(index))
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def _watch(self) -> None:
+        """
+        Упавший воркер перезапускается на той же очереди: put в неё проходит и без читателя,
+        без перезапуска апдейты 1/N чатов молча копились бы в никуда. Интервал проверки
+        ограничивает частоту перезапусков, если воркер падает сразу на старте.
+        """
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            for index, process in enumerate(self._processes):
+                if process.is_alive():
+                    continue
+                print(f"worker {index} died (exit code {process.exitcode}), restarting")
+                self.stats["restarts"] += 1
+                self._processes[index] = self._spawn(index)
+
+    def _send(self, shard: int, raw: str) -> None:
+        self.stats["routed"] += 1
+        self._queues[shard].put(raw)
+
+    async def _lookup_poll_chat(self, tg_poll_id: str) -> Optional[int]:
+        try:
+            return await self.lookup_poll_chat(tg_poll_id)
+        except Exception as e:
+            # ошибка БД - как не найденный опрос: попробуем ещё раз в _route_poll
+            print("poll lookup failed:", repr(e))
+            return None
+
+    async def _route_poll(self, tg_poll_id: str, raw: str) -> None:
+        # голос может прийти раньше, чем воркер сохранил опрос после answer_poll - немного ждём
+        for attempt in range(self.poll_lookup_retries):
+            chat_id = await self._lookup_poll_chat(tg_poll_id)
+            if chat_id is not None:
+                self._send(shard_of(chat_id, self.workers), raw)
+                return None
+            await asyncio.sleep(self.poll_lookup_delay)
+        # не наш опрос - обработчики воркера его просто проигнорируют
+        self.stats["polls_unresolved"] += 1
+        self._send(0, raw)
+
+    async def route(self, raw: str) -> None:
+        update = json.loads(raw)
+        chat_id = chat_id_of(update)
+        if chat_id is not None:
+            self._send(shard_of(chat_id, self.workers), raw)
+            return None
+        tg_poll_id = poll_id_of(update)
+        if tg_poll_id is None:
+            self._send(0, raw)
+            return None
+        chat_id = await self._lookup_poll_chat(tg_poll_id)
+        if chat_id is not None:
+            self._send(shard_of(chat_id, self.workers), raw)
+            return None
+        task = asyncio.create_task(self._route_poll(tg_poll_id, raw))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def route_safely(self, raw: str) -> None:
+        """Ошибка одного апдейта (битый JSON, БД при поиске опроса) не останавливает фронт."""
+        try:
+            await self.route(raw)
+        except Exception as e:
+            self.stats["failed"] += 1
+            print("update not routed:", repr(e))
+
+    async def run_polling(self, bot: Bot, allowed_updates: list[str], polling_timeout: int = 15) -> None:
+        await bot.delete_webhook()
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=polling_timeout, allowed_updates=allowed_updates)
+            except Exception as e:
+                print("get_updates failed:", repr(e))
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                await self.route_safely(update.model_dump_json(exclude_unset=True))
+
+    def webhook_app(self, path: str, secret: str = "") -> web.Application:
+        async def handle(request: web.Request) -> web.Response:
+            if secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+                return web.Response(status=401)
+            await self.route_safely(await request.text())
+            return web.Response()
+
+        app = web.Application()
+        app.router.add_post(path, handle)
+        return app
+
+    async def close(self, timeout: float = 30.0) -> None:
+        if self._watcher is not None:
+            # остановленные воркеры не перезапускаем
+            self._watcher.cancel()
+            self._watcher = None
+        for queue in self._queues:
+            # None - сигнал воркеру: дописать очереди и выйти
+            queue.put(None)
+        loop = asyncio.get_running_loop()
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                process.terminate()
+
+
+def worker_main(index: int, queue) -> None:
+    asyncio.run(_worker(index, queue))
+
+
+async def _worker(index: int, queue) -> None:
+    # обработчики и всё их состояние создаются при импорте - уже в процессе воркера
+    from aiogram import Dispatcher
+    from aiogram.types import Update
+    from app.settings import appctx
+    from app.handlers import router, llm_generator, data_manager, db_engine, db_read_engine, poll_scheduler, advance_poll
+
+    bot = Bot(token=appctx.TG_BOT_TOKEN)
+    dp = Dispatcher()
+    dp.include_router(router)
+    await llm_generator.start()
+    # таймеры опросов - только чатов этого воркера, состояние для /health - под своим именем
+    poll_scheduler.name = f"worker-{index}"
+    await poll_scheduler.start(partial(advance_poll, bot), owns=lambda chat_id: shard_of(chat_id, appctx.BOT_WORKERS) == index)
+    loop = asyncio.get_running_loop()
+    tasks: set[asyncio.Task] = set()
+    print(f"worker {index} started")
+    try:
+        while True:
+            raw = await loop.run_in_executor(None, queue.get)
+            if raw is None:
+                break
+            update = Update.model_validate_json(raw, context={"bot": bot})
+            task = asyncio.create_task(dp.feed_update(bot, update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await poll_scheduler.close()
+        await data_manager.close()
+        await llm_generator.close()
+        await db_engine.dispose()
+        if db_read_engine is not None:
+            await db_read_engine.dispose()
+        await bot.session.close()
@@ -1,16 +1,28 @@
+import time
+from typing import AsyncIterator
+
 from app.enums import RolesEnum
 from aiogram.types import BufferedInputFile
 
+TG_MESSAGE_LIMIT = 4096
+
 
-async def get_user_role(user_id: int, event, admin_ids = None) -> RolesEnum:
+async def get_user_role(user_id: int, event, admin_ids = None, admin_cache = None) -> RolesEnum:
     # print("User ID:", user_id)
     if not admin_ids or not isinstance(admin_ids, list) and all([isinstance(adm, int) for adm in admin_ids]):
         admin_ids = []
     if user_id in admin_ids:
         return RolesEnum.ADMIN
     if event.chat and event.chat.type != "private":
-        chat_admins = await event.chat.get_administrators()
-        admin_ids = [admin.user.id for admin in chat_admins]
+        async def fetch_admins():
+            chat_admins = await event.chat.get_administrators()
+            return [admin.user.id for admin in chat_admins]
+
+        if admin_cache is not None:
+            # список админов группы из кэша (AdminCache), Telegram - только по истечении ttl
+            admin_ids = await admin_cache.get_admins(event.chat.id, fetch_admins)
+        else:
+            admin_ids = await fetch_admins()
         # print("Chat admins:", admin_ids)
         if user_id in admin_ids:
             return RolesEnum.GROUP_ADMIN
@@ -28,4 +40,40 @@ async def send_py_from_memory(message, code_text: str):
 
 
 def to_markdown(code_text: str):
-    return f"```\n{code_text}\n```"
\ No newline at end of file
+    return f"```\n{code_text}\n```"
+
+
+async def stream_to_message(message, chunks: AsyncIterator[str], interval: float = 1.0,
+                            placeholder: str = "⏳") -> str:
+    """
+    Показывает потоковый ответ в одном сообщении: отправляем заглушку и правим её
+    по мере прихода кусков: первый непустой кусок - сразу, дальше не чаще раза в interval
+    секунд (лимиты Telegram на edit). Возвращает полный текст.
+    """
+    sent = await message.answer(placeholder)
+    text = ""
+    shown = ""
+    # 0 - первая правка без ожидания interval
+    last_edit = 0.0
+
+    async def edit(body: str):
+        nonlocal shown, last_edit
+        # в сообщение влезает только хвост; полный код всё равно уйдёт файлом
+        limit = TG_MESSAGE_LIMIT - 10
+        if len(body) > limit:
+            body = body[-limit:]
+        if body.strip() and body != shown:
+            try:
+                await sent.edit_text(to_markdown(body), parse_mode="Markdown")
+            except Exception as e:
+                print(e)
+            shown = body
+            last_edit = time.monotonic()
+
+    async for chunk in chunks:
+        text += chunk
+        if time.monotonic() - last_edit >= interval:
+            await edit(text)
+
+    await edit(text)
+    return text
@@ -0,0 +1,159 @@
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.db.uow import UoWFactory
+
+
+class VoteQueue:
+    """
+    Write-behind приём голосов из poll_answer.
+
+    - голос сразу попадает в память: (poll_id, user_id) -> вариант, повторные голоса
+      одного пользователя до сброса схлопываются в один (None - голос отозван);
+    - tg_poll_id -> (poll_id, chat_id) кэшируется: опросы этого процесса известны с
+      регистрации, чужие (после рестарта) ищутся в БД один раз; голоса за уже закрытый опрос
+      (запоздавший poll_answer) не принимаются;
+    - сброс в БД пачкой по таймеру (flush_interval) или по размеру (flush_batch):
+      один INSERT ... ON CONFLICT на все голоса и удаление отозванных; options.votes не
+      пересчитываются - их считает по poll_votes finalize_poll при закрытии опроса
+      (с голосами, принятыми другими процессами бота);
+    - неудачный сброс возвращает пачку в очередь и ставит повтор по таймеру.
+    """
+
+    def __init__(self, uow: UoWFactory, flush_interval: float = 0.5, flush_batch: int = 500):
+        self.uow = uow
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        # (poll_id, user_id) -> (option_index | None, answered_at), ещё не записанные
+        self._pending: Dict[Tuple[int, int], Tuple[Optional[int], datetime]] = {}
+        # голоса без user_id не схлопываются - пишутся как есть
+        self._anonymous: List[Tuple[int, int]] = []
+        self._polls: Dict[str, Tuple[int, int]] = {}
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.Task] = None
+        self._tasks: set[asyncio.Task] = set()
+        self.stats = {"received": 0, "ignored": 0, "written": 0, "flushes": 0, "failed": 0}
+
+    def track(self, tg_poll_id: str, poll_id: int, chat_id: int) -> None:
+        """Новый опрос этого процесса: в БД его искать не нужно."""
+        self._polls[tg_poll_id] = (poll_id, chat_id)
+
+    def forget(self, tg_poll_id: str) -> None:
+        self._polls.pop(tg_poll_id, None)
+
+    async def _resolve(self, tg_poll_id: str) -> Optional[Tuple[int, int]]:
+        poll = self._polls.get(tg_poll_id)
+        if poll is not None:
+            return poll
+        async with self.uow(read_only=True) as uow:
+            poll_dbt = await uow.polls.get_poll_ref(tg_poll_id=tg_poll_id)
+        if not poll_dbt or poll_dbt.status != "active":
+            # опрос закрыт (или отклонён /start) - запоздавший голос итог не меняет
+            return None
+        return self._polls.setdefault(tg_poll_id, (poll_dbt.id, poll_dbt.chat_id))
+
+    async def submit(self, tg_poll_id: str, user_id: Optional[int], option_index: Optional[int]) -> Optional[int]:
+        """Принять голос. Возвращает chat_id опроса (или None, если опрос не наш)."""
+        poll = await self._resolve(tg_poll_id)
+        if poll is None:
+            self.stats["ignored"] += 1
+            return None
+        poll_id, chat_id = poll
+        now = datetime.now()
+        self.stats["received"] += 1
+
+        if user_id:
+            self._pending[(poll_id, user_id)] = (option_index, now)
+        elif option_index is not None:
+            self._anonymous.append((poll_id, option_index))
+
+        if len(self._pending) + len(self._anonymous) >= self.flush_batch:
+            task = asyncio.create_task(self._flush_quietly())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            self._schedule_flush()
+        return chat_id
+
+    def _schedule_flush(self) -> None:
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_quietly(self) -> None:
+        try:
+            await self.flush()
+        except Exception as e:
+            print("vote flush failed:", repr(e))
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        # таймер отработал: неудачный сброс ниже должен суметь поставить новый
+        self._timer = None
+        await self._flush_quietly()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            if not self._pending and not self._anonymous:
+                return None
+            pending, self._pending = self._pending, {}
+            anonymous, self._anonymous = self._anonymous, []
+
+            try:
+                async with self.uow() as uow:
+                    # статус проверяем в той же транзакции: опрос могли закрыть после приёма голоса
+                    # (в т.ч. другой процесс) - такие голоса опоздали и итог не меняют
+                    polls = {key[0] for key in pending} | {poll_id for poll_id, _ in anonymous}
+                    active = await uow.polls.get_active_poll_ids(polls)
+                    closed = polls - active
+                    if closed:
+                        self._forget_polls(closed)
+                        ignored = len(pending) + len(anonymous)
+                        pending = {key: value for key, value in pending.items() if key[0] in active}
+                        anonymous = [vote for vote in anonymous if vote[0] in active]
+                        self.stats["ignored"] += ignored - len(pending) - len(anonymous)
+
+                    upserts, retracted = [], {}
+                    for (poll_id, user_id), (option_index, answered_at) in pending.items():
+                        if option_index is None:
+                            retracted.setdefault(poll_id, []).append(user_id)
+                            continue
+                        upserts.append({
+                            "poll_id": poll_id, "user_id": user_id,
+                            "option_index": option_index, "answered_at": answered_at})
+                    await uow.polls.upsert_votes(upserts)
+                    for poll_id, user_ids in retracted.items():
+                        await uow.polls.delete_votes(poll_id, user_ids)
+                    for poll_id, option_index in anonymous:
+                        await uow.polls.add_or_update_vote(poll_id, None, option_index)
+            except Exception:
+                self._requeue(pending, anonymous)
+                raise
+            self.stats["flushes"] += 1
+            self.stats["written"] += len(pending) + len(anonymous)
+
+    def _forget_polls(self, poll_ids: set[int]) -> None:
+        # следующие голоса за эти опросы пойдут через БД и будут отброшены в _resolve
+        for tg_poll_id in [k for k, v in self._polls.items() if v[0] in poll_ids]:
+            del self._polls[tg_poll_id]
+
+    def _requeue(self, pending: dict, anonymous: list) -> None:
+        # пачку возвращаем в очередь; более свежие голоса тех же пользователей не затираем
+        for key, value in pending.items():
+            self._pending.setdefault(key, value)
+        self._anonymous[:0] = anonymous
+        self.stats["failed"] += 1
+        # без повтора пачка ждала бы следующего голоса
+        self._schedule_flush()
+
+    async def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        try:
+            await self.flush()
+        finally:
+            # повтор, поставленный неудачным сбросом, после остановки уже не выполнится
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
@@ -1,17 +1,29 @@
+import ssl
 import asyncio
+from functools import partial
+from aiohttp import web
 from aiogram import Bot, Dispatcher
-from aiogram.types import BotCommand
+from aiogram.types import BotCommand, FSInputFile
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 # ---
-from app.handlers import router
+from app.handlers import router, llm_generator, data_manager, db_engine, db_read_engine, poll_scheduler, advance_poll
 
 from app.settings import appctx
 from app.db.utils import create_all
-from app.db.base import get_async_engine
+from app.sharding import ShardRouter
 
 
 async def on_startup(bot: Bot):
     # TODO Заменить
-    await create_all(get_async_engine(url=appctx.DB_PREFIX + appctx.DB_CONNECTION_STRING))
+    await create_all(db_engine)
+    # токен GigaChat - до первого опроса, дальше обновляется в фоне
+    await llm_generator.start()
+    await set_commands(bot)
+    # таймеры открытых опросов - из БД, просроченные за время простоя закроются сразу
+    await poll_scheduler.start(partial(advance_poll, bot))
+
+
+async def set_commands(bot: Bot):
     # добавление стартовой команды
     await bot.set_my_commands((
         BotCommand(command="start", description="Начать работу/рестарт"),
@@ -20,15 +32,109 @@ async def on_startup(bot: Bot):
         BotCommand(command="code_completed", description="Создать код из результатов")))
 
 
+async def run_polling(bot: Bot, dp: Dispatcher):
+    # getUpdates не работает, пока у бота установлен webhook
+    await bot.delete_webhook()
+    await dp.start_polling(bot, polling_timeout=15, allowed_updates=appctx.TG_ALLOWED_UPDATES)
+
+
+async def set_webhook(bot: Bot):
+    await bot.set_webhook(
+        url=appctx.TG_WEBHOOK_URL.rstrip("/") + appctx.TG_WEBHOOK_PATH,
+        certificate=FSInputFile(appctx.TG_WEBHOOK_CERT) if appctx.TG_WEBHOOK_CERT else None,
+        secret_token=appctx.TG_WEBHOOK_SECRET or None,
+        allowed_updates=appctx.TG_ALLOWED_UPDATES,
+        max_connections=appctx.TG_WEBHOOK_MAX_CONNECTIONS,
+    )
+    print(f"Webhook: {appctx.TG_WEBHOOK_HOST}:{appctx.TG_WEBHOOK_PORT}{appctx.TG_WEBHOOK_PATH}")
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    """
+    Апдейты приходят POST-запросами от Telegram на TG_WEBHOOK_URL + TG_WEBHOOK_PATH.
+    Ответ 200 уходит сразу, апдейт обрабатывается в фоне (handle_in_background).
+    Если заданы TG_WEBHOOK_CERT/TG_WEBHOOK_KEY - TLS поднимает сам бот, сертификат
+    (в т.ч. самоподписанный, см. webhook_harness.py) загружается в Telegram.
+    """
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dp, bot=bot,
+        secret_token=appctx.TG_WEBHOOK_SECRET or None,
+    ).register(app, path=appctx.TG_WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+
+    ssl_context = None
+    if appctx.TG_WEBHOOK_CERT and appctx.TG_WEBHOOK_KEY:
+        ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        ssl_context.load_cert_chain(appctx.TG_WEBHOOK_CERT, appctx.TG_WEBHOOK_KEY)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=appctx.TG_WEBHOOK_HOST, port=appctx.TG_WEBHOOK_PORT, ssl_context=ssl_context)
+    await site.start()
+    try:
+        await set_webhook(bot)
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def lookup_poll_chat(tg_poll_id: str):
+    poll = await data_manager.get_poll_by_tg_poll_id(tg_poll_id=tg_poll_id)
+    return poll.chat_id if poll else None
+
+
+async def run_sharded(bot: Bot):
+    """Фронт без обработчиков: апдейты по chat_id - в BOT_WORKERS процессов-воркеров."""
+    await create_all(db_engine)
+    await set_commands(bot)
+    shards = ShardRouter(workers=appctx.BOT_WORKERS, lookup_poll_chat=lookup_poll_chat)
+    shards.start()
+    try:
+        if appctx.TG_WEBHOOK_ENABLED:
+            ssl_context = None
+            if appctx.TG_WEBHOOK_CERT and appctx.TG_WEBHOOK_KEY:
+                ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+                ssl_context.load_cert_chain(appctx.TG_WEBHOOK_CERT, appctx.TG_WEBHOOK_KEY)
+            runner = web.AppRunner(shards.webhook_app(appctx.TG_WEBHOOK_PATH, appctx.TG_WEBHOOK_SECRET))
+            await runner.setup()
+            await web.TCPSite(runner, host=appctx.TG_WEBHOOK_HOST, port=appctx.TG_WEBHOOK_PORT, ssl_context=ssl_context).start()
+            try:
+                await set_webhook(bot)
+                await asyncio.Event().wait()
+            finally:
+                await runner.cleanup()
+        else:
+            await shards.run_polling(bot, allowed_updates=appctx.TG_ALLOWED_UPDATES)
+    finally:
+        await shards.close()
+        await bot.session.close()
+        await db_engine.dispose()
+        if db_read_engine is not None:
+            await db_read_engine.dispose()
+
+
 async def main():
     bot = Bot(token=appctx.TG_BOT_TOKEN)
+    if appctx.BOT_WORKERS > 1:
+        return await run_sharded(bot)
     await on_startup(bot)
     
     dp = Dispatcher()
     dp.include_router(router)
-    await dp.start_polling(bot, polling_timeout=15, 
-                        #    allowed_updates=["message"]
-                           )
+    try:
+        if appctx.TG_WEBHOOK_ENABLED:
+            await run_webhook(bot, dp)
+        else:
+            await run_polling(bot, dp)
+    finally:
+        await poll_scheduler.close()
+        # голоса из очереди - в БД до выхода
+        await data_manager.close()
+        await llm_generator.close()
+        await db_engine.dispose()
+        if db_read_engine is not None:
+            await db_read_engine.dispose()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,218 @@
+"""
+Офлайн-прогрев кэша ответов LLM через пакетный режим GigaChat (/batches + /files).
+
+Берём самые частые префиксы кода из code_lines, собираем те же промпты генерации,
+что и бот в онлайне, отправляем одной пакетной задачей, дожидаемся результата
+и складываем ответы в SQLite-уровень LLMResponseCache (LLM_CACHE_DB_PATH).
+Бот в пиковое время берёт ответ из кэша вместо живого вызова.
+
+Запуск (из src/):
+    python warmup.py --top 200
+    python warmup.py --dry-run batch.jsonl     # только собрать jsonl
+    python warmup.py --batch-id <id>           # дождаться уже отправленной задачи
+
+Ключ кэша совпадает с онлайн-путём для температуры модели по умолчанию;
+прогоны с LLM_PARALLEL_TEMPERATURES (другая температура) этот кэш не используют.
+"""
+import json
+import asyncio
+import argparse
+from collections import Counter
+from typing import List, Optional
+
+import httpx
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+
+from app.settings import appctx
+from app.enums import AgentInputModes
+from app.db.base import get_async_engine
+from app.db.uow import UoWFactory
+from app.llm.llm import LLMGenerator, LLMModelEnum, is_json_list
+
+
+def popular_prefixes(histories: List[List[str]], top: int, min_count: int = 1) -> List[List[str]]:
+    """
+    Префиксы, перед которыми бот генерировал варианты (в т.ч. пустой - первая строка),
+    по убыванию частоты среди всех историй.
+    """
+    counter = Counter()
+    for history in histories:
+        for k in range(len(history) + 1):
+            counter[tuple(history[:k])] += 1
+    return [list(prefix) for prefix, count in counter.most_common(top) if count >= min_count]
+
+
+def build_tasks(generator: LLMGenerator, prefixes: List[List[str]]) -> List[dict]:
+    """
+    Строки jsonl для /batches?method=chat_completions.
+    id задачи = "<mode>:<ключ кэша>" - результат раскладывается в кэш без отдельного состояния,
+    поэтому ожидание можно продолжить после перезапуска (--batch-id).
+    """
+    llm = generator.llm[LLMModelEnum.generator]
+    n = generator.alternatives
+    tasks, seen = [], set()
+    for prefix in prefixes:
+        mode = AgentInputModes.NEXT.value if prefix else AgentInputModes.ZERO.value
+        prompt = generator.draft_prompt(prefix, mode, single=bool(n))
+        key = generator.alternatives_cache_key(prompt, n) if n else generator.cache_key(prompt)
+        if key in seen:
+            # сжатие истории могло свести разные префиксы к одному промпту
+            continue
+        seen.add(key)
+        request = {
+            "model": llm.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": llm.temperature,
+            "top_p": llm.top_p,
+        }
+        if n:
+            request["n"] = n
+        tasks.append({"id": f"{mode}:{key}", "request": request})
+    return tasks
+
+
+def extract_texts(item: dict) -> List[str]:
+    """Тексты альтернатив из строки результата пакетной задачи."""
+    result = item.get("result") or item.get("response") or item
+    if not isinstance(result, dict):
+        return []
+    if isinstance(result.get("body"), dict):
+        result = result["body"]
+    choices = result.get("choices") or []
+    return [(c.get("message") or {}).get("content", "") for c in choices]
+
+
+class BatchClient:
+    """Тонкий клиент /batches и /files: токен берём (и обновляем) у клиента gigachat."""
+
+    def __init__(self, generator: LLMGenerator):
+        self._gigachat = generator.llm[LLMModelEnum.generator]._client
+        self.base_url = self._gigachat._settings.base_url.rstrip("/")
+        self._http = httpx.AsyncClient(verify=False, timeout=60)
+
+    async def _request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        # задача может идти часами - токен (30 мин.) запрашиваем перед каждым вызовом
+        token = await self._gigachat.aget_token()
+        headers = {"Authorization": f"Bearer {token.access_token}", **kwargs.pop("headers", {})}
+        response = await self._http.request(method, self.base_url + path, headers=headers, **kwargs)
+        response.raise_for_status()
+        return response
+
+    async def submit(self, tasks: List[dict]) -> dict:
+        body = "\n".join(json.dumps(t, ensure_ascii=False) for t in tasks).encode("utf-8")
+        response = await self._request(
+            "POST", "/batches", params={"method": "chat_completions"}, content=body,
+            headers={"Content-Type": "application/octet-stream"})
+        return response.json()
+
+    async def status(self, batch_id: str) -> Optional[dict]:
+        response = await self._request("GET", "/batches", params={"batch_id": batch_id})
+        data = response.json()
+        batches = data.get("batches", [data]) if isinstance(data, dict) else data
+        return next((b for b in batches if b.get("id") == batch_id), None)
+
+    async def wait(self, batch_id: str, poll_interval: float, timeout: float) -> dict:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        while True:
+            batch = await self.status(batch_id)
+            if batch is None:
+                raise RuntimeError(f"Batch {batch_id} not found")
+            print(f"batch {batch_id}: {batch.get('status')} {batch.get('request_counts')}")
+            if batch.get("status") == "completed":
+                return batch
+            if loop.time() - started > timeout:
+                raise TimeoutError(f"Batch {batch_id} is still {batch.get('status')}")
+            await asyncio.sleep(poll_interval)
+
+    async def download(self, file_id: str) -> str:
+        response = await self._request("GET", f"/files/{file_id}/content")
+        return response.text
+
+    async def close(self):
+        await self._http.aclose()
+
+
+async def load_results(generator: LLMGenerator, content: str, ttl: Optional[int]) -> Counter:
+    """Ответы пакетной задачи -> кэш (тот же формат значения, что пишет онлайн-путь)."""
+    stats = Counter()
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+            mode, key = item["id"].split(":", 1)
+        except Exception:
+            stats["broken"] += 1
+            continue
+        texts = [t for t in extract_texts(item) if t]
+        if not texts:
+            stats["failed"] += 1
+            continue
+        if generator.alternatives:
+            value = json.dumps(texts, ensure_ascii=False)
+        elif is_json_list(texts[0]):
+            value = texts[0]
+        else:
+            stats["invalid"] += 1
+            continue
+        await generator.cache.set(key, value, mode=mode, ttl=ttl)
+        stats["cached"] += 1
+    return stats
+
+
+async def main(args):
+    generator = LLMGenerator(app_config=appctx)
+    if generator.cache is None or not generator.cache.db_path:
+        print("LLM cache (SQLite) is disabled: set LLM_CACHE_ENABLED and LLM_CACHE_DB_PATH")
+        return None
+
+    client = BatchClient(generator)
+    try:
+        batch_id = args.batch_id
+        if batch_id is None:
+            engine = get_async_engine(url=appctx.DB_PREFIX + appctx.DB_CONNECTION_STRING)
+            uow_factory = UoWFactory(session_factory=async_sessionmaker(
+                bind=engine, class_=AsyncSession, expire_on_commit=False))
+            async with uow_factory() as uow:
+                histories = await uow.code.get_all_histories()
+            await engine.dispose()
+
+            prefixes = popular_prefixes(histories, top=args.top, min_count=args.min_count)
+            tasks = build_tasks(generator, prefixes)
+            print(f"histories: {len(histories)}, prefixes: {len(prefixes)}, tasks: {len(tasks)}")
+            if args.dry_run:
+                with open(args.dry_run, "w", encoding="utf-8") as f:
+                    f.writelines(json.dumps(t, ensure_ascii=False) + "\n" for t in tasks)
+                print(f"saved to {args.dry_run}")
+                return None
+            if not tasks:
+                return None
+
+            batch = await client.submit(tasks)
+            batch_id = batch["id"]
+            print(f"submitted batch {batch_id} (resume: python warmup.py --batch-id {batch_id})")
+
+        batch = await client.wait(batch_id, poll_interval=args.poll_interval, timeout=args.timeout)
+        content = await client.download(batch["output_file_id"])
+        stats = await load_results(generator, content, ttl=args.ttl)
+        print("loaded:", dict(stats))
+    finally:
+        await client.close()
+        await generator.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Прогрев кэша LLM через пакетный режим GigaChat")
+    parser.add_argument("--top", type=int, default=100, help="сколько самых частых префиксов кода взять")
+    parser.add_argument("--min-count", type=int, default=2, help="минимальная частота префикса")
+    parser.add_argument("--ttl", type=int, default=7 * 24 * 3600, help="TTL записей кэша, сек.")
+    parser.add_argument("--poll-interval", type=float, default=60.0, help="период опроса статуса, сек.")
+    parser.add_argument("--timeout", type=float, default=24 * 3600.0, help="сколько ждать задачу, сек.")
+    parser.add_argument("--batch-id", default=None, help="не отправлять новую задачу, дождаться этой")
+    parser.add_argument("--dry-run", default=None, metavar="PATH", help="только записать jsonl в файл")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
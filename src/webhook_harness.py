@@ -0,0 +1,107 @@
+"""
+Локальная проверка webhook-режима без публичного домена.
+
+1. самоподписанный сертификат (openssl) для TG_WEBHOOK_CERT / TG_WEBHOOK_KEY:
+    python webhook_harness.py cert --cn 127.0.0.1 --out certs/
+2. бот с TG_WEBHOOK_ENABLED=true, TG_WEBHOOK_CERT/KEY из шага 1 (python main.py);
+3. фейковый апдейт Telegram на локальный сервер - с заголовком секрета, без проверки сертификата:
+    python webhook_harness.py send --url https://127.0.0.1:8443/webhook --chat-id -100123 --text /code
+    python webhook_harness.py send ... --count 500 --concurrency 50   # нагрузка: задержка ответа
+
+Настоящий Telegram принимает тот же сертификат: main.py загружает его в set_webhook.
+"""
+import ssl
+import time
+import asyncio
+import argparse
+import subprocess
+from pathlib import Path
+
+import aiohttp
+
+from app.settings import appctx
+
+
+def make_cert(cn: str, out: Path, days: int) -> tuple[Path, Path]:
+    out.mkdir(parents=True, exist_ok=True)
+    cert, key = out / "webhook.pem", out / "webhook.key"
+    san = f"IP:{cn}" if cn.replace(".", "").isdigit() else f"DNS:{cn}"
+    subprocess.run([
+        "openssl", "req", "-newkey", "rsa:2048", "-sha256", "-nodes", "-x509",
+        "-days", str(days), "-keyout", str(key), "-out", str(cert),
+        "-subj", f"/CN={cn}", "-addext", f"subjectAltName={san}",
+    ], check=True)
+    return cert, key
+
+
+def fake_update(update_id: int, chat_id: int, user_id: int, text: str) -> dict:
+    """Минимальный Update с текстовым сообщением - как его присылает Telegram."""
+    chat = {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup", "title": "webhook harness"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": chat,
+            "from": {"id": user_id, "is_bot": False, "first_name": "harness"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else [],
+        },
+    }
+
+
+async def send(args) -> None:
+    ssl_context = ssl.create_default_context()
+    # сертификат самоподписанный - проверяем сервер бота, а не цепочку доверия
+    ssl_context.check_hostname = False
+    ssl_context.verify_mode = ssl.CERT_NONE
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret} if args.secret else {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, statuses = [], {}
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=ssl_context)) as session:
+        async def one(i: int):
+            async with semaphore:
+                started = time.monotonic()
+                update = fake_update(int(time.time() * 1000) % 10**9 + i, args.chat_id, args.user_id, args.text)
+                async with session.post(args.url, json=update, headers=headers) as response:
+                    await response.read()
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+                latencies.append(time.monotonic() - started)
+
+        await asyncio.gather(*(one(i) for i in range(args.count)))
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"statuses: {statuses}")
+    print(f"latency p50: {p50 * 1000:.1f} ms, p99: {p99 * 1000:.1f} ms")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Самоподписанный сертификат и фейковые апдейты для webhook-режима")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    cert = sub.add_parser("cert", help="сгенерировать самоподписанный сертификат")
+    cert.add_argument("--cn", default="127.0.0.1", help="IP или домен, по которому Telegram/harness обращается к боту")
+    cert.add_argument("--out", type=Path, default=Path("certs"))
+    cert.add_argument("--days", type=int, default=365)
+
+    post = sub.add_parser("send", help="отправить фейковый апдейт на локальный webhook")
+    post.add_argument("--url", default=f"https://127.0.0.1:{appctx.TG_WEBHOOK_PORT}{appctx.TG_WEBHOOK_PATH}")
+    post.add_argument("--secret", default=appctx.TG_WEBHOOK_SECRET)
+    post.add_argument("--chat-id", type=int, required=True)
+    post.add_argument("--user-id", type=int, default=1)
+    post.add_argument("--text", default="/code")
+    post.add_argument("--count", type=int, default=1)
+    post.add_argument("--concurrency", type=int, default=10)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "cert":
+        cert, key = make_cert(args.cn, args.out, args.days)
+        print(f"TG_WEBHOOK_CERT = \"{cert.resolve()}\"\nTG_WEBHOOK_KEY = \"{key.resolve()}\"")
+    else:
+        asyncio.run(send(args))
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.crud import DataManager
+from app.db.base import get_async_engines
+from app.db.uow import UoWFactory
+from app.db.utils import create_all
+
+
+class FinishPollTest(unittest.IsolatedAsyncioTestCase):
+    """Закрытие опроса (/send_now, /code_completed, таймер) с голосами, ещё лежащими в очереди."""
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        url = "sqlite+aiosqlite:///" + os.path.join(self.tmp.name, "bot.db")
+        self.engine, self.read_engine = get_async_engines(url, sqlite_pragmas={"journal_mode": "WAL"})
+        await create_all(self.engine)
+        uow = UoWFactory(
+            session_factory=async_sessionmaker(bind=self.engine, expire_on_commit=False, class_=AsyncSession),
+            read_session_factory=async_sessionmaker(bind=self.read_engine, expire_on_commit=False, class_=AsyncSession))
+        # интервал больше теста - голоса сами в БД не уйдут
+        self.data_manager = DataManager(uow=uow, vote_flush_interval=60.0)
+
+    async def asyncTearDown(self):
+        await self.data_manager.close()
+        await self.engine.dispose()
+        await self.read_engine.dispose()
+        self.tmp.cleanup()
+
+    async def test_queued_votes_counted_on_close(self):
+        await self.data_manager.clear_chat_history(chat_id=-1)
+        await self.data_manager.register_poll(tg_poll_id="p", chat_id=-1, message_id=1, options=["a", "b", "c"])
+        for user_id in range(5):
+            await self.data_manager.register_poll_answer(tg_poll_id="p", user_id=user_id, option_index=2)
+
+        # порядок finish_last_poll: статус closed, затем подсчёт
+        poll = await self.data_manager.close_poll("p")
+        winner = await self.data_manager.finishing_poll_process(tg_poll_id="p")
+
+        self.assertIsNotNone(poll)
+        self.assertEqual((winner.index, winner.votes), (2, 5))
+        self.assertEqual(self.data_manager.votes.stats["ignored"], 0)
+        self.assertEqual(self.data_manager.votes.stats["written"], 5)
+
+
+if __name__ == "__main__":
+    unittest.main()